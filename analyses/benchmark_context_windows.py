@@ -0,0 +1,109 @@
+"""
+Benchmark context-window extraction on long Adverse Reactions sections.
+
+Compares the original approach (re-splitting the label prefix and suffix for
+every match) against the shared per-text WordOffsets index used by
+``generate_example`` and ``stringsearch._build_bert_string``. Checks that both
+produce identical strings, then reports the timings.
+
+Annotated adverse event terms serve as the search vocabulary, so no MedDRA
+download is required.
+
+Usage:
+    uv run python analyses/benchmark_context_windows.py
+"""
+
+import json
+import time
+from pathlib import Path
+
+from ahocorasick import Automaton
+
+from onsides.construct_training_data import generate_example, get_method_config
+from onsides.word_offsets import WordOffsets
+
+ANNOTATION_DIR = Path("database/annotations")
+N_LONGEST = 20
+NWORDS = 125
+METHOD = 14
+
+
+def _split_example(text: str, term: str, start: int, length: int) -> str:
+    """The pre-WordOffsets implementation of generate_example (method 14)."""
+    config = get_method_config(METHOD)
+    term_nwords = len(term.split())
+    size_before = max(int((NWORDS - 2 * term_nwords) * config.prop_before), 1)
+    size_after = max(int((NWORDS - 2 * term_nwords) * (1 - config.prop_before)), 1)
+    parts = [f"{term} exact"]
+    parts.extend(text[:start].split()[-size_before:])
+    parts.append("EVENT")
+    parts.extend(text[start + length:].split()[:size_after])
+    return " ".join(parts)
+
+
+def _load_sections() -> tuple[list[str], list[str]]:
+    """Return the longest AR section texts and all annotated event terms."""
+    texts = []
+    terms = set()
+    for filename in [
+        "demner-fushman-train-labels.json",
+        "demner-fushman-test-labels.json",
+    ]:
+        with open(ANNOTATION_DIR / filename) as f:
+            for entry in json.load(f):
+                if entry.get("section_name", "").lower() != "adverse reactions":
+                    continue
+                texts.append(" ".join(entry["section_text"].split()).lower())
+                terms.update(e[0].lower() for e in entry["adverse_events"] if e[0])
+    texts.sort(key=len, reverse=True)
+    return texts[:N_LONGEST], sorted(terms)
+
+
+def main() -> None:
+    texts, terms = _load_sections()
+    automaton = Automaton()
+    for term in terms:
+        automaton.add_word(term, term)
+    automaton.make_automaton()
+
+    matches = [
+        [(end - len(term) + 1, term) for end, term in automaton.iter(text)]
+        for text in texts
+    ]
+    n_matches = sum(len(m) for m in matches)
+    n_words = sum(len(t.split()) for t in texts)
+    print(
+        f"{len(texts)} longest AR sections: {n_words} words, "
+        f"{n_matches} matches over {len(terms)} terms"
+    )
+
+    config = get_method_config(METHOD)
+
+    t0 = time.perf_counter()
+    split_results = [
+        _split_example(text, term, start, len(term))
+        for text, text_matches in zip(texts, matches)
+        for start, term in text_matches
+    ]
+    split_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    offset_results = []
+    for text, text_matches in zip(texts, matches):
+        offsets = WordOffsets(text)
+        for start, term in text_matches:
+            offset_results.append(generate_example(
+                text, term, start, len(term), NWORDS, config, "exact", offsets,
+            ))
+    offset_time = time.perf_counter() - t0
+
+    if split_results != offset_results:
+        raise AssertionError("WordOffsets output differs from str.split output")
+
+    print(f"  str.split per match:  {split_time:8.3f}s")
+    print(f"  shared WordOffsets:   {offset_time:8.3f}s")
+    print(f"  speedup:              {split_time / offset_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+backends.py
+
+Serialized-graph inference backends for ClinicalBertClassifier.
+
+A trained ``bestepoch-*.pth`` can be exported to TorchScript and/or ONNX.
+``load_backend`` returns a module that `clinicalbert.evaluate` can run in
+place of the eager model, so ``predict(backend=...)`` picks the runtime
+without changing the rest of the pipeline:
+
+- ``eager``: the HF model in PyTorch, as trained.
+- ``torchscript``: a traced graph run by the TorchScript interpreter.
+- ``onnxruntime``: an ONNX graph run by onnxruntime on the CPU execution
+  provider (requires the ``onnx`` extra).
+
+Exports are written next to the weights (``{stem}.torchscript.pt`` /
+``{stem}.onnx``) and regenerated when the weights are newer.
+
+Usage:
+    onsides-export-model \\
+        --weights models/bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth \\
+        --format torchscript onnx
+"""
+
+import argparse
+import logging
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+import torch
+from torch import nn
+
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.vocab_cache import atomic_write
+
+logger = logging.getLogger(__name__)
+
+Backend = Literal["eager", "torchscript", "onnxruntime"]
+BACKENDS: tuple[str, ...] = ("eager", "torchscript", "onnxruntime")
+
+_EXPORT_SUFFIXES = {
+    "torchscript": ".torchscript.pt",
+    "onnxruntime": ".onnx",
+}
+
+ONNX_OPSET = 17
+
+
+def export_path(weights_path: Path, backend: str) -> Path:
+    """Where the serialized graph for `weights_path` is written."""
+    weights_path = Path(weights_path)
+    return weights_path.with_name(weights_path.stem + _EXPORT_SUFFIXES[backend])
+
+
+def export_torchscript(
+    model: ClinicalBertClassifier, path: Path, max_length: int
+) -> Path:
+    """Trace `model` and save it as TorchScript.
+
+    Batch size and sequence length stay dynamic in the traced graph.
+    """
+    model.eval()
+    input_ids, mask = _example_inputs(max_length)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, (input_ids, mask), check_trace=False)
+    # Unique temp name: inference workers may export the same model at once
+    atomic_write(path, lambda f: torch.jit.save(traced, f))
+    logger.info(f"Exported TorchScript model to {path}")
+    return path
+
+
+def export_onnx(model: ClinicalBertClassifier, path: Path, max_length: int) -> Path:
+    """Export `model` to ONNX with dynamic batch and sequence axes."""
+    model.eval()
+    input_ids, mask = _example_inputs(max_length)
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "sequence"},
+        "logits": {0: "batch"},
+    }
+    with torch.no_grad():
+        atomic_write(path, lambda f: torch.onnx.export(
+            model,
+            (input_ids, mask),
+            f,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        ))
+    logger.info(f"Exported ONNX model to {path}")
+    return path
+
+
+class OnnxRuntimeModule(nn.Module):
+    """Runs an exported ONNX graph with the `ClinicalBertClassifier` call API."""
+
+    def __init__(self, onnx_path: Path):
+        super().__init__()
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "The onnxruntime backend requires the 'onnx' extra: "
+                "uv sync --extra onnx"
+            ) from e
+        self.session = onnxruntime.InferenceSession(
+            str(onnx_path), providers=["CPUExecutionProvider"]
+        )
+
+    def forward(self, input_id: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+        (logits,) = self.session.run(None, {
+            "input_ids": input_id.cpu().numpy().astype(np.int64),
+            "attention_mask": mask.cpu().numpy().astype(np.int64),
+        })
+        return torch.from_numpy(logits)
+
+
+def load_backend(
+    model: ClinicalBertClassifier,
+    weights_path: Path,
+    backend: Backend,
+    max_length: int,
+) -> nn.Module:
+    """Return a module running `model` (loaded from `weights_path`) on `backend`.
+
+    Exports the graph first if it is missing or older than the weights.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}. Expected one of {BACKENDS}")
+    if backend == "eager":
+        return model
+
+    path = export_path(weights_path, backend)
+    if not path.exists() or path.stat().st_mtime < Path(weights_path).stat().st_mtime:
+        export = export_torchscript if backend == "torchscript" else export_onnx
+        export(model, path, max_length)
+
+    if backend == "torchscript":
+        return torch.jit.load(str(path), map_location="cpu")
+    return OnnxRuntimeModule(path)
+
+
+def _example_inputs(max_length: int) -> tuple[torch.Tensor, torch.Tensor]:
+    input_ids = torch.ones((2, max_length), dtype=torch.long)
+    mask = torch.ones((2, max_length), dtype=torch.long)
+    mask[1, max_length // 2 :] = 0
+    return input_ids, mask
+
+
+def main() -> None:
+    """CLI entry point for onsides-export-model."""
+    # predict.py imports this module for its backend option
+    from onsides.predict import TextSettings, TrainModelSettings, load_model
+
+    parser = argparse.ArgumentParser(
+        description="Export a trained model to TorchScript and/or ONNX."
+    )
+    parser.add_argument(
+        "--weights", type=Path, required=True, help="Trained bestepoch-*.pth"
+    )
+    parser.add_argument(
+        "--network",
+        type=Path,
+        default=Path("models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract"),
+        help="Pretrained base model directory",
+    )
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=["torchscript", "onnx"],
+        default=["torchscript", "onnx"],
+        help="Graph formats to write (default: both)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+
+    settings = TrainModelSettings.from_filename(args.weights)
+    model, _ = load_model(
+        args.network,
+        args.weights,
+        TextSettings(nwords=settings.refnwords, refset=settings.refset),
+    )
+    for fmt in args.format:
+        backend = "onnxruntime" if fmt == "onnx" else fmt
+        export = export_torchscript if fmt == "torchscript" else export_onnx
+        # Each export logs where it was written
+        export(model, export_path(args.weights, backend), settings.max_length)
@@ -0,0 +1,247 @@
+"""
+cascade.py
+
+Cheap first-stage scorer that keeps obviously negative matches away from
+BERT.
+
+Many string matches sit in paragraphs that never yield a release row (drug
+interactions, animal studies, ...). A hashed word n-gram logistic regression,
+trained on the same reference CSV as the BERT model, scores every context in
+microseconds; contexts below a calibrated cutoff get ``pred0 = pred1 = 0.0``
+(below the release cutoff in ``threshold.sql``) and only the rest are sent
+to BERT.
+
+The cutoff is calibrated against the full-BERT baseline: on the held-out
+validation drugs it is the highest cutoff that still keeps all but
+``max_recall_loss`` of the examples BERT would release (``pred1 > 3.258``).
+The report repeats the numbers on the test drugs.
+
+Usage:
+    onsides-train-prefilter \\
+        --ref data/refs/ref14_nwords125_clinical_bert_reference_set_ALL.txt \\
+        --weights models/bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth \\
+        --output models/prefilter-PMB_14-ALL-125.pkl
+"""
+
+import argparse
+import logging
+import pickle
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+from pydantic import BaseModel
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline, make_pipeline
+
+from onsides.quantize import PRED1_THRESHOLD
+from onsides.train import (
+    DEFAULT_RANDOM_SEED,
+    LABELS,
+    load_reference_data,
+    split_train_val_test,
+)
+from onsides.vocab_cache import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RECALL_LOSS = 0.01
+
+
+def train_prefilter(
+    texts: list[str],
+    labels: NDArray[np.integer],
+    seed: int = DEFAULT_RANDOM_SEED,
+) -> Pipeline:
+    """Fit a hashed unigram+bigram logistic regression on reference texts."""
+    pipeline = make_pipeline(
+        HashingVectorizer(
+            ngram_range=(1, 2), n_features=2**20, alternate_sign=False,
+            norm="l2",
+        ),
+        LogisticRegression(
+            C=1.0, class_weight="balanced", max_iter=1000, random_state=seed
+        ),
+    )
+    pipeline.fit(texts, labels)
+    return pipeline
+
+
+class CalibrationRow(BaseModel):
+    """Effect of skipping contexts with prefilter score below `cutoff`."""
+
+    cutoff: float
+    skip_fraction: float
+    bert_positive_recall: float
+    label_recall: float | None = None
+
+
+class CascadeReport(BaseModel):
+    """Cutoff choice on the validation split and its effect on test."""
+
+    max_recall_loss: float
+    cutoff: float
+    validation: CalibrationRow
+    test: CalibrationRow | None = None
+
+    def __str__(self):
+        lines = [
+            "Cascade prefilter calibration",
+            "-----------------------------",
+            f" cutoff: {self.cutoff:.6f} "
+            f"(max recall loss vs BERT: {self.max_recall_loss:.2%})",
+        ]
+        for name, row in [("validation", self.validation), ("test", self.test)]:
+            if row is None:
+                continue
+            line = (
+                f" {name}: skips {row.skip_fraction:.1%} of BERT passes, "
+                f"keeps {row.bert_positive_recall:.2%} of BERT positives"
+            )
+            if row.label_recall is not None:
+                line += f", {row.label_recall:.2%} of labeled events"
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+
+def calibration_row(
+    scores: NDArray[np.floating],
+    bert_pred1: NDArray[np.floating],
+    cutoff: float,
+    labels: NDArray[np.integer] | None = None,
+    threshold: float = PRED1_THRESHOLD,
+) -> CalibrationRow:
+    """Skip rate and recall loss of `cutoff` against the full-BERT scores."""
+    kept = scores >= cutoff
+    bert_positive = bert_pred1 > threshold
+    row = CalibrationRow(
+        cutoff=cutoff,
+        skip_fraction=float(1 - kept.mean()) if len(kept) else 0.0,
+        bert_positive_recall=_recall(kept, bert_positive),
+    )
+    if labels is not None:
+        # An event is only released if BERT scores it positive and it is kept
+        row.label_recall = _recall(
+            kept & bert_positive, np.asarray(labels).astype(bool)
+        )
+    return row
+
+
+def choose_cutoff(
+    scores: NDArray[np.floating],
+    bert_pred1: NDArray[np.floating],
+    max_recall_loss: float = DEFAULT_MAX_RECALL_LOSS,
+    threshold: float = PRED1_THRESHOLD,
+) -> float:
+    """Highest cutoff that keeps >= 1 - `max_recall_loss` of BERT positives."""
+    positive_scores = np.sort(scores[bert_pred1 > threshold])
+    if len(positive_scores) == 0:
+        return 0.0
+    n_may_lose = int(np.floor(max_recall_loss * len(positive_scores)))
+    return float(positive_scores[n_may_lose])
+
+
+@dataclass
+class Prefilter:
+    """A trained first stage and the cutoff below which BERT is skipped."""
+
+    pipeline: Pipeline
+    cutoff: float
+    report: CascadeReport | None = None
+
+    def scores(self, texts: list[str]) -> NDArray[np.float64]:
+        """Probability that each text is an event, per the first stage."""
+        return self.pipeline.predict_proba(texts)[:, 1]
+
+    def keep(self, texts: list[str]) -> NDArray[np.bool_]:
+        """Which texts still need BERT."""
+        return self.scores(texts) >= self.cutoff
+
+    def save(self, path: Path) -> None:
+        atomic_write(
+            Path(path),
+            lambda f: pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "Prefilter":
+        with open(path, "rb") as f:
+            prefilter = pickle.load(f)
+        if not isinstance(prefilter, cls):
+            raise TypeError(f"{path} does not contain a Prefilter")
+        return prefilter
+
+
+def _recall(predicted: NDArray[np.bool_], actual: NDArray[np.bool_]) -> float:
+    if actual.sum() == 0:
+        return 1.0
+    return float((predicted & actual).sum() / actual.sum())
+
+
+def main() -> None:
+    """CLI entry point for onsides-train-prefilter."""
+    # predict.py imports this module for its prefilter option
+    from onsides.predict import TextSettings, TrainModelSettings, predict
+
+    parser = argparse.ArgumentParser(
+        description="Train and calibrate the cascade prefilter that skips "
+        "BERT on clearly negative matches."
+    )
+    parser.add_argument("--ref", type=Path, required=True, help="Reference CSV")
+    parser.add_argument(
+        "--weights", type=Path, required=True,
+        help="Trained bestepoch-*.pth used as the full-BERT baseline",
+    )
+    parser.add_argument(
+        "--network",
+        type=Path,
+        default=Path("models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract"),
+        help="Pretrained base model directory",
+    )
+    parser.add_argument("--output", type=Path, required=True, help="Prefilter .pkl")
+    parser.add_argument(
+        "--max-recall-loss", type=float, default=DEFAULT_MAX_RECALL_LOSS,
+        help="Share of BERT-positive validation examples the prefilter may "
+        f"drop (default: {DEFAULT_MAX_RECALL_LOSS})",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+
+    settings = TrainModelSettings.from_filename(args.weights)
+    df = load_reference_data(args.ref, settings.refsource)
+    df_train, df_val, df_test = split_train_val_test(
+        df, settings.np_random_seed, settings.split_method
+    )
+
+    def labels_of(split: pd.DataFrame) -> NDArray[np.int64]:
+        return np.array([LABELS[c] for c in split["class"]])
+
+    pipeline = train_prefilter(
+        df_train["string"].tolist(), labels_of(df_train), settings.np_random_seed
+    )
+    prefilter = Prefilter(pipeline=pipeline, cutoff=0.0)
+
+    text_settings = TextSettings(nwords=settings.refnwords, refset=settings.refset)
+    rows = dict()
+    cutoff = None
+    for name, split in [("validation", df_val), ("test", df_test)]:
+        texts = split["string"].tolist()
+        bert_pred1 = predict(texts, args.network, args.weights, text_settings)[:, 1]
+        scores = prefilter.scores(texts)
+        if cutoff is None:
+            cutoff = choose_cutoff(scores, bert_pred1, args.max_recall_loss)
+        rows[name] = calibration_row(scores, bert_pred1, cutoff, labels_of(split))
+
+    prefilter.cutoff = cutoff
+    prefilter.report = CascadeReport(
+        max_recall_loss=args.max_recall_loss, cutoff=cutoff, **rows
+    )
+    prefilter.save(args.output)
+    logger.info(f"\n{prefilter.report}")
+    logger.info(f"Saved prefilter to {args.output}")
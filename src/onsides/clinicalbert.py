@@ -1,3 +1,4 @@
+import itertools
 import logging
 from os import PathLike
 from pathlib import Path
@@ -9,6 +10,8 @@ from numpy._typing import NDArray
 from torch import nn
 from transformers import AutoModel, AutoTokenizer
 
+from onsides.token_cache import load_or_encode, pad_token_ids
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,16 +39,33 @@ def evaluate(
     texts: list[str],
     max_length: int,
     batch_size: int,
+    dynamic_padding: bool = False,
+    cache_dir: Path | None = None,
+    device: torch.device | None = None,
+    token_ids: list[list[int]] | None = None,
 ) -> NDArray[np.float64]:
+    """Run the model over `texts` and return the raw outputs, one row per text.
+
+    With `dynamic_padding`, texts are batched by token length and each batch is
+    padded only to its longest member; rows are still returned in input order.
+    With `cache_dir`, the tokenized texts are cached there (see `Dataset`).
+    `token_ids` are already-tokenized inputs for `texts`, used instead of
+    tokenizing them. `device` defaults to CUDA when available, else CPU.
+    """
     model.eval()
-    if torch.cuda.is_available():
-        device = torch.device("cuda")
-        model = model.cuda()
-    else:
-        device = torch.device("cpu")
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = model.to(device)
 
-    dataset = Dataset(texts, tokenizer_path, max_length=max_length)
-    dataloader = torch.utils.data.DataLoader(dataset, batch_size=batch_size)
+    dataset = Dataset(
+        texts,
+        tokenizer_path,
+        max_length=max_length,
+        dynamic_padding=dynamic_padding,
+        cache_dir=cache_dir,
+        token_ids=token_ids,
+    )
+    dataloader = make_dataloader(dataset, batch_size)
 
     total_acc_test = 0
     outputs = list()
@@ -53,7 +73,7 @@ def evaluate(
     with torch.no_grad():
         for test_input, test_label in tqdm.tqdm(dataloader):
             test_label = test_label.to(device)
-            mask = test_input["attention_mask"].to(device)
+            mask = test_input["attention_mask"].squeeze(1).to(device)
             input_id = test_input["input_ids"].squeeze(1).to(device)
 
             output = model(input_id, mask)
@@ -66,34 +86,191 @@ def evaluate(
     # TODO: Format the outputs properly
     npoutputs = [x.cpu().detach().numpy() for x in outputs]
     predictions = np.vstack(npoutputs)
+    if dynamic_padding:
+        # Batches come out grouped by length; scatter rows back to input order
+        order = list(itertools.chain.from_iterable(dataloader.batch_sampler))
+        unsorted = np.empty_like(predictions)
+        unsorted[order] = predictions
+        predictions = unsorted
     print(f"Predictions have shape: {predictions.shape}")
     return predictions
 
 
+def make_dataloader(
+    dataset: "Dataset",
+    batch_size: int,
+    shuffle: bool = False,
+    num_workers: int = 0,
+    seed: int | None = None,
+) -> torch.utils.data.DataLoader:
+    """DataLoader for `dataset`, length-bucketed if it uses dynamic padding.
+
+    With `num_workers > 0`, batches are assembled in that many persistent
+    worker processes while the model runs. With `shuffle` and a `seed`, the
+    batch sampler is a `ResumableBatchSampler` (call its `set_epoch` before
+    each epoch); otherwise shuffling draws from the global torch RNG.
+    """
+    worker_kwargs = dict()
+    if num_workers > 0:
+        worker_kwargs = {"num_workers": num_workers, "persistent_workers": True}
+    generator = None
+    if shuffle and seed is not None:
+        generator = torch.Generator()
+    if dataset.dynamic_padding:
+        sampler = LengthBucketBatchSampler(
+            dataset.lengths, batch_size, shuffle=shuffle, generator=generator
+        )
+        worker_kwargs["collate_fn"] = dataset.collate
+    elif generator is not None:
+        sampler = torch.utils.data.BatchSampler(
+            torch.utils.data.RandomSampler(dataset, generator=generator),
+            batch_size,
+            drop_last=False,
+        )
+    else:
+        return torch.utils.data.DataLoader(
+            dataset, batch_size=batch_size, shuffle=shuffle, **worker_kwargs
+        )
+    if generator is not None:
+        sampler = ResumableBatchSampler(sampler, generator, seed)
+        # Starting an epoch would otherwise draw a worker base seed from the
+        # global RNG, which a resumed run would not replay
+        worker_kwargs["generator"] = torch.Generator()
+    return torch.utils.data.DataLoader(
+        dataset, batch_sampler=sampler, **worker_kwargs
+    )
+
+
+class ResumableBatchSampler(torch.utils.data.Sampler[list[int]]):
+    """
+    Seeded batch order that can be restarted in the middle of an epoch.
+
+    Wraps a shuffling batch sampler that draws from `generator`. Each epoch
+    reseeds the generator from (`seed`, epoch), so an epoch's batch order
+    depends on neither earlier epochs nor the global RNG, and
+    `set_epoch(epoch, start)` replays it from batch `start` without loading
+    the skipped batches.
+    """
+
+    def __init__(
+        self,
+        batch_sampler: torch.utils.data.Sampler[list[int]],
+        generator: torch.Generator,
+        seed: int,
+    ):
+        self.batch_sampler = batch_sampler
+        self.generator = generator
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch: int, start: int = 0) -> None:
+        self.epoch = epoch
+        self.start = start
+
+    def __len__(self) -> int:
+        return max(len(self.batch_sampler) - self.start, 0)
+
+    def __iter__(self):
+        epoch_seed = np.random.SeedSequence([self.seed, self.epoch])
+        self.generator.manual_seed(int(epoch_seed.generate_state(1)[0]))
+        return itertools.islice(iter(self.batch_sampler), self.start, None)
+
+
+class LengthBucketBatchSampler(torch.utils.data.Sampler[list[int]]):
+    """
+    Yields batches of indices whose sequences have similar lengths, so that
+    padding each batch to its own longest member wastes little compute.
+
+    Without shuffling, all indices are sorted by length (stable, so ties keep
+    their input order) and cut into consecutive batches. With shuffling, the
+    indices are permuted, split into buckets of `bucket_batches` batches, each
+    bucket is sorted by length and cut into batches, and the batch order is
+    permuted again. Every sample is still seen once per epoch in a random
+    batch; only the batch composition is biased towards similar lengths.
+    Randomness comes from `generator` (default: the global torch RNG), like
+    `DataLoader(shuffle=True)`.
+    """
+
+    def __init__(
+        self,
+        lengths: list[int],
+        batch_size: int,
+        shuffle: bool = False,
+        bucket_batches: int = 50,
+        generator: torch.Generator | None = None,
+    ):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_batches = bucket_batches
+        self.generator = generator
+
+    def __len__(self) -> int:
+        return -(-len(self.lengths) // self.batch_size)
+
+    def __iter__(self):
+        n = len(self.lengths)
+        if not self.shuffle:
+            order = sorted(range(n), key=self.lengths.__getitem__)
+            for start in range(0, n, self.batch_size):
+                yield order[start : start + self.batch_size]
+            return
+
+        permutation = torch.randperm(n, generator=self.generator).tolist()
+        bucket_size = self.batch_size * self.bucket_batches
+        batches = list()
+        for start in range(0, n, bucket_size):
+            bucket = sorted(
+                permutation[start : start + bucket_size],
+                key=self.lengths.__getitem__,
+            )
+            batches.extend(
+                bucket[i : i + self.batch_size]
+                for i in range(0, len(bucket), self.batch_size)
+            )
+        for i in torch.randperm(len(batches), generator=self.generator).tolist():
+            yield batches[i]
+
+
 class Dataset(torch.utils.data.Dataset):
+    """
+    Tokenized texts and labels for ClinicalBertClassifier.
+
+    Texts are encoded in batches by the fast tokenizer into contiguous int32
+    `input_ids`/`attention_mask` arrays of shape (n, max_length). With a
+    `cache_dir` the arrays are persisted there and memory-mapped on later
+    runs over the same texts (see `onsides.token_cache`). Pre-tokenized
+    `token_ids` (e.g. from `onsides.token_windows`) are packed into the same
+    arrays without running the tokenizer.
+    """
+
     def __init__(
         self,
         texts: list[str],
         tokenizer_path: Path,
         max_length: int = 128,
         labels: list[int] | None = None,
+        dynamic_padding: bool = False,
+        cache_dir: Path | None = None,
+        token_ids: list[list[int]] | None = None,
     ):
         self.labels = labels if labels is not None else [0 for _ in texts]
+        self.dynamic_padding = dynamic_padding
 
         logger.info(f"Loading tokenizer from {tokenizer_path}...")
         self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
 
-        logger.info("Tokenizing texts...")
-        self.texts = [
-            self.tokenizer(
-                text,
-                padding="max_length",
-                max_length=max_length,
-                truncation=True,
-                return_tensors="pt",
+        if token_ids is not None:
+            self.input_ids, self.attention_mask = pad_token_ids(
+                token_ids, max_length, self.tokenizer.pad_token_id
             )
-            for text in texts
-        ]
+        else:
+            logger.info("Tokenizing texts...")
+            self.input_ids, self.attention_mask = load_or_encode(
+                self.tokenizer, tokenizer_path, texts, max_length, cache_dir=cache_dir
+            )
+        self.lengths = self.attention_mask.sum(axis=1).tolist()
 
     def classes(self):
         return self.labels
@@ -105,9 +282,36 @@ class Dataset(torch.utils.data.Dataset):
         return np.array(self.labels[idx])
 
     def get_batch_texts(self, idx):
-        return self.texts[idx]
+        # With dynamic padding, `collate` pads each batch to its longest member
+        stop = self.lengths[idx] if self.dynamic_padding else None
+        return {
+            "input_ids": torch.from_numpy(
+                self.input_ids[idx, :stop].astype(np.int64)
+            ),
+            "attention_mask": torch.from_numpy(
+                self.attention_mask[idx, :stop].astype(np.int64)
+            ),
+        }
 
     def __getitem__(self, idx):
         batch_texts = self.get_batch_texts(idx)
         batch_y = self.get_batch_labels(idx)
         return batch_texts, batch_y
+
+    def collate(self, batch):
+        """Pad a dynamic-padding batch to the length of its longest sequence."""
+        items, labels = zip(*batch)
+        pad = nn.utils.rnn.pad_sequence
+        inputs = {
+            "input_ids": pad(
+                [item["input_ids"] for item in items],
+                batch_first=True,
+                padding_value=self.tokenizer.pad_token_id,
+            ),
+            "attention_mask": pad(
+                [item["attention_mask"] for item in items],
+                batch_first=True,
+                padding_value=0,
+            ),
+        }
+        return inputs, torch.as_tensor(np.array(labels))
@@ -0,0 +1,61 @@
+"""Shared pytest fixtures for onsides tests."""
+
+import pytest
+import torch
+from transformers import BertConfig, BertModel, BertTokenizerFast
+
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.predict import TextSettings
+
+WORDS = [
+    "headache", "nausea", "fever", "rash", "reported", "in", "patients",
+    "with", "and", "the", "event", "exact", "of", "were", "common",
+]
+
+# Sample match contexts over WORDS, for tests that score text
+CONTEXTS = [
+    "headache exact headache EVENT reported in patients",
+    "rash exact EVENT",
+    "nausea exact nausea and fever were common in patients",
+    "fever exact EVENT of the",
+    "the nausea",
+    "headache exact patients with EVENT and fever",
+    "rash exact rash EVENT common",
+]
+
+TEXT_SETTINGS = TextSettings(nwords=125, refset=14)
+
+
+@pytest.fixture(scope="session")
+def network_path(tmp_path_factory):
+    """A tiny BERT model and tokenizer saved in pretrained format."""
+    path = tmp_path_factory.mktemp("network")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *WORDS]
+    (path / "vocab.txt").write_text("\n".join(vocab) + "\n")
+    BertTokenizerFast(str(path / "vocab.txt")).save_pretrained(path)
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=64,
+    )
+    torch.manual_seed(0)
+    BertModel(config).save_pretrained(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def weights_path(network_path, tmp_path_factory):
+    """Classifier weights for `network_path`, named like a trained model.
+
+    The filename encodes max_length 16 and batch size 4. Tests must not
+    modify the file; copy it first.
+    """
+    path = tmp_path_factory.mktemp("models") / (
+        "bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_16_4.pth"
+    )
+    torch.manual_seed(1)
+    torch.save(ClinicalBertClassifier(network_path).state_dict(), path)
+    return path
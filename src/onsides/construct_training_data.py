@@ -11,6 +11,12 @@ Produces CSV files consumable by ``onsides-train``.
 
 Usage:
     onsides-construct-ref --method 14 --nwords 125 --section ALL
+
+    # Several reference sets from one pass over the annotations
+    onsides-construct-ref --spec 14,125,ALL --spec 14,60,AR --spec 8,125,ALL
+
+    # One-time: snapshot the MedDRA LLT→PT mapping out of the OMOP CSVs
+    onsides-extract-hierarchy
 """
 
 import argparse
@@ -23,12 +29,24 @@ from dataclasses import dataclass, field
 from pathlib import Path
 
 import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
 from ahocorasick import Automaton
 
+from onsides.parallel import process_pool, shard
+from onsides.vocab_cache import CACHE_DIR, content_key, load_or_build
+from onsides.word_offsets import WordOffsets
+
 logger = logging.getLogger(__name__)
 
 ANNOTATION_DIR = Path("database/annotations")
 VOCAB_PATH = Path("_onsides/vocab/meddra_english.parquet")
+MEDDRA_HIERARCHY_PATH = Path("_onsides/vocab/meddra_hierarchy.parquet")
+OMOP_CONCEPT_PATH = Path("data/omop_vocab/CONCEPT.csv")
+OMOP_RELATIONSHIP_PATH = Path("data/omop_vocab/CONCEPT_RELATIONSHIP.csv")
+DEFAULT_OUTPUT_TEMPLATE = (
+    "data/refs/ref{method}_nwords{nwords}_clinical_bert_reference_set_{section}.txt"
+)
 
 SECTION_CODES = {
     "adverse reactions": "AR",
@@ -93,24 +111,154 @@ class MedDRAVocab:
     llt_to_pt: dict[str, tuple[str, str]]  # llt_code → (pt_code, pt_name)
 
 
+_LLT_TO_PT_QUERY = """
+    WITH meddra AS (
+        SELECT concept_id, concept_name, concept_class_id, concept_code
+        FROM read_csv(?, delim='\t', header=true, quote='')
+        WHERE vocabulary_id = 'MedDRA'
+          AND concept_class_id IN ('PT', 'LLT')
+          AND invalid_reason IS NULL
+    )
+    SELECT
+        llt.concept_code AS llt_code,
+        pt.concept_code  AS pt_code,
+        pt.concept_name  AS pt_name
+    FROM meddra llt
+    JOIN read_csv(?, delim='\t', header=true, quote='') cr
+        ON llt.concept_id = cr.concept_id_1
+    JOIN meddra pt
+        ON cr.concept_id_2 = pt.concept_id
+    WHERE llt.concept_class_id = 'LLT'
+      AND pt.concept_class_id  = 'PT'
+      AND cr.relationship_id   = 'Is a'
+      AND cr.invalid_reason IS NULL
+"""
+
+
 def load_meddra_vocab(
     vocab_path: Path = VOCAB_PATH,
     omop_concept_path: Path | None = None,
     omop_relationship_path: Path | None = None,
+    cache_dir: Path | None = CACHE_DIR,
+    hierarchy_path: Path | None = MEDDRA_HIERARCHY_PATH,
 ) -> MedDRAVocab:
     """Load MedDRA terms and build search structures.
 
+    The LLT→PT mapping is read from the snapshot at ``hierarchy_path`` when
+    it exists (see ``extract_meddra_hierarchy``), and from the OMOP CSVs
+    otherwise. The snapshot is skipped if either CSV is newer than it, and
+    the default snapshot is skipped if OMOP paths are given explicitly. The compiled vocabulary is cached in ``cache_dir`` under a
+    content hash of the input files, so later calls with unchanged inputs
+    only unpickle it.
+
     Args:
         vocab_path: Parquet with columns (text_id, text) — one row per
             MedDRA term (LLTs + PTs).
         omop_concept_path: OMOP CONCEPT.csv for LLT→PT mapping.
         omop_relationship_path: OMOP CONCEPT_RELATIONSHIP.csv.
+        cache_dir: Directory for the compiled-vocab cache, or None to
+            always rebuild.
+        hierarchy_path: Parquet snapshot of the LLT→PT mapping, or None to
+            always read the OMOP CSVs.
     """
+    vocab_path = Path(vocab_path)
+    explicit_omop = (
+        omop_concept_path is not None or omop_relationship_path is not None
+    )
     if omop_concept_path is None:
-        omop_concept_path = Path("data/omop_vocab/CONCEPT.csv")
+        omop_concept_path = OMOP_CONCEPT_PATH
     if omop_relationship_path is None:
-        omop_relationship_path = Path("data/omop_vocab/CONCEPT_RELATIONSHIP.csv")
+        omop_relationship_path = OMOP_RELATIONSHIP_PATH
+    if hierarchy_path is not None:
+        hierarchy_path = _usable_hierarchy(
+            Path(hierarchy_path),
+            [Path(omop_concept_path), Path(omop_relationship_path)],
+            explicit_omop,
+        )
+
+    def build() -> MedDRAVocab:
+        return _build_meddra_vocab(
+            vocab_path, omop_concept_path, omop_relationship_path, hierarchy_path
+        )
 
+    if cache_dir is None:
+        return build()
+    if hierarchy_path is not None:
+        key_paths = [vocab_path, hierarchy_path]
+    else:
+        key_paths = [vocab_path, omop_concept_path, omop_relationship_path]
+    key = content_key(key_paths, cache_dir)
+    return load_or_build("meddra_vocab", key, build, cache_dir)
+
+
+def _usable_hierarchy(
+    hierarchy_path: Path, omop_paths: list[Path], explicit_omop: bool
+) -> Path | None:
+    """`hierarchy_path` if the snapshot should stand in for `omop_paths`."""
+    if not hierarchy_path.exists():
+        return None
+    if explicit_omop and hierarchy_path == MEDDRA_HIERARCHY_PATH:
+        logger.info(
+            f"Reading LLT→PT from the given OMOP files, not {hierarchy_path}"
+        )
+        return None
+    snapshot_mtime = hierarchy_path.stat().st_mtime_ns
+    for path in omop_paths:
+        if path.exists() and path.stat().st_mtime_ns > snapshot_mtime:
+            logger.warning(
+                f"{path} is newer than the MedDRA hierarchy snapshot "
+                f"{hierarchy_path}; reading the OMOP files instead "
+                "(rerun onsides-extract-hierarchy to refresh the snapshot)"
+            )
+            return None
+    return hierarchy_path
+
+
+def extract_meddra_hierarchy(
+    omop_concept_path: Path = OMOP_CONCEPT_PATH,
+    omop_relationship_path: Path = OMOP_RELATIONSHIP_PATH,
+    output_path: Path = MEDDRA_HIERARCHY_PATH,
+) -> int:
+    """Extract the MedDRA LLT→PT mapping from OMOP into a small Parquet file.
+
+    CONCEPT_RELATIONSHIP.csv is many gigabytes, but only a few tens of
+    thousands of its rows are MedDRA LLT→PT links. Running this once lets
+    ``load_meddra_vocab`` skip the OMOP CSVs entirely.
+
+    Returns the number of LLT→PT rows written.
+    """
+    for path in (omop_concept_path, omop_relationship_path):
+        if not path.exists():
+            raise FileNotFoundError(f"OMOP vocab file not found: {path}")
+
+    con = duckdb.connect()
+    rows = con.execute(
+        _LLT_TO_PT_QUERY + "ORDER BY llt_code, pt_code",
+        [str(omop_concept_path), str(omop_relationship_path)],
+    ).fetchall()
+    con.close()
+
+    llt_codes, pt_codes, pt_names = zip(*rows) if rows else ((), (), ())
+    table = pa.table({
+        "llt_code": list(llt_codes),
+        "pt_code": list(pt_codes),
+        "pt_name": list(pt_names),
+    })
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(output_path)
+    logger.info(f"Wrote {table.num_rows} LLT→PT rows to {output_path}")
+    return table.num_rows
+
+
+def _build_meddra_vocab(
+    vocab_path: Path,
+    omop_concept_path: Path,
+    omop_relationship_path: Path,
+    hierarchy_path: Path | None = None,
+) -> MedDRAVocab:
+    """Build the vocabulary from source files (uncached)."""
     # Build Aho-Corasick automaton from vocab parquet
     con = duckdb.connect()
     terms = con.execute(
@@ -129,46 +277,34 @@ def load_meddra_vocab(
     automaton.make_automaton()
     logger.info(f"Built automaton with {len(code_to_term)} MedDRA terms")
 
-    # Build LLT→PT mapping from OMOP vocab
+    # Build LLT→PT mapping, preferring the extracted hierarchy snapshot
     llt_to_pt: dict[str, tuple[str, str]] = {}
 
-    if omop_concept_path.exists() and omop_relationship_path.exists():
+    if hierarchy_path is not None and hierarchy_path.exists():
         rows = con.execute(
-            """
-            WITH meddra AS (
-                SELECT concept_id, concept_name, concept_class_id, concept_code
-                FROM read_csv(?, delim='\t', header=true, quote='')
-                WHERE vocabulary_id = 'MedDRA'
-                  AND concept_class_id IN ('PT', 'LLT')
-                  AND invalid_reason IS NULL
-            )
-            SELECT
-                llt.concept_code AS llt_code,
-                pt.concept_code  AS pt_code,
-                pt.concept_name  AS pt_name
-            FROM meddra llt
-            JOIN read_csv(?, delim='\t', header=true, quote='') cr
-                ON llt.concept_id = cr.concept_id_1
-            JOIN meddra pt
-                ON cr.concept_id_2 = pt.concept_id
-            WHERE llt.concept_class_id = 'LLT'
-              AND pt.concept_class_id  = 'PT'
-              AND cr.relationship_id   = 'Is a'
-              AND cr.invalid_reason IS NULL
-            """,
+            "SELECT llt_code, pt_code, pt_name FROM read_parquet(?)",
+            [str(hierarchy_path)],
+        ).fetchall()
+        source = hierarchy_path
+    elif omop_concept_path.exists() and omop_relationship_path.exists():
+        rows = con.execute(
+            _LLT_TO_PT_QUERY,
             [str(omop_concept_path), str(omop_relationship_path)],
         ).fetchall()
-
-        for llt_code, pt_code, pt_name in rows:
-            llt_to_pt[llt_code] = (pt_code, pt_name)
-
-        logger.info(f"Built LLT→PT mapping: {len(llt_to_pt)} entries")
+        source = "OMOP vocab"
     else:
+        rows = None
         logger.warning(
             "OMOP vocab files not found — LLT→PT mapping unavailable. "
             "PT metadata columns will be incomplete."
         )
 
+    if rows is not None:
+        for llt_code, pt_code, pt_name in rows:
+            llt_to_pt[llt_code] = (pt_code, pt_name)
+
+        logger.info(f"Built LLT→PT mapping from {source}: {len(llt_to_pt)} entries")
+
     con.close()
     return MedDRAVocab(
         automaton=automaton,
@@ -225,13 +361,19 @@ def generate_example(
     nwords: int,
     config: MethodConfig,
     source: str = "exact",
+    offsets: WordOffsets | None = None,
+    rng: random.Random | None = None,
 ) -> str:
     """Generate a BERT training example string from a found term in context.
 
     Matches the logic from the original construct_training_data.py methods 0-15.
+    Pass ``offsets`` (the WordOffsets of ``text``) to reuse one word index
+    across all matches in the same text. Method 5 draws its random words from
+    ``rng`` (default: the global ``random`` module).
     """
     if config.random_words:
-        return " ".join(random.sample(text.split(), min(nwords, len(text.split()))))
+        sampler = rng if rng is not None else random
+        return " ".join(sampler.sample(text.split(), min(nwords, len(text.split()))))
 
     if nwords == 3:
         return term
@@ -253,17 +395,17 @@ def generate_example(
         source_tag = "exact" if source == "exact" else "split"
         start_string = f"{start_string} {source_tag}" if start_string else source_tag
 
-    before_text = text[:start]
-    after_text = text[start + length:]
+    if offsets is None:
+        offsets = WordOffsets(text)
 
     parts: list[str] = []
     if start_string:
         parts.append(start_string)
     if config.prop_before > 0:
-        parts.extend(before_text.split()[-size_before:])
+        parts.extend(offsets.words_before(start, size_before))
     parts.append(event_string)
     if config.prop_before < 1:
-        parts.extend(after_text.split()[:size_after])
+        parts.extend(offsets.words_after(start + length, size_after))
 
     return " ".join(parts)
 
@@ -479,50 +621,194 @@ def load_annotations(
 # Main construction logic
 # ---------------------------------------------------------------------------
 
+@dataclass(frozen=True)
+class RefSpec:
+    """One reference set to build: method, context size and section argument."""
+
+    method: int
+    nwords: int
+    section: str = "ALL"
+
+    @property
+    def sections(self) -> list[str]:
+        return _resolve_sections(self.section)
+
+
+@dataclass
+class _ExampleVariant:
+    """Example settings shared by every RefSpec with the same method/nwords.
+
+    Random-word specs get a variant of their own, so that each keeps the
+    seeded random stream it would have in a standalone run.
+    """
+
+    config: MethodConfig
+    nwords: int
+    sections: set[str]
+    random_seed: int | None = None
+
+
 def construct_reference_set(
     records: list[AnnotationRecord],
     vocab: MedDRAVocab,
     method: int,
     nwords: int,
+    n_workers: int = 1,
 ) -> list[list[str]]:
     """Build the full reference set from annotations and vocabulary.
 
     Returns rows as lists of strings matching the output CSV columns:
     [section, drug, tac, meddra_id, pt_meddra_id, source_method, class,
      pt_meddra_term, found_term, string]
+
+    With ``n_workers > 1`` the records are split into contiguous shards and
+    matched in a process pool that shares the vocabulary; rows come back in
+    record order, so the output is identical to the serial run. Method 5
+    draws random words from a single seeded stream and always runs serially.
     """
-    config = get_method_config(method)
-    random.seed(222)
+    spec = RefSpec(method, nwords, "ALL")
+    return construct_reference_sets(records, vocab, [spec], n_workers)[spec]
 
-    rows: list[list[str]] = []
-    total_pos = 0
-    total_neg = 0
 
-    for record in records:
-        text_lower = " ".join(record.text.split()).lower()
+def construct_reference_sets(
+    records: list[AnnotationRecord],
+    vocab: MedDRAVocab,
+    specs: list[RefSpec],
+    n_workers: int = 1,
+) -> dict[RefSpec, list[list[str]]]:
+    """Build several reference sets in one pass over the annotations.
 
-        found_terms = find_terms_in_text(text_lower, vocab)
+    Each record is matched against the vocabulary once, and examples are
+    generated once per distinct (method, nwords). Every spec then receives
+    the rows of the records in its sections, identical to what
+    ``construct_reference_set`` returns for those records alone.
+
+    See ``construct_reference_set`` for the row format and ``n_workers``.
+    """
+    variants, variant_of_spec = _example_variants(specs)
+    has_random = any(v.random_seed is not None for v in variants)
+
+    if n_workers > 1 and has_random:
+        logger.info("Method uses random words; building reference set serially")
+        n_workers = 1
+
+    if n_workers > 1:
+        shards = shard(records, n_workers * 8)
+        with process_pool(
+            n_workers, _init_record_worker, (vocab, variants)
+        ) as pool:
+            results = [
+                result
+                for shard_results in pool.imap(_process_records_in_worker, shards)
+                for result in shard_results
+            ]
+    else:
+        rngs = [
+            random.Random(v.random_seed) if v.random_seed is not None else None
+            for v in variants
+        ]
+        results = (
+            _process_record(record, vocab, variants, rngs) for record in records
+        )
+
+    spec_sections = {spec: set(spec.sections) for spec in specs}
+    rows_by_spec: dict[RefSpec, list[list[str]]] = {spec: [] for spec in specs}
+    totals = {spec: [0, 0] for spec in specs}
+
+    for record, (variant_rows, num_pos, num_neg) in zip(records, results):
         logger.info(
             f"  {record.drug}/{record.section_code}: "
-            f"{len(found_terms)} term occurrences in text"
+            f"{num_pos + num_neg} term occurrences in text"
+        )
+        logger.info(
+            f"    pos={num_pos}, neg={num_neg}"
         )
+        for spec in specs:
+            if record.section_code not in spec_sections[spec]:
+                continue
+            rows_by_spec[spec].extend(variant_rows[variant_of_spec[spec]])
+            totals[spec][0] += num_pos
+            totals[spec][1] += num_neg
 
-        num_pos = 0
-        num_neg = 0
+    for spec in specs:
+        total_pos, total_neg = totals[spec]
+        logger.info(
+            f"Reference set complete (method={spec.method}, "
+            f"nwords={spec.nwords}, section={spec.section}): "
+            f"{total_pos} positive, {total_neg} negative, "
+            f"{total_pos + total_neg} total"
+        )
+    return rows_by_spec
 
-        for ft in found_terms:
-            is_event = (
-                ft.code in record.annotated_codes
-                or ft.pt_code in record.annotated_codes
-            )
-            string_class = "is_event" if is_event else "not_event"
 
+def _example_variants(
+    specs: list[RefSpec],
+) -> tuple[list[_ExampleVariant], dict[RefSpec, int]]:
+    """Group specs by the example strings they need.
+
+    Returns the variants and the index of each spec's variant.
+    """
+    variants: list[_ExampleVariant] = []
+    index_by_key: dict[tuple, int] = {}
+    variant_of_spec: dict[RefSpec, int] = {}
+    for spec in specs:
+        config = get_method_config(spec.method)
+        if config.random_words:
+            key: tuple = (spec.method, spec.nwords, spec.section)
+        else:
+            key = (spec.method, spec.nwords)
+        if key not in index_by_key:
+            index_by_key[key] = len(variants)
+            variants.append(_ExampleVariant(
+                config=config,
+                nwords=spec.nwords,
+                sections=set(),
+                random_seed=222 if config.random_words else None,
+            ))
+        variant = variants[index_by_key[key]]
+        variant.sections.update(spec.sections)
+        variant_of_spec[spec] = index_by_key[key]
+    return variants, variant_of_spec
+
+
+def _process_record(
+    record: AnnotationRecord,
+    vocab: MedDRAVocab,
+    variants: list[_ExampleVariant],
+    rngs: list[random.Random | None] | None = None,
+) -> tuple[list[list[list[str]]], int, int]:
+    """Find and classify all terms in one record.
+
+    Returns (rows per variant, num_pos, num_neg). Variants whose sections
+    do not include the record get no rows.
+    """
+    text_lower = " ".join(record.text.split()).lower()
+    found_terms = find_terms_in_text(text_lower, vocab)
+    offsets = WordOffsets(text_lower)
+    active = [
+        i for i, variant in enumerate(variants)
+        if record.section_code in variant.sections
+    ]
+
+    variant_rows: list[list[list[str]]] = [[] for _ in variants]
+    num_pos = 0
+    num_neg = 0
+
+    for ft in found_terms:
+        is_event = (
+            ft.code in record.annotated_codes
+            or ft.pt_code in record.annotated_codes
+        )
+        string_class = "is_event" if is_event else "not_event"
+
+        for i in active:
             example = generate_example(
                 text_lower, ft.term, ft.start, ft.length,
-                nwords, config, ft.source,
+                variants[i].nwords, variants[i].config, ft.source, offsets,
+                rng=rngs[i] if rngs is not None else None,
             )
 
-            rows.append([
+            variant_rows[i].append([
                 record.section_code,
                 record.drug,
                 record.tac,
@@ -535,22 +821,29 @@ def construct_reference_set(
                 example,
             ])
 
-            if is_event:
-                num_pos += 1
-            else:
-                num_neg += 1
+        if is_event:
+            num_pos += 1
+        else:
+            num_neg += 1
 
-        total_pos += num_pos
-        total_neg += num_neg
-        logger.info(
-            f"    pos={num_pos}, neg={num_neg}"
-        )
+    return variant_rows, num_pos, num_neg
 
-    logger.info(
-        f"Reference set complete: {total_pos} positive, "
-        f"{total_neg} negative, {total_pos + total_neg} total"
-    )
-    return rows
+
+_worker_state: dict = {}
+
+
+def _init_record_worker(
+    vocab: MedDRAVocab, variants: list[_ExampleVariant]
+) -> None:
+    _worker_state["args"] = (vocab, variants)
+
+
+def _process_records_in_worker(
+    records: list[AnnotationRecord],
+) -> list[tuple[list[list[list[str]]], int, int]]:
+    return [
+        _process_record(record, *_worker_state["args"]) for record in records
+    ]
 
 
 def write_reference_csv(
@@ -584,12 +877,24 @@ def _resolve_sections(section_arg: str) -> list[str]:
     raise ValueError(f"Unknown section: {section_arg}")
 
 
+def _parse_spec(value: str) -> RefSpec:
+    """Parse a ``METHOD,NWORDS,SECTION`` argument."""
+    parts = value.split(",")
+    if len(parts) != 3:
+        raise ValueError(f"--spec must be METHOD,NWORDS,SECTION, got {value!r}")
+    method, nwords, section = parts
+    spec = RefSpec(int(method), int(nwords), section)
+    _resolve_sections(spec.section)
+    get_method_config(spec.method)
+    return spec
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Construct BERT training reference sets from annotations."
     )
     parser.add_argument(
-        "--method", type=int, required=True,
+        "--method", type=int, default=None,
         help="Example construction method (0-15). Method 14 is recommended.",
     )
     parser.add_argument(
@@ -605,6 +910,16 @@ def main() -> None:
         "--output", type=Path, default=None,
         help="Output CSV path. Default: data/refs/ref{method}_nwords{nwords}_..._{section}.txt",
     )
+    parser.add_argument(
+        "--spec", action="append", default=[], metavar="METHOD,NWORDS,SECTION",
+        help="Build this reference set; repeat to build several in one pass "
+        "over the annotations (replaces --method/--nwords/--section/--output).",
+    )
+    parser.add_argument(
+        "--output-template", type=str, default=DEFAULT_OUTPUT_TEMPLATE,
+        help="Output path for each --spec, formatted with {method}, {nwords} "
+        "and {section}.",
+    )
     parser.add_argument(
         "--vocab", type=Path, default=VOCAB_PATH,
         help="MedDRA vocabulary parquet path.",
@@ -629,6 +944,15 @@ def main() -> None:
         "(e.g. 'annotations/adverse_events'). "
         "These annotations are added as test-split records.",
     )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Rebuild the MedDRA automaton instead of using the cache in "
+        f"{CACHE_DIR}.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of worker processes for term matching (default: 1).",
+    )
 
     args = parser.parse_args()
     logging.basicConfig(
@@ -636,31 +960,55 @@ def main() -> None:
         format="%(asctime)s %(name)s %(levelname)s: %(message)s",
     )
 
-    if args.nwords < 3:
-        parser.error("--nwords must be >= 3")
-    if args.nwords == 3 and args.method != 0:
-        parser.error("--method must be 0 when --nwords is 3")
+    if args.spec:
+        if args.method is not None or args.output is not None:
+            parser.error("--spec cannot be combined with --method or --output")
+        try:
+            specs = [_parse_spec(spec) for spec in args.spec]
+        except ValueError as e:
+            parser.error(str(e))
+        output_paths = {
+            spec: Path(args.output_template.format(
+                method=spec.method, nwords=spec.nwords, section=spec.section,
+            ))
+            for spec in specs
+        }
+    else:
+        if args.method is None:
+            parser.error("one of --method or --spec is required")
+        spec = RefSpec(args.method, args.nwords, args.section)
+        output_path = args.output
+        if output_path is None:
+            output_path = Path(DEFAULT_OUTPUT_TEMPLATE.format(
+                method=spec.method, nwords=spec.nwords, section=spec.section,
+            ))
+        specs = [spec]
+        output_paths = {spec: output_path}
+
+    for spec in specs:
+        if spec.nwords < 3:
+            parser.error("--nwords must be >= 3")
+        if spec.nwords == 3 and spec.method != 0:
+            parser.error("--method must be 0 when --nwords is 3")
 
-    sections = _resolve_sections(args.section)
+    sections = sorted({s for spec in specs for s in spec.sections})
 
     exclude_flag1 = set(args.exclude_flag1.split(",")) if args.exclude_flag1 else None
     exclude_flag2 = set(args.exclude_flag2.split(",")) if args.exclude_flag2 else None
 
-    output_path = args.output
-    if output_path is None:
-        output_path = (
-            Path("data/refs")
-            / f"ref{args.method}_nwords{args.nwords}"
-            f"_clinical_bert_reference_set_{args.section}.txt"
+    for spec in specs:
+        logger.info(
+            f"Method: {spec.method}, nwords: {spec.nwords}, "
+            f"sections: {spec.sections} -> {output_paths[spec]}"
         )
-
-    logger.info(f"Method: {args.method}, nwords: {args.nwords}, sections: {sections}")
     if exclude_flag1:
         logger.info(f"Excluding Flag 1: {exclude_flag1}")
     if exclude_flag2:
         logger.info(f"Excluding Flag 2: {exclude_flag2}")
 
-    vocab = load_meddra_vocab(args.vocab)
+    vocab = load_meddra_vocab(
+        args.vocab, cache_dir=None if args.no_cache else CACHE_DIR,
+    )
 
     if args.onsides_annotations:
         records = load_onsides_annotations(
@@ -673,8 +1021,38 @@ def main() -> None:
             exclude_flag2=exclude_flag2,
         )
 
-    rows = construct_reference_set(records, vocab, args.method, args.nwords)
-    write_reference_csv(output_path, rows)
+    rows_by_spec = construct_reference_sets(
+        records, vocab, specs, n_workers=args.workers,
+    )
+    for spec, rows in rows_by_spec.items():
+        write_reference_csv(output_paths[spec], rows)
+
+
+def extract_hierarchy_main() -> None:
+    """CLI entry point for onsides-extract-hierarchy."""
+    parser = argparse.ArgumentParser(
+        description="Extract the MedDRA LLT→PT mapping from the OMOP "
+        "vocabulary into a Parquet snapshot used by onsides-construct-ref."
+    )
+    parser.add_argument(
+        "--concept", type=Path, default=OMOP_CONCEPT_PATH,
+        help="OMOP CONCEPT.csv path.",
+    )
+    parser.add_argument(
+        "--relationship", type=Path, default=OMOP_RELATIONSHIP_PATH,
+        help="OMOP CONCEPT_RELATIONSHIP.csv path.",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=MEDDRA_HIERARCHY_PATH,
+        help=f"Output Parquet path (default: {MEDDRA_HIERARCHY_PATH}).",
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+    extract_meddra_hierarchy(args.concept, args.relationship, args.output)
 
 
 if __name__ == "__main__":
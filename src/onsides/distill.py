@@ -0,0 +1,322 @@
+"""
+distill.py
+
+Knowledge distillation of a trained ClinicalBertClassifier into a smaller
+student for CPU inference.
+
+The student starts as a copy of the teacher that keeps only `n_layers`
+evenly spaced encoder layers. It is then trained to reproduce the teacher's
+head logits (before the final ReLU, so thresholded pred1 values carry over)
+on a random sample of string-match contexts; no labels are needed. The
+student is written as its own pretrained network directory plus a
+``student-bydrug-*.pth`` weights file with the teacher's filename
+parameters, so it is a drop-in for ``predict()``::
+
+    predict(texts, network_path=student_dir, weights_path=student_weights)
+
+A held-out part of the sample is scored by both models to report pred1
+agreement (at the release cutoff) and contexts per second.
+
+Usage:
+    onsides-distill \\
+        --weights models/bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth \\
+        --matches _onsides/combined/label_english_string_match.parquet \\
+        --layers 4 --output-dir models/student-PMB-L4
+"""
+
+import argparse
+import copy
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pyarrow.parquet as pq
+import torch
+from numpy.typing import NDArray
+from pydantic import BaseModel
+from torch import nn
+from torch.optim import Adam
+from tqdm import tqdm
+from transformers import AutoTokenizer
+
+from onsides.clinicalbert import ClinicalBertClassifier, Dataset, make_dataloader
+from onsides.features import load_encoder
+from onsides.predict import InferencePool, TextSettings, TrainModelSettings
+from onsides.quantize import QuantizationReport, compare_pred1
+from onsides.train import DEFAULT_RANDOM_SEED, atomic_torch_save
+
+logger = logging.getLogger(__name__)
+
+
+def make_student(
+    teacher: ClinicalBertClassifier, n_layers: int
+) -> ClinicalBertClassifier:
+    """Copy `teacher`, keeping `n_layers` evenly spaced encoder layers.
+
+    Embeddings, pooler and head are copied unchanged.
+    """
+    layers = teacher.bert.encoder.layer
+    if not 1 <= n_layers <= len(layers):
+        raise ValueError(
+            f"n_layers must be between 1 and {len(layers)}, got {n_layers}"
+        )
+    keep = np.linspace(0, len(layers) - 1, n_layers).round().astype(int)
+    student = copy.deepcopy(teacher)
+    student.bert.encoder.layer = nn.ModuleList(
+        copy.deepcopy(layers[int(i)]) for i in keep
+    )
+    student.bert.config.num_hidden_layers = n_layers
+    logger.info(f"Student keeps teacher layers {keep.tolist()}")
+    return student
+
+
+def head_logits(
+    model: ClinicalBertClassifier, input_id: torch.Tensor, mask: torch.Tensor
+) -> torch.Tensor:
+    """The head's linear output, before the ReLU in `forward`."""
+    _, pooled_output = model.bert(
+        input_ids=input_id, attention_mask=mask, return_dict=False
+    )
+    return model.linear(model.dropout(pooled_output))
+
+
+def teacher_logits(
+    teacher: ClinicalBertClassifier,
+    dataset: Dataset,
+    batch_size: int,
+    device: torch.device,
+) -> NDArray[np.float32]:
+    """Soft targets: the teacher's pre-ReLU logits for every example."""
+    teacher.eval().to(device)
+    targets = np.empty((len(dataset), 2), dtype=np.float32)
+    with torch.no_grad():
+        for inputs, rows in tqdm(
+            make_dataloader(dataset, batch_size), desc="Teacher"
+        ):
+            logits = head_logits(
+                teacher,
+                inputs["input_ids"].squeeze(1).to(device),
+                inputs["attention_mask"].squeeze(1).to(device),
+            )
+            targets[rows.numpy()] = logits.cpu().numpy()
+    return targets
+
+
+def distill(
+    teacher: ClinicalBertClassifier,
+    student: ClinicalBertClassifier,
+    tokenizer_path: Path,
+    texts: list[str],
+    max_length: int,
+    epochs: int = 3,
+    learning_rate: float = 5e-5,
+    batch_size: int = 32,
+    device: torch.device | None = None,
+) -> list[float]:
+    """Train `student` to match the teacher's logits on `texts`.
+
+    Returns the mean training loss (MSE on the logits) per epoch.
+    """
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # Row indices stand in for labels, so each batch can look up its targets
+    dataset = Dataset(
+        texts, tokenizer_path, max_length, labels=list(range(len(texts))),
+        dynamic_padding=True,
+    )
+    targets = torch.from_numpy(
+        teacher_logits(teacher, dataset, batch_size * 2, device)
+    )
+
+    student.to(device)
+    optimizer = Adam(student.parameters(), lr=learning_rate)
+    criterion = nn.MSELoss()
+    losses = list()
+    for epoch in range(epochs):
+        student.train()
+        total_loss = 0.0
+        loader = make_dataloader(dataset, batch_size, shuffle=True)
+        for inputs, rows in tqdm(loader, desc=f"Epoch {epoch + 1}/{epochs}"):
+            logits = head_logits(
+                student,
+                inputs["input_ids"].squeeze(1).to(device),
+                inputs["attention_mask"].squeeze(1).to(device),
+            )
+            loss = criterion(logits, targets[rows].to(device))
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(rows)
+        losses.append(total_loss / len(dataset))
+        logger.info(f"Epoch {epoch + 1}: distillation loss {losses[-1]:.6f}")
+    return losses
+
+
+def save_student(
+    student: ClinicalBertClassifier,
+    tokenizer_path: Path,
+    teacher_weights_path: Path,
+    output_dir: Path,
+) -> tuple[Path, Path]:
+    """Write the student network and weights for use with `predict()`.
+
+    Returns (network_path, weights_path). The weights file reuses the
+    teacher's filename parameters under a ``student-bydrug`` prefix.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    student.bert.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(tokenizer_path).save_pretrained(output_dir)
+
+    settings = TrainModelSettings.from_filename(teacher_weights_path)
+    params = teacher_weights_path.stem.split("_", 1)[1]
+    weights_path = output_dir / f"student-bydrug-{settings.network}_{params}.pth"
+    atomic_torch_save(student.state_dict(), weights_path)
+    logger.info(f"Saved student to {output_dir}")
+    return output_dir, weights_path
+
+
+def sample_contexts(
+    matches_path: Path, n: int, seed: int = DEFAULT_RANDOM_SEED
+) -> list[str]:
+    """`n` contexts drawn uniformly without replacement, in file order.
+
+    Streams the file, so only the sampled strings are held in memory.
+    """
+    parquet_file = pq.ParquetFile(matches_path)
+    n_rows = parquet_file.metadata.num_rows
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(n_rows, size=min(n, n_rows), replace=False))
+
+    contexts = list()
+    offset = 0
+    for batch in parquet_file.iter_batches(columns=["context"]):
+        lo, hi = np.searchsorted(rows, [offset, offset + batch.num_rows])
+        if hi > lo:
+            column = batch.column("context")
+            contexts.extend(column.take(rows[lo:hi] - offset).to_pylist())
+        offset += batch.num_rows
+    return contexts
+
+
+class DistillationReport(BaseModel):
+    """Student vs teacher on held-out contexts."""
+
+    n_layers: int
+    teacher_layers: int
+    agreement: QuantizationReport
+    teacher_contexts_per_sec: float
+    student_contexts_per_sec: float
+
+    def __str__(self):
+        speedup = self.student_contexts_per_sec / self.teacher_contexts_per_sec
+        label_agreement = 1 - self.agreement.n_flips / max(self.agreement.n, 1)
+        return (
+            "Distillation check\n"
+            "-------------------\n"
+            f" layers: {self.n_layers} (teacher: {self.teacher_layers})\n"
+            f" held-out contexts: {self.agreement.n}\n"
+            f" pred1 max |diff|: {self.agreement.max_abs_diff:.4f}\n"
+            f" pred1 mean |diff|: {self.agreement.mean_abs_diff:.4f}\n"
+            f" label agreement at {self.agreement.threshold}: "
+            f"{label_agreement:.2%} ({self.agreement.n_flips} flips: "
+            f"+{self.agreement.flips_to_positive} / "
+            f"-{self.agreement.flips_to_negative})\n"
+            f" teacher: {self.teacher_contexts_per_sec:.1f} contexts/s\n"
+            f" student: {self.student_contexts_per_sec:.1f} contexts/s "
+            f"({speedup:.2f}x)\n"
+        )
+
+
+def _timed_predict(
+    texts: list[str], network_path: Path, weights_path: Path, batch_size: int
+) -> tuple[NDArray[np.float64], float]:
+    """Outputs for `texts` and contexts/s, excluding model load time."""
+    settings = TrainModelSettings.from_filename(weights_path)
+    text_settings = TextSettings(nwords=settings.refnwords, refset=settings.refset)
+    with InferencePool(
+        network_path, weights_path, text_settings,
+        batch_size=batch_size, dynamic_padding=True,
+    ) as pool:
+        start = time.perf_counter()
+        outputs = pool.predict(texts)
+        elapsed = time.perf_counter() - start
+    return outputs, len(texts) / elapsed
+
+
+def main() -> None:
+    """CLI entry point for onsides-distill."""
+    parser = argparse.ArgumentParser(
+        description="Distill a trained model into a smaller student."
+    )
+    parser.add_argument(
+        "--weights", type=Path, required=True, help="Teacher bestepoch-*.pth"
+    )
+    parser.add_argument(
+        "--network",
+        type=Path,
+        default=Path("models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract"),
+        help="Teacher's pretrained base model directory",
+    )
+    parser.add_argument(
+        "--matches", type=Path, required=True,
+        help="String-match Parquet whose contexts are used as transfer data",
+    )
+    parser.add_argument(
+        "--output-dir", type=Path, required=True,
+        help="Directory for the student network and weights",
+    )
+    parser.add_argument("--layers", type=int, default=4, help="Student layers")
+    parser.add_argument(
+        "--sample", type=int, default=200_000, help="Contexts to distill on"
+    )
+    parser.add_argument(
+        "--holdout", type=float, default=0.05,
+        help="Share of the sample held out for the comparison",
+    )
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=DEFAULT_RANDOM_SEED)
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+
+    torch.manual_seed(args.seed)
+    settings = TrainModelSettings.from_filename(args.weights)
+    texts = sample_contexts(args.matches, args.sample, args.seed)
+    n_holdout = max(1, int(len(texts) * args.holdout))
+    order = np.random.default_rng(args.seed).permutation(len(texts))
+    holdout = [texts[i] for i in order[:n_holdout]]
+    transfer = [texts[i] for i in order[n_holdout:]]
+    logger.info(f"Distilling on {len(transfer)} contexts, {n_holdout} held out")
+
+    teacher = load_encoder(args.network, args.weights)
+    student = make_student(teacher, args.layers)
+    distill(
+        teacher, student, args.network, transfer, settings.max_length,
+        epochs=args.epochs, learning_rate=args.learning_rate,
+        batch_size=args.batch_size,
+    )
+    student_network, student_weights = save_student(
+        student.cpu(), args.network, args.weights, args.output_dir
+    )
+
+    batch_size = settings.batch_size * 2
+    teacher_out, teacher_rate = _timed_predict(
+        holdout, args.network, args.weights, batch_size
+    )
+    student_out, student_rate = _timed_predict(
+        holdout, student_network, student_weights, batch_size
+    )
+    report = DistillationReport(
+        n_layers=args.layers,
+        teacher_layers=len(teacher.bert.encoder.layer),
+        agreement=compare_pred1(teacher_out[:, 1], student_out[:, 1]),
+        teacher_contexts_per_sec=teacher_rate,
+        student_contexts_per_sec=student_rate,
+    )
+    logger.info(f"\n{report}")
+    logger.info(f"Student: --network {student_network} --weights {student_weights}")
@@ -0,0 +1,554 @@
+"""
+features.py
+
+Pooled-embedding feature store for head-only retraining.
+
+The classification head of ClinicalBertClassifier is a single linear layer
+(plus ReLU) over BERT's pooled output. ``onsides-extract-features`` runs the
+frozen encoder once over a reference set or a string-match file and stores
+the pooled vectors as a memory-mapped float16 array next to the row keys;
+``onsides-train-head`` then trains the head, scores rows and sweeps the
+pred1 threshold from the store in seconds, without touching the encoder.
+
+A store is a directory with:
+
+- ``features.npy``: (n_rows, hidden_size) float16 pooled outputs
+- ``keys.parquet``: one row per feature row (the reference columns other
+  than the text, or the match ids)
+- ``meta.json``: the encoder and settings the features came from
+
+A head saved with ``--output`` gets a ``.meta.json`` next to it recording the
+encoder key of its training features; ``--score`` only accepts a match store
+built from the same encoder weights and max_length.
+
+Usage:
+    onsides-extract-features \\
+        --ref data/refs/ref14_nwords125_clinical_bert_reference_set_ALL.txt \\
+        --weights models/bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth \\
+        --output _onsides/features/ref14
+    onsides-train-head --features _onsides/features/ref14 \\
+        --output models/head-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth
+"""
+
+import argparse
+import logging
+import shutil
+from collections.abc import Iterable
+from dataclasses import dataclass
+from itertools import batched
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+from numpy.typing import NDArray
+from pydantic import BaseModel
+from torch import nn
+
+from onsides.clinicalbert import (
+    ClinicalBertClassifier,
+    Dataset,
+    LengthBucketBatchSampler,
+)
+from onsides.predict import TrainModelSettings
+from onsides.prediction_cache import model_cache_key
+from onsides.quantize import PRED1_THRESHOLD
+from onsides.train import (
+    DEFAULT_RANDOM_SEED,
+    LABELS,
+    atomic_torch_save,
+    split_train_val_test,
+)
+from onsides.vocab_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Texts tokenized and encoded per step; bounds memory on the match corpus
+DEFAULT_CHUNK_SIZE = 50_000
+
+_FEATURES_FILE = "features.npy"
+_KEYS_FILE = "keys.parquet"
+_META_FILE = "meta.json"
+
+
+class FeatureStoreMeta(BaseModel):
+    """Where a feature store's vectors came from."""
+
+    source: str
+    network_path: str
+    weights_path: str | None
+    max_length: int
+    hidden_size: int
+    n_rows: int
+    # `model_cache_key` of the weights and max_length; None for stores built
+    # before it was recorded
+    encoder_key: str | None = None
+
+
+class HeadMeta(BaseModel):
+    """Which feature store a retrained head was trained on."""
+
+    features_path: str
+    encoder_key: str | None
+
+    def check_store(self, store: "FeatureStore") -> None:
+        """Raise if `store` was not encoded like the head's training features."""
+        if self.encoder_key is None or store.meta.encoder_key != self.encoder_key:
+            raise ValueError(
+                f"Feature store {store.path} was not built with the encoder "
+                f"weights and max_length of {self.features_path}; rebuild both "
+                "with onsides-extract-features from the same --weights"
+            )
+
+
+@dataclass
+class FeatureStore:
+    """An opened feature store; `features` is memory-mapped read-only."""
+
+    path: Path
+    meta: FeatureStoreMeta
+    features: NDArray[np.float16]
+    keys: pd.DataFrame
+
+    @classmethod
+    def open(cls, path: Path) -> "FeatureStore":
+        path = Path(path)
+        meta = FeatureStoreMeta.model_validate_json((path / _META_FILE).read_text())
+        features = np.load(path / _FEATURES_FILE, mmap_mode="r")
+        if features.shape != (meta.n_rows, meta.hidden_size):
+            raise ValueError(
+                f"Feature store {path} is inconsistent: features have shape "
+                f"{features.shape}, metadata says ({meta.n_rows}, {meta.hidden_size})"
+            )
+        keys = pq.read_table(path / _KEYS_FILE).to_pandas()
+        return cls(path=path, meta=meta, features=features, keys=keys)
+
+
+def load_encoder(
+    network_path: Path, weights_path: Path | None = None
+) -> ClinicalBertClassifier:
+    """The pretrained model, with trained weights loaded if given."""
+    model = ClinicalBertClassifier(network_path)
+    if weights_path is not None:
+        state_dict = torch.load(weights_path, weights_only=True)
+        # Saved by older transformers versions, which kept it as a buffer
+        state_dict.pop("bert.embeddings.position_ids", None)
+        model.load_state_dict(state_dict)
+    return model
+
+
+def pooled_outputs(
+    model: ClinicalBertClassifier,
+    tokenizer_path: Path,
+    texts: list[str],
+    max_length: int,
+    batch_size: int,
+    device: torch.device | None = None,
+) -> NDArray[np.float32]:
+    """BERT's pooled output for each text, in input order.
+
+    Texts are batched by token length and padded per batch, as in
+    `evaluate(dynamic_padding=True)`.
+    """
+    model.eval()
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    bert = model.bert.to(device)
+
+    dataset = Dataset(texts, tokenizer_path, max_length, dynamic_padding=True)
+    pooled = np.empty((len(texts), bert.config.hidden_size), dtype=np.float32)
+    with torch.no_grad():
+        for indices in LengthBucketBatchSampler(dataset.lengths, batch_size):
+            inputs, _ = dataset.collate([dataset[i] for i in indices])
+            _, batch_pooled = bert(
+                input_ids=inputs["input_ids"].to(device),
+                attention_mask=inputs["attention_mask"].to(device),
+                return_dict=False,
+            )
+            pooled[indices] = batch_pooled.cpu().numpy()
+    return pooled
+
+
+def build_feature_store(
+    path: Path,
+    texts: Iterable[str],
+    keys: pa.Table,
+    network_path: Path,
+    weights_path: Path | None = None,
+    max_length: int = 256,
+    batch_size: int = 64,
+    source: str = "",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    device: torch.device | None = None,
+    digest_dir: Path = CACHE_DIR,
+) -> FeatureStore:
+    """Encode `texts` (one per row of `keys`) and write a store at `path`.
+
+    `texts` is consumed `chunk_size` at a time and written straight into
+    the memory-mapped array. The store is built in a temporary directory
+    and moved into place when complete, replacing any existing store. The
+    weights digest for the encoder key is remembered in `digest_dir`.
+    """
+    path = Path(path)
+    model = load_encoder(network_path, weights_path)
+    hidden_size = model.bert.config.hidden_size
+    n_rows = keys.num_rows
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    features = np.lib.format.open_memmap(
+        tmp_path / _FEATURES_FILE, mode="w+", dtype=np.float16,
+        shape=(n_rows, hidden_size),
+    )
+    start = 0
+    for chunk in batched(texts, chunk_size):
+        stop = start + len(chunk)
+        if stop > n_rows:
+            raise ValueError(f"More texts than the {n_rows} rows of keys")
+        features[start:stop] = pooled_outputs(
+            model, network_path, list(chunk), max_length, batch_size, device
+        )
+        logger.info(f"Encoded {stop}/{n_rows} texts")
+        start = stop
+    if start != n_rows:
+        raise ValueError(f"Got {start} texts for {n_rows} rows of keys")
+    features.flush()
+    del features
+
+    pq.write_table(keys, tmp_path / _KEYS_FILE)
+    meta = FeatureStoreMeta(
+        source=source,
+        network_path=str(network_path),
+        weights_path=None if weights_path is None else str(weights_path),
+        max_length=max_length,
+        hidden_size=hidden_size,
+        n_rows=n_rows,
+        encoder_key=model_cache_key(weights_path, max_length, digest_dir=digest_dir),
+    )
+    (tmp_path / _META_FILE).write_text(meta.model_dump_json(indent=2))
+
+    shutil.rmtree(path, ignore_errors=True)
+    tmp_path.rename(path)
+    logger.info(f"Wrote {n_rows} x {hidden_size} features to {path}")
+    return FeatureStore.open(path)
+
+
+def train_head(
+    features: NDArray[np.floating],
+    labels: NDArray[np.integer],
+    val_features: NDArray[np.floating],
+    val_labels: NDArray[np.integer],
+    init: nn.Linear | None = None,
+    epochs: int = 200,
+    learning_rate: float = 1e-3,
+    batch_size: int = 1024,
+    dropout: float = 0.5,
+    patience: int = 20,
+    seed: int = DEFAULT_RANDOM_SEED,
+) -> nn.Linear:
+    """Fit the classifier head on stored features.
+
+    Mirrors the full model's head (dropout, linear, ReLU, cross-entropy),
+    starting from `init` if given. Stops after `patience` epochs without a
+    lower validation loss and returns the best head.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.as_tensor(np.asarray(features, dtype=np.float32))
+    y = torch.as_tensor(np.asarray(labels), dtype=torch.long)
+    val_x = torch.as_tensor(np.asarray(val_features, dtype=np.float32))
+    val_y = torch.as_tensor(np.asarray(val_labels), dtype=torch.long)
+
+    linear = nn.Linear(x.shape[1], len(LABELS))
+    if init is not None:
+        linear.load_state_dict(init.state_dict())
+    head = nn.Sequential(nn.Dropout(dropout), linear, nn.ReLU())
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(head.parameters(), lr=learning_rate)
+
+    best_loss = None
+    best_state = linear.state_dict()
+    epochs_since_best = 0
+    for epoch in range(epochs):
+        head.train()
+        for batch in torch.randperm(len(x), generator=generator).split(batch_size):
+            optimizer.zero_grad()
+            loss = criterion(head(x[batch]), y[batch])
+            loss.backward()
+            optimizer.step()
+
+        head.eval()
+        with torch.no_grad():
+            val_loss = criterion(head(val_x), val_y).item()
+        if best_loss is None or val_loss < best_loss:
+            best_loss = val_loss
+            best_state = {k: v.clone() for k, v in linear.state_dict().items()}
+            epochs_since_best = 0
+        else:
+            epochs_since_best += 1
+            if epochs_since_best >= patience:
+                logger.info(f"Early stopping head training at epoch {epoch + 1}")
+                break
+    logger.info(f"Best head validation loss: {best_loss:.6f}")
+
+    linear.load_state_dict(best_state)
+    return linear
+
+
+def score_head(
+    linear: nn.Linear,
+    features: NDArray[np.floating],
+    chunk_rows: int = 65_536,
+) -> NDArray[np.float32]:
+    """(n, 2) model outputs (pred0, pred1) for stored features."""
+    weight = linear.weight.detach().cpu().numpy().T
+    bias = linear.bias.detach().cpu().numpy()
+    outputs = np.empty((len(features), len(LABELS)), dtype=np.float32)
+    for start in range(0, len(features), chunk_rows):
+        chunk = np.asarray(features[start : start + chunk_rows], dtype=np.float32)
+        outputs[start : start + len(chunk)] = np.maximum(chunk @ weight + bias, 0)
+    return outputs
+
+
+def threshold_sweep(
+    pred1: NDArray[np.floating],
+    labels: NDArray[np.integer],
+    thresholds: NDArray[np.floating] | None = None,
+) -> pd.DataFrame:
+    """Precision, recall, F1 and accuracy of `pred1 > threshold` per threshold.
+
+    Thresholds default to 101 evenly spaced values over the range of `pred1`
+    plus the release cutoff.
+    """
+    pred1 = np.asarray(pred1, dtype=np.float64)
+    labels = np.asarray(labels).astype(bool)
+    if thresholds is None:
+        thresholds = np.linspace(pred1.min(), pred1.max(), 101)
+        thresholds = np.unique(np.append(thresholds, PRED1_THRESHOLD))
+
+    positive = pred1[None, :] > np.asarray(thresholds)[:, None]
+    tp = (positive & labels).sum(axis=1)
+    fp = (positive & ~labels).sum(axis=1)
+    fn = (~positive & labels).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), np.nan)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), np.nan)
+        f1 = np.where(
+            precision + recall > 0,
+            2 * precision * recall / (precision + recall),
+            0.0,
+        )
+    return pd.DataFrame({
+        "threshold": thresholds,
+        "n_positive": positive.sum(axis=1),
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "accuracy": (positive == labels).mean(axis=1),
+    })
+
+
+def save_head_model(
+    linear: nn.Linear,
+    network_path: Path,
+    weights_path: Path | None,
+    output_path: Path,
+    meta: HeadMeta | None = None,
+) -> Path:
+    """Save encoder weights plus the retrained head as a full model `.pth`.
+
+    The result loads like any trained model (e.g. with `predict`). `meta`
+    is written next to it (see `head_meta_path`).
+    """
+    model = load_encoder(network_path, weights_path)
+    model.linear.load_state_dict(linear.state_dict())
+    atomic_torch_save(model.state_dict(), Path(output_path))
+    if meta is not None:
+        head_meta_path(output_path).write_text(meta.model_dump_json(indent=2))
+    logger.info(f"Saved model with retrained head to {output_path}")
+    return Path(output_path)
+
+
+def head_meta_path(head_path: Path) -> Path:
+    """Where the `HeadMeta` of a saved head is written."""
+    return Path(head_path).with_suffix(".meta.json")
+
+
+def _head_splits(
+    store: FeatureStore, refsource: str, seed: int, split_method: str
+) -> tuple[NDArray[np.intp], NDArray[np.intp], NDArray[np.intp]]:
+    """Row positions of the train/val/test splits of a reference store."""
+    keys = store.keys.assign(_row=np.arange(len(store.keys)))
+    if refsource != "all":
+        if "source_method" not in keys.columns:
+            raise ValueError(
+                f"Feature store {store.path} has no source_method column; "
+                "only --refsource all is supported"
+            )
+        keys = keys[keys["source_method"] == refsource]
+    splits = split_train_val_test(keys, seed, split_method)
+    return tuple(df["_row"].to_numpy() for df in splits)
+
+
+def extract_main() -> None:
+    """CLI entry point for onsides-extract-features."""
+    parser = argparse.ArgumentParser(
+        description="Run the frozen encoder once and store pooled embeddings."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--ref", type=Path, help="Reference CSV")
+    source.add_argument(
+        "--matches", type=Path,
+        help="String-match Parquet (match_id, text_id, term_id, term, context)",
+    )
+    parser.add_argument("--output", type=Path, required=True, help="Store directory")
+    parser.add_argument(
+        "--network",
+        type=Path,
+        default=Path("models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract"),
+        help="Pretrained base model directory",
+    )
+    parser.add_argument(
+        "--weights", type=Path, default=None,
+        help="Trained bestepoch-*.pth whose encoder to use (default: pretrained)",
+    )
+    parser.add_argument(
+        "--max-length", type=int, default=None,
+        help="Max token length (default: from --weights, else 256)",
+    )
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+
+    max_length = args.max_length
+    if max_length is None:
+        max_length = 256
+        if args.weights is not None:
+            max_length = TrainModelSettings.from_filename(args.weights).max_length
+
+    if args.ref is not None:
+        df = pd.read_csv(args.ref)
+        texts = df["string"].tolist()
+        keys = pa.Table.from_pandas(df.drop(columns=["string"]), preserve_index=False)
+        source_path = args.ref
+    else:
+        input_file = pq.ParquetFile(args.matches)
+        keys = pq.read_table(
+            args.matches, columns=["match_id", "text_id", "term_id"]
+        )
+        texts = (
+            text
+            for batch in input_file.iter_batches(columns=["context"])
+            for text in batch.column("context").to_pylist()
+        )
+        source_path = args.matches
+
+    build_feature_store(
+        args.output, texts, keys, args.network, args.weights,
+        max_length=max_length, batch_size=args.batch_size,
+        source=str(source_path),
+    )
+
+
+def train_head_main() -> None:
+    """CLI entry point for onsides-train-head."""
+    parser = argparse.ArgumentParser(
+        description="Train the classifier head and sweep the pred1 threshold "
+        "from a reference-set feature store."
+    )
+    parser.add_argument(
+        "--features", type=Path, required=True,
+        help="Feature store built with onsides-extract-features --ref",
+    )
+    parser.add_argument(
+        "--refsource", default="all", choices=["all", "exact", "deepcadrme"]
+    )
+    parser.add_argument("--split-method", default="24")
+    parser.add_argument("--seed", type=int, default=DEFAULT_RANDOM_SEED)
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument(
+        "--output", type=Path, default=None,
+        help="Write encoder + retrained head as a full model .pth",
+    )
+    parser.add_argument(
+        "--sweep-output", type=Path, default=None,
+        help="Write the test-split threshold sweep to this CSV",
+    )
+    parser.add_argument(
+        "--score", type=Path, default=None,
+        help="Also score this match feature store with the new head",
+    )
+    parser.add_argument(
+        "--score-output", type=Path, default=None,
+        help="Parquet for --score results (match keys + pred0/pred1)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+    if args.score is not None and args.score_output is None:
+        parser.error("--score requires --score-output")
+
+    store = FeatureStore.open(args.features)
+    head_meta = HeadMeta(
+        features_path=str(args.features), encoder_key=store.meta.encoder_key
+    )
+    # Checked before training, so a mismatched store fails fast
+    match_store = None
+    if args.score is not None:
+        match_store = FeatureStore.open(args.score)
+        head_meta.check_store(match_store)
+
+    labels = np.array([LABELS[c] for c in store.keys["class"]])
+    train_rows, val_rows, test_rows = _head_splits(
+        store, args.refsource, args.seed, args.split_method
+    )
+
+    init = None
+    if store.meta.weights_path is not None:
+        init = load_encoder(
+            Path(store.meta.network_path), Path(store.meta.weights_path)
+        ).linear
+    linear = train_head(
+        store.features[train_rows], labels[train_rows],
+        store.features[val_rows], labels[val_rows],
+        init=init, epochs=args.epochs, learning_rate=args.learning_rate,
+        seed=args.seed,
+    )
+
+    pred1 = score_head(linear, store.features[test_rows])[:, 1]
+    sweep = threshold_sweep(pred1, labels[test_rows])
+    best = sweep.loc[sweep["f1"].idxmax()]
+    logger.info(
+        f"Test split ({len(test_rows)} rows): best F1 {best.f1:.4f} at "
+        f"pred1 > {best.threshold:.4f} "
+        f"(precision {best.precision:.4f}, recall {best.recall:.4f})"
+    )
+    if args.sweep_output is not None:
+        args.sweep_output.parent.mkdir(parents=True, exist_ok=True)
+        sweep.to_csv(args.sweep_output, index=False)
+
+    if args.output is not None:
+        weights_path = store.meta.weights_path
+        save_head_model(
+            linear,
+            Path(store.meta.network_path),
+            None if weights_path is None else Path(weights_path),
+            args.output,
+            head_meta,
+        )
+
+    if match_store is not None:
+        outputs = score_head(linear, match_store.features)
+        table = pa.Table.from_pandas(match_store.keys, preserve_index=False)
+        table = table.append_column("pred0", pa.array(outputs[:, 0]))
+        table = table.append_column("pred1", pa.array(outputs[:, 1]))
+        pq.write_table(table, args.score_output)
+        logger.info(f"Scored {len(outputs)} matches to {args.score_output}")
@@ -0,0 +1,68 @@
+import multiprocessing
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from multiprocessing.pool import Pool
+from typing import TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def process_pool(
+    n_workers: int,
+    initializer: Callable | None = None,
+    initargs: tuple = (),
+    start_method: str | None = None,
+) -> Pool:
+    """
+    Create a process pool whose workers receive `initargs` once at startup.
+
+    Uses the fork start method where available, so large read-only objects
+    (e.g. a compiled Aho-Corasick automaton) are shared copy-on-write with the
+    workers instead of being serialized. Elsewhere the arguments are pickled
+    once per worker. Pass `start_method="spawn"` for workers that run
+    multithreaded libraries such as PyTorch, which are not fork-safe.
+    """
+    if start_method is not None:
+        context = multiprocessing.get_context(start_method)
+    elif "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("spawn")
+    return context.Pool(n_workers, initializer=initializer, initargs=initargs)
+
+
+def shard(items: Sequence[T], n_shards: int) -> list[Sequence[T]]:
+    """
+    Split `items` into at most `n_shards` contiguous, similarly sized slices.
+    Concatenating the shards in order gives back the original sequence.
+    """
+    n_shards = max(1, min(n_shards, len(items)))
+    size, remainder = divmod(len(items), n_shards)
+    shards = list()
+    start = 0
+    for i in range(n_shards):
+        stop = start + size + (1 if i < remainder else 0)
+        shards.append(items[start:stop])
+        start = stop
+    return shards
+
+
+def imap_bounded(
+    pool: Pool,
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_pending: int,
+) -> Iterator[R]:
+    """
+    Like `pool.imap`, but pulls from `items` lazily and keeps at most
+    `max_pending` tasks in flight, so a large input stream is never fully
+    materialized in the task queue. Results are yielded in input order.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
@@ -1,15 +1,36 @@
+import argparse
+import itertools
+import json
 import logging
+import os
+import shutil
+import time
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import torch
 from numpy._typing import NDArray
 from pydantic import BaseModel
 
+from onsides.backends import BACKENDS, Backend, load_backend
+from onsides.cascade import Prefilter
 from onsides.clinicalbert import ClinicalBertClassifier, evaluate
+from onsides.parallel import process_pool, shard
+from onsides.prediction_cache import PredictionCache, model_cache_key
+from onsides.quantize import QUANTIZED_CACHE_DIR, load_quantized_weights
+from onsides.server import ServerClient, served_model
+from onsides.vocab_cache import CACHE_DIR, atomic_write, content_key
 
 logger = logging.getLogger(__name__)
 
+PREDICTION_COLUMNS = ["pred0", "pred1"]
+
+# Texts per inference chunk; bounds memory independently of corpus size
+DEFAULT_CHUNK_SIZE = 50_000
+
 
 class TextSettings(BaseModel):
     nwords: int = 125
@@ -22,33 +43,583 @@ def predict(
     weights_path: Path,
     text_settings: TextSettings | None = None,
     batch_size: int | None = None,
+    dynamic_padding: bool = False,
+    quantize: bool = False,
+    quantized_cache_dir: Path | None = QUANTIZED_CACHE_DIR,
+    backend: Backend = "eager",
+    n_workers: int = 1,
+    threads_per_worker: int | None = None,
+    prediction_cache: Path | None = None,
+    prefilter: Path | None = None,
+    use_server: bool = False,
+    server_url: str | None = None,
+    digest_dir: Path = CACHE_DIR,
 ) -> NDArray[np.float64]:
+    """Score `texts` with the trained weights.
+
+    With `quantize`, the BERT linear layers run as dynamic int8 on CPU (see
+    `onsides.quantize`); quantized weights are cached in `quantized_cache_dir`.
+    `backend` selects the runtime (see `onsides.backends`). With
+    `n_workers > 1`, texts are sharded over CPU worker processes (see
+    `InferencePool`). With a `prediction_cache` database, previously scored
+    texts are looked up instead of re-run (see `onsides.prediction_cache`).
+    With a `prefilter` (see `onsides.cascade`), texts it rules out get zero
+    outputs without running BERT.
+
+    With `use_server`, if a model server (see `onsides.server`) is running
+    at `server_url` (default: ``$ONSIDES_MODEL_SERVER`` or localhost:8765)
+    with the same weights contents, variant and prefilter, the texts are sent
+    there instead of loading the model. The batching, worker and cache
+    options are then the server's, not these arguments. Weights digests for
+    that check are remembered in `digest_dir`.
+    """
+    if use_server:
+        client = ServerClient(server_url)
+        model = served_model(
+            network_path, weights_path, quantize, backend, prefilter,
+            digest_dir,
+        )
+        if client.serves(model):
+            validate_settings(
+                TrainModelSettings.from_filename(weights_path),
+                text_settings or TextSettings(),
+            )
+            print(f"Evaluating text with the model server at {client.url}...")
+            return client.predict(texts)
+
+    print("Evaluating text with the model...")
+    with InferencePool(
+        network_path, weights_path, text_settings, batch_size, dynamic_padding,
+        quantize, quantized_cache_dir, backend, n_workers, threads_per_worker,
+        prediction_cache, prefilter,
+    ) as pool:
+        return pool.predict(texts)
+
+
+def load_model(
+    network_path: Path,
+    weights_path: Path,
+    text_settings: TextSettings | None = None,
+    quantize: bool = False,
+    quantized_cache_dir: Path | None = QUANTIZED_CACHE_DIR,
+    backend: Backend = "eager",
+) -> tuple[torch.nn.Module, "TrainModelSettings"]:
+    """Load trained weights, checking them against the example settings.
+
+    Returns the model for `backend`, callable like `ClinicalBertClassifier`.
+    """
+    if quantize and backend != "eager":
+        raise ValueError("quantize is only supported with the eager backend")
     if text_settings is None:
         text_settings = TextSettings()
 
     train_settings = TrainModelSettings.from_filename(weights_path)
     validate_settings(train_settings, text_settings)
 
-    if batch_size is None:
-        batch_size = train_settings.batch_size * 2
-
     print(f"Loading model from {network_path}")
     model = ClinicalBertClassifier(network_path)
 
+    if quantize:
+        print(f"Loading int8-quantized model data from {weights_path}")
+        load_quantized_weights(model, weights_path, quantized_cache_dir)
+        return model, train_settings
+
     print(f"Loading model data from {weights_path}")
     state_dict = torch.load(weights_path, weights_only=True)
-    state_dict.pop("bert.embeddings.position_ids")  # Error if included
+    # Saved by older transformers versions, which kept it as a buffer
+    state_dict.pop("bert.embeddings.position_ids", None)
     model.load_state_dict(state_dict)
+    model = load_backend(model, weights_path, backend, train_settings.max_length)
+    return model, train_settings
 
-    print("Evaluating text with the model...")
-    outputs = evaluate(
-        model,
-        network_path,
-        texts,
-        max_length=train_settings.max_length,
-        batch_size=batch_size,
+
+class InferencePool:
+    """
+    Scores texts with one model copy per worker process.
+
+    With `n_workers > 1`, each worker is a spawned process that pins PyTorch
+    to `threads_per_worker` intra-op threads (default: the CPU count split
+    evenly) and loads its own model. `predict` splits the texts into
+    contiguous shards, a few per worker so that faster workers pick up the
+    slack, and stacks the outputs back in input order. Workers always run on
+    CPU. With `n_workers == 1`, the model runs in this process.
+
+    Duplicate texts within a `predict` call are scored once and the outputs
+    copied back to every occurrence.
+
+    With a `prefilter` path, the saved `Prefilter` screens the distinct
+    texts first; those below its cutoff get (0.0, 0.0) without BERT.
+
+    With a `prediction_cache` path, texts are then looked up in that
+    `PredictionCache` and only the misses are scored (and then stored).
+    """
+
+    def __init__(
+        self,
+        network_path: Path,
+        weights_path: Path,
+        text_settings: TextSettings | None = None,
+        batch_size: int | None = None,
+        dynamic_padding: bool = False,
+        quantize: bool = False,
+        quantized_cache_dir: Path | None = QUANTIZED_CACHE_DIR,
+        backend: Backend = "eager",
+        n_workers: int = 1,
+        threads_per_worker: int | None = None,
+        prediction_cache: Path | None = None,
+        prefilter: Path | None = None,
+    ):
+        self.n_workers = n_workers
+        self.n_texts = 0
+        self.n_unique = 0
+        self.n_prefiltered = 0
+        self._prefilter = None if prefilter is None else Prefilter.load(prefilter)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._scoring_seconds = 0.0
+        self._cache = None
+        if prediction_cache is not None:
+            max_length = TrainModelSettings.from_filename(weights_path).max_length
+            self._model_key = model_cache_key(
+                weights_path, max_length, quantize, backend,
+                digest_dir=Path(prediction_cache).parent,
+            )
+            self._cache = PredictionCache(prediction_cache)
+        load_args = (
+            network_path, weights_path, text_settings, quantize,
+            quantized_cache_dir, backend,
+        )
+        eval_kwargs = {
+            "batch_size": batch_size,
+            "dynamic_padding": dynamic_padding,
+            "device": _device(quantize, backend),
+        }
+        self._pool = None
+        self._restore_threads = None
+        # In-process model; kept per pool so that pools can coexist (e.g. a
+        # model server alongside a one-off predict())
+        self._state: dict = dict()
+        if n_workers == 1:
+            if threads_per_worker is not None:
+                self._restore_threads = torch.get_num_threads()
+                torch.set_num_threads(threads_per_worker)
+            _init_inference_worker(load_args, None, eval_kwargs, self._state)
+            return
+
+        if threads_per_worker is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // n_workers)
+        self.threads_per_worker = threads_per_worker
+        eval_kwargs["device"] = torch.device("cpu")
+        self._pool = process_pool(
+            n_workers,
+            _init_inference_worker,
+            (load_args, threads_per_worker, eval_kwargs),
+            start_method="spawn",
+        )
+
+    def predict(
+        self, texts: list[str], token_ids: list[list[int]] | None = None
+    ) -> NDArray[np.float64]:
+        """Score `texts`, or their pre-tokenized `token_ids` if given."""
+        if len(texts) == 0:
+            return np.empty((0, len(PREDICTION_COLUMNS)), dtype=np.float32)
+
+        # Boilerplate paragraphs repeat across labels: score each text once
+        unique_texts, inverse = unique_with_inverse(texts)
+        self.n_texts += len(texts)
+        self.n_unique += len(unique_texts)
+        logger.info(
+            f"Scoring {len(unique_texts)} unique of {len(texts)} texts "
+            f"(dedup ratio {len(texts) / len(unique_texts):.2f}x)"
+        )
+        if token_ids is not None:
+            first_seen = np.unique(inverse, return_index=True)[1]
+            token_ids = [token_ids[i] for i in first_seen]
+        return self._predict_unique(unique_texts, token_ids)[inverse]
+
+    def _predict_unique(
+        self, texts: list[str], token_ids: list[list[int]] | None
+    ) -> NDArray[np.float64]:
+        if self._prefilter is None:
+            return self._predict_cached(texts, token_ids)
+
+        keep = np.flatnonzero(self._prefilter.keep(texts))
+        n_skipped = len(texts) - len(keep)
+        self.n_prefiltered += n_skipped
+        logger.info(
+            f"Prefilter: skipping BERT for {n_skipped}/{len(texts)} texts "
+            f"({n_skipped / len(texts):.1%})"
+        )
+        outputs = np.zeros((len(texts), len(PREDICTION_COLUMNS)), dtype=np.float32)
+        if len(keep) > 0:
+            kept_ids = None if token_ids is None else [token_ids[i] for i in keep]
+            outputs[keep] = self._predict_cached([texts[i] for i in keep], kept_ids)
+        return outputs
+
+    def _predict_cached(
+        self, texts: list[str], token_ids: list[list[int]] | None
+    ) -> NDArray[np.float64]:
+        if self._cache is None:
+            return self._score(texts, token_ids)
+
+        outputs, found = self._cache.get(self._model_key, texts)
+        missing = np.flatnonzero(~found)
+        if len(missing) > 0:
+            missing_texts = [texts[i] for i in missing]
+            missing_ids = None
+            if token_ids is not None:
+                missing_ids = [token_ids[i] for i in missing]
+            start = time.perf_counter()
+            outputs[missing] = self._score(missing_texts, missing_ids)
+            self._scoring_seconds += time.perf_counter() - start
+            self._cache.put(self._model_key, missing_texts, outputs[missing])
+
+        n_hits = len(texts) - len(missing)
+        self.cache_hits += n_hits
+        self.cache_misses += len(missing)
+        logger.info(
+            f"Prediction cache: {n_hits}/{len(texts)} hits "
+            f"({n_hits / len(texts):.1%}), scored {len(missing)}"
+        )
+        return outputs
+
+    def _score(
+        self, texts: list[str], token_ids: list[list[int]] | None
+    ) -> NDArray[np.float64]:
+        if self._pool is None:
+            return _predict_in_worker(texts, token_ids, self._state)
+        n_shards = self.n_workers * 4
+        id_shards = (
+            [None] * n_shards if token_ids is None else shard(token_ids, n_shards)
+        )
+        shards = zip(shard(texts, n_shards), id_shards)
+        return np.vstack(self._pool.starmap(_predict_in_worker, shards))
+
+    def close(self) -> None:
+        if self.n_unique > 0:
+            logger.info(
+                f"Scored {self.n_unique} unique of {self.n_texts} texts "
+                f"(dedup ratio {self.n_texts / self.n_unique:.2f}x)"
+            )
+        if self._prefilter is not None and self.n_unique > 0:
+            logger.info(
+                f"Prefilter skipped BERT for {self.n_prefiltered} of "
+                f"{self.n_unique} unique texts "
+                f"({self.n_prefiltered / self.n_unique:.1%})"
+            )
+        if self._cache is not None:
+            self._log_cache_summary()
+            self._cache.close()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        if self._restore_threads is not None:
+            torch.set_num_threads(self._restore_threads)
+        self._state.clear()
+
+    def _log_cache_summary(self) -> None:
+        total = self.cache_hits + self.cache_misses
+        if total == 0:
+            return
+        summary = (
+            f"Prediction cache total: {self.cache_hits}/{total} hits "
+            f"({self.cache_hits / total:.1%})"
+        )
+        if self.cache_misses > 0:
+            # Estimated at the measured scoring rate for the misses
+            saved = self.cache_hits * self._scoring_seconds / self.cache_misses
+            summary += f", ~{saved:.1f}s of inference saved"
+        logger.info(summary)
+
+    def __enter__(self) -> "InferencePool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def unique_with_inverse(texts: Iterable[str]) -> tuple[list[str], NDArray[np.intp]]:
+    """Distinct texts in first-seen order, and each text's index into them.
+
+    `np.array(unique)[inverse]` reproduces the input.
+    """
+    index: dict[str, int] = dict()
+    inverse = np.fromiter(
+        (index.setdefault(text, len(index)) for text in texts), dtype=np.intp
+    )
+    return list(index), inverse
+
+
+_worker_state: dict = {}
+
+
+def _init_inference_worker(
+    load_args: tuple,
+    n_threads: int | None,
+    eval_kwargs: dict,
+    state: dict | None = None,
+) -> None:
+    if state is None:
+        state = _worker_state
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+    model, train_settings = load_model(*load_args)
+    eval_kwargs = dict(eval_kwargs)
+    if eval_kwargs["batch_size"] is None:
+        eval_kwargs["batch_size"] = train_settings.batch_size * 2
+    state["model"] = model
+    state["network_path"] = load_args[0]
+    state["max_length"] = train_settings.max_length
+    state["eval_kwargs"] = eval_kwargs
+
+
+def _predict_in_worker(
+    texts: list[str],
+    token_ids: list[list[int]] | None = None,
+    state: dict | None = None,
+) -> NDArray[np.float64]:
+    if state is None:
+        state = _worker_state
+    return evaluate(
+        state["model"],
+        state["network_path"],
+        list(texts),
+        max_length=state["max_length"],
+        token_ids=None if token_ids is None else list(token_ids),
+        **state["eval_kwargs"],
     )
-    return outputs
+
+
+class TuningResult(BaseModel):
+    n_workers: int
+    threads_per_worker: int
+    contexts_per_sec: float
+
+
+def autotune_workers(
+    texts: list[str],
+    network_path: Path,
+    weights_path: Path,
+    text_settings: TextSettings | None = None,
+    candidates: list[tuple[int, int]] | None = None,
+    **pool_kwargs,
+) -> list[TuningResult]:
+    """Time `texts` under each (n_workers, threads_per_worker) split.
+
+    Candidates default to splitting every core of this machine between 1, 2,
+    4, ... workers. Each configuration scores the sample once to warm up
+    (worker start-up, model load, thread pools) and once timed. Returns the
+    results fastest first.
+    """
+    if candidates is None:
+        candidates = worker_thread_splits(os.cpu_count() or 1)
+
+    results = list()
+    for n_workers, threads in candidates:
+        with InferencePool(
+            network_path, weights_path, text_settings,
+            n_workers=n_workers, threads_per_worker=threads, **pool_kwargs,
+        ) as pool:
+            pool.predict(texts)
+            start = time.perf_counter()
+            pool.predict(texts)
+            elapsed = time.perf_counter() - start
+        result = TuningResult(
+            n_workers=n_workers,
+            threads_per_worker=threads,
+            contexts_per_sec=len(texts) / elapsed,
+        )
+        logger.info(
+            f"{n_workers} workers x {threads} threads: "
+            f"{result.contexts_per_sec:.1f} contexts/s"
+        )
+        results.append(result)
+    return sorted(results, key=lambda r: r.contexts_per_sec, reverse=True)
+
+
+def worker_thread_splits(n_cores: int) -> list[tuple[int, int]]:
+    """(n_workers, threads_per_worker) pairs using all `n_cores`."""
+    splits = list()
+    n_workers = 1
+    while n_workers <= n_cores:
+        splits.append((n_workers, n_cores // n_workers))
+        n_workers *= 2
+    if splits[-1][0] != n_cores:
+        splits.append((n_cores, 1))
+    return splits
+
+
+def iter_predictions(
+    texts: Iterable[str],
+    network_path: Path,
+    weights_path: Path,
+    text_settings: TextSettings | None = None,
+    batch_size: int | None = None,
+    dynamic_padding: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    quantize: bool = False,
+    backend: Backend = "eager",
+    n_workers: int = 1,
+    threads_per_worker: int | None = None,
+    prediction_cache: Path | None = None,
+    prefilter: Path | None = None,
+) -> Iterator[NDArray[np.float64]]:
+    """Like `predict`, but consumes `texts` lazily, `chunk_size` at a time.
+
+    Yields one (n, 2) output array per chunk, so memory use is bounded by the
+    chunk size rather than by the number of texts.
+    """
+    with InferencePool(
+        network_path, weights_path, text_settings, batch_size, dynamic_padding,
+        quantize, backend=backend, n_workers=n_workers,
+        threads_per_worker=threads_per_worker,
+        prediction_cache=prediction_cache, prefilter=prefilter,
+    ) as pool:
+        for chunk in itertools.batched(texts, chunk_size):
+            yield pool.predict(list(chunk))
+
+
+def predict_parquet(
+    input_path: Path,
+    output_path: Path,
+    network_path: Path,
+    weights_path: Path,
+    text_column: str = "context",
+    text_settings: TextSettings | None = None,
+    batch_size: int | None = None,
+    dynamic_padding: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    quantize: bool = False,
+    backend: Backend = "eager",
+    n_workers: int = 1,
+    threads_per_worker: int | None = None,
+    prediction_cache: Path | None = None,
+    token_ids_column: str | None = None,
+    prefilter: Path | None = None,
+    digest_dir: Path = CACHE_DIR,
+) -> int:
+    """Score the `text_column` of a Parquet file, streaming in chunks.
+
+    Writes every input column plus `pred0`/`pred1` to `output_path`. Each
+    finished chunk is first saved as a part file in `{output_path}.parts/`;
+    rerunning after a crash skips the chunks that already have a part, and
+    the parts are only merged (and removed) once every chunk is done. Parts
+    are only reused by a run over the same input contents, weights and
+    inference options; content digests are remembered in `digest_dir`.
+    Repeated contexts within a chunk are scored once; with a
+    `prediction_cache`, repeats across chunks and releases are looked up.
+    With `token_ids_column` (the `input_ids` written by string matching with
+    a `WindowEncoder`), those ids are scored instead of re-tokenizing the
+    texts; the column is not copied to the output. With a `prefilter`,
+    matches it rules out are written with pred0 = pred1 = 0.0. Returns the
+    number of rows written.
+    """
+    input_file = pq.ParquetFile(input_path)
+    parts_dir = Path(f"{output_path}.parts")
+    max_length = TrainModelSettings.from_filename(weights_path).max_length
+    run = {
+        "num_rows": input_file.metadata.num_rows,
+        "chunk_size": chunk_size,
+        "input": content_key([input_path], cache_dir=digest_dir),
+        "model": model_cache_key(
+            weights_path, max_length, quantize, backend, digest_dir=digest_dir
+        ),
+        "network": str(Path(network_path).resolve()),
+        "text_column": text_column,
+        "text_settings": None if text_settings is None else text_settings.model_dump(),
+        "token_ids_column": token_ids_column,
+        "prefilter": None if prefilter is None
+        else content_key([prefilter], cache_dir=digest_dir),
+    }
+    _prepare_parts_dir(parts_dir, run)
+
+    pool = None
+    part_paths = list()
+    try:
+        for i, batch in enumerate(input_file.iter_batches(batch_size=chunk_size)):
+            part_path = parts_dir / f"part-{i:06d}.parquet"
+            part_paths.append(part_path)
+            if part_path.exists():
+                logger.info(f"Skipping completed chunk {i} ({part_path})")
+                continue
+
+            if pool is None:
+                pool = InferencePool(
+                    network_path, weights_path, text_settings, batch_size,
+                    dynamic_padding, quantize, backend=backend,
+                    n_workers=n_workers, threads_per_worker=threads_per_worker,
+                    prediction_cache=prediction_cache, prefilter=prefilter,
+                )
+
+            token_ids = None
+            if token_ids_column is not None:
+                token_ids = batch.column(token_ids_column).to_pylist()
+                batch = batch.drop_columns([token_ids_column])
+            outputs = pool.predict(batch.column(text_column).to_pylist(), token_ids)
+            table = pa.Table.from_batches([batch])
+            for j, name in enumerate(PREDICTION_COLUMNS):
+                table = table.append_column(
+                    name, pa.array(outputs[:, j], pa.float32())
+                )
+            _atomic_write_parquet(table, part_path)
+            logger.info(f"Finished chunk {i} ({batch.num_rows} rows)")
+    finally:
+        if pool is not None:
+            pool.close()
+
+    schema = input_file.schema_arrow
+    if token_ids_column is not None:
+        schema = schema.remove(schema.get_field_index(token_ids_column))
+    for name in PREDICTION_COLUMNS:
+        schema = schema.append(pa.field(name, pa.float32()))
+    n_rows = _merge_parts(part_paths, output_path, schema)
+    shutil.rmtree(parts_dir)
+    return n_rows
+
+
+def _device(quantize: bool, backend: Backend) -> torch.device | None:
+    """Quantized and serialized-graph models only run on CPU."""
+    if quantize or backend != "eager":
+        return torch.device("cpu")
+    return None
+
+
+def _prepare_parts_dir(parts_dir: Path, run: dict) -> None:
+    """Create `parts_dir`, discarding parts left over from a different run.
+
+    `run` describes the chunking, input and model; it is stored in
+    ``chunking.json`` and parts are kept only if it is unchanged.
+    """
+    chunking_path = parts_dir / "chunking.json"
+    if parts_dir.exists():
+        try:
+            previous = json.loads(chunking_path.read_text())
+        except (OSError, ValueError):
+            previous = None
+        if previous == run:
+            logger.info(f"Resuming from partial output in {parts_dir}")
+            return
+        logger.warning(f"Discarding partial output in {parts_dir}")
+        shutil.rmtree(parts_dir)
+    parts_dir.mkdir(parents=True)
+    chunking_path.write_text(json.dumps(run))
+
+
+def _merge_parts(part_paths: list[Path], output_path: Path, schema: pa.Schema) -> int:
+    """Concatenate part files into `output_path`, one part in memory at a time."""
+    tmp_path = Path(f"{output_path}.tmp")
+    n_rows = 0
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for part_path in part_paths:
+            table = pq.read_table(part_path, schema=schema)
+            writer.write_table(table)
+            n_rows += table.num_rows
+    tmp_path.replace(output_path)
+    return n_rows
+
+
+def _atomic_write_parquet(table: pa.Table, path: Path) -> None:
+    atomic_write(path, lambda f: pq.write_table(table, f))
 
 
 class TrainModelSettings(BaseModel):
@@ -64,15 +635,20 @@ class TrainModelSettings(BaseModel):
     lr: str
     max_length: int
     batch_size: int
+    # Set when the effective batch was accumulated over smaller micro-batches
+    micro_batch_size: int | None = None
 
     @classmethod
     def from_filename(cls, model_filepath: Path) -> "TrainModelSettings":
         splits = model_filepath.stem.split("_")
+        micro_batch_size = None
+        if len(splits) == 9 and splits[8].removeprefix("mb").isdigit():
+            micro_batch_size = int(splits.pop().removeprefix("mb"))
         if len(splits) != 8:
             raise Exception(
                 "Model filename not in format expected: {prefix}_{refset}_"
                 "{np_random_seed}_{split_method}_{EPOCHS}_{LR}_{max_length}_"
-                "{batch_size}.pth"
+                "{batch_size}[_mb{micro_batch_size}].pth"
             )
 
         prefix = splits[0]
@@ -92,6 +668,7 @@ class TrainModelSettings(BaseModel):
             lr=splits[5],
             max_length=int(splits[6]),
             batch_size=int(splits[7]),
+            micro_batch_size=micro_batch_size,
         )
 
     def __str__(self):
@@ -110,6 +687,10 @@ class TrainModelSettings(BaseModel):
             f" LR: {self.lr}\n"
             f" max_length: {self.max_length}\n"
             f" batch_size: {self.batch_size}\n"
+            + (
+                f" micro_batch_size: {self.micro_batch_size}\n"
+                if self.micro_batch_size is not None else ""
+            )
         )
 
 
@@ -188,6 +769,74 @@ def build_results_path(
         f"{model_settings.refnwords}-{model_settings.refsource}_"
         f"{model_settings.np_random_seed}_{model_settings.split_method}_"
         f"{model_settings.epochs}_{model_settings.lr}_"
-        f"{model_settings.max_length}_{model_settings.batch_size}.csv.gz"
+        f"{model_settings.max_length}_{model_settings.batch_size}"
+        + (
+            f"_mb{model_settings.micro_batch_size}"
+            if model_settings.micro_batch_size is not None else ""
+        )
+        + ".csv.gz"
     )
     return example_settings._path.parent / filename
+
+
+def tune_main() -> None:
+    """CLI entry point for onsides-tune-inference."""
+    parser = argparse.ArgumentParser(
+        description="Find the worker/thread split that scores contexts fastest "
+        "on this machine."
+    )
+    parser.add_argument(
+        "--weights", type=Path, required=True, help="Trained bestepoch-*.pth"
+    )
+    parser.add_argument(
+        "--network",
+        type=Path,
+        default=Path("models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract"),
+        help="Pretrained base model directory",
+    )
+    parser.add_argument(
+        "--input", type=Path, required=True,
+        help="Parquet file with a 'context' column (e.g. a sentences_rx file)",
+    )
+    parser.add_argument(
+        "--sample", type=int, default=2_000,
+        help="Number of contexts to time each split on (default: 2000)",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1_000, help="Inference batch size"
+    )
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+
+    settings = TrainModelSettings.from_filename(args.weights)
+    first_rows = next(
+        pq.ParquetFile(args.input).iter_batches(
+            batch_size=args.sample, columns=["context"]
+        )
+    )
+    texts = first_rows.column("context").to_pylist()
+    results = autotune_workers(
+        texts,
+        args.network,
+        args.weights,
+        TextSettings(nwords=settings.refnwords, refset=settings.refset),
+        batch_size=args.batch_size,
+        dynamic_padding=True,
+        quantize=args.quantize,
+        backend=args.backend,
+    )
+    for result in results:
+        print(
+            f"{result.n_workers:>3} workers x {result.threads_per_worker:>3} "
+            f"threads: {result.contexts_per_sec:9.1f} contexts/s"
+        )
+    best = results[0]
+    print(
+        f"\nBest: --config workers={best.n_workers} "
+        f"threads_per_worker={best.threads_per_worker}"
+    )
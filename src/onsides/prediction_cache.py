@@ -0,0 +1,126 @@
+"""
+prediction_cache.py
+
+Persistent cache of model outputs, so a re-release only scores match
+contexts that are new or edited since the last run.
+
+Entries are content-addressed: the model is identified by a hash of its
+weights file (plus max_length and the inference variant), and each context
+by a hash of its text. Outputs live in a SQLite database rather than DuckDB
+because several Snakemake jobs may read and write it at once, which SQLite
+handles with WAL mode and DuckDB does not allow across processes.
+"""
+
+import hashlib
+import logging
+import sqlite3
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from onsides.vocab_cache import CACHE_DIR, content_key
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_CACHE_PATH = CACHE_DIR / "predictions.sqlite"
+
+# Stay below SQLITE_MAX_VARIABLE_NUMBER on old SQLite builds (999)
+_QUERY_BATCH_SIZE = 900
+
+
+def model_cache_key(
+    weights_path: Path,
+    max_length: int,
+    quantize: bool = False,
+    backend: str = "eager",
+    digest_dir: Path = CACHE_DIR,
+) -> str:
+    """Identify a model's outputs: weights content, max_length and variant.
+
+    Quantized inference gives slightly different scores, so it is cached
+    separately from fp32. The weights' content digest is remembered in
+    `digest_dir` (see `content_key`).
+    """
+    return hashlib.sha256(
+        f"{content_key([weights_path], cache_dir=digest_dir)}\0{max_length}\0"
+        f"{quantize}\0{backend}".encode()
+    ).hexdigest()
+
+
+def context_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+class PredictionCache:
+    """Model outputs stored by (model key, context hash) in SQLite."""
+
+    def __init__(self, path: Path = PREDICTION_CACHE_PATH, timeout: float = 60.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path, timeout=timeout)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS predictions (
+                model_key TEXT NOT NULL,
+                context_hash BLOB NOT NULL,
+                pred0 REAL NOT NULL,
+                pred1 REAL NOT NULL,
+                PRIMARY KEY (model_key, context_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self.con.commit()
+
+    def get(
+        self, model_key: str, texts: Sequence[str]
+    ) -> tuple[NDArray[np.float32], NDArray[np.bool_]]:
+        """Look up `texts`.
+
+        Returns (outputs, found): an (n, 2) array with the cached outputs
+        (NaN where missing) and a boolean mask of the rows that were cached.
+        """
+        hashes = [context_hash(t) for t in texts]
+        cached = dict()
+        unique = list(set(hashes))
+        for start in range(0, len(unique), _QUERY_BATCH_SIZE):
+            batch = unique[start : start + _QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.con.execute(
+                "SELECT context_hash, pred0, pred1 FROM predictions "
+                f"WHERE model_key = ? AND context_hash IN ({placeholders})",
+                [model_key, *batch],
+            )
+            cached.update((h, (p0, p1)) for h, p0, p1 in rows)
+
+        outputs = np.full((len(texts), 2), np.nan, dtype=np.float32)
+        found = np.zeros(len(texts), dtype=bool)
+        for i, h in enumerate(hashes):
+            if h in cached:
+                outputs[i] = cached[h]
+                found[i] = True
+        return outputs, found
+
+    def put(
+        self, model_key: str, texts: Sequence[str], outputs: NDArray[np.floating]
+    ) -> None:
+        """Store the (n, 2) `outputs` for `texts`."""
+        self.con.executemany(
+            "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+            (
+                (model_key, context_hash(text), float(p0), float(p1))
+                for text, (p0, p1) in zip(texts, outputs)
+            ),
+        )
+        self.con.commit()
+
+    def close(self) -> None:
+        self.con.close()
+
+    def __enter__(self) -> "PredictionCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
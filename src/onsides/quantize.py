@@ -0,0 +1,219 @@
+"""
+quantize.py
+
+Dynamic int8 quantization of ClinicalBertClassifier for CPU inference.
+
+The nn.Linear layers inside the BERT encoder are replaced by dynamically
+quantized int8 versions (weights quantized once, activations per batch); the
+classification head stays in fp32. Quantized weights are cached on disk,
+keyed by the content of the fp32 ``.pth`` file, so later runs skip the
+conversion.
+
+Quantization moves scores slightly, so ``onsides-validate-quantization``
+compares quantized and fp32 ``pred1`` on the held-out test split of a
+reference set and counts the labels that cross the release cutoff used in
+``snakemake/onsides/export/threshold.sql``.
+
+Usage:
+    onsides-validate-quantization \\
+        --ref data/refs/ref14_nwords125_clinical_bert_reference_set_ALL.txt \\
+        --weights models/bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth
+"""
+
+import argparse
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+import torch
+from numpy.typing import NDArray
+from pydantic import BaseModel
+from torch import nn
+
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.train import (
+    LABELS,
+    atomic_torch_save,
+    load_reference_data,
+    split_train_val_test,
+)
+from onsides.vocab_cache import CACHE_DIR, content_key
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_CACHE_DIR = CACHE_DIR / "quantized"
+
+# Rows with pred1 <= this are dropped from the release (threshold.sql)
+PRED1_THRESHOLD = 3.258
+
+
+def quantize_bert(model: ClinicalBertClassifier) -> ClinicalBertClassifier:
+    """Replace the BERT encoder's nn.Linear layers with int8 dynamic versions.
+
+    Modifies and returns `model`. The result only runs on CPU.
+    """
+    model.bert = torch.ao.quantization.quantize_dynamic(
+        model.bert, {nn.Linear}, dtype=torch.qint8
+    )
+    return model
+
+
+def load_quantized_weights(
+    model: ClinicalBertClassifier,
+    weights_path: Path,
+    cache_dir: Path | None = QUANTIZED_CACHE_DIR,
+) -> ClinicalBertClassifier:
+    """Quantize `model` and load the int8 version of `weights_path` into it.
+
+    On a cache hit the quantized state dict is loaded directly; otherwise the
+    fp32 weights are loaded, quantized and (with a `cache_dir`) saved. The
+    weights' content digest is remembered in the parent of `cache_dir`.
+    """
+    cache_path = None
+    if cache_dir is not None:
+        # Packed int8 weights are specific to the torch build and its engine
+        key = hashlib.sha256(
+            f"{content_key([weights_path], cache_dir=cache_dir.parent)}\0"
+            f"{torch.__version__}\0{torch.backends.quantized.engine}".encode()
+        ).hexdigest()
+        cache_path = cache_dir / f"{Path(weights_path).stem}-{key[:20]}.pt"
+
+    if cache_path is not None and cache_path.exists():
+        quantize_bert(model)
+        model.load_state_dict(torch.load(cache_path, weights_only=True))
+        logger.info(f"Loaded quantized weights from {cache_path}")
+        return model
+
+    state_dict = torch.load(weights_path, weights_only=True)
+    # Saved by older transformers versions, which kept it as a buffer
+    state_dict.pop("bert.embeddings.position_ids", None)
+    model.load_state_dict(state_dict)
+    quantize_bert(model)
+
+    if cache_path is not None:
+        atomic_torch_save(model.state_dict(), cache_path)
+        logger.info(f"Cached quantized weights at {cache_path}")
+    return model
+
+
+class QuantizationReport(BaseModel):
+    """Agreement between fp32 and quantized pred1 scores."""
+
+    n: int
+    threshold: float
+    max_abs_diff: float
+    mean_abs_diff: float
+    n_flips: int
+    flips_to_positive: int
+    flips_to_negative: int
+    fp32_accuracy: float | None = None
+    quantized_accuracy: float | None = None
+
+    def __str__(self):
+        lines = [
+            "Quantization check",
+            "-------------------",
+            f" examples: {self.n}",
+            f" pred1 max |diff|: {self.max_abs_diff:.4f}",
+            f" pred1 mean |diff|: {self.mean_abs_diff:.4f}",
+            f" label flips at {self.threshold}: {self.n_flips} "
+            f"(+{self.flips_to_positive} / -{self.flips_to_negative})",
+        ]
+        if self.fp32_accuracy is not None:
+            lines.append(f" fp32 accuracy: {self.fp32_accuracy:.4f}")
+            lines.append(f" quantized accuracy: {self.quantized_accuracy:.4f}")
+        return "\n".join(lines) + "\n"
+
+
+def compare_pred1(
+    fp32_pred1: NDArray[np.floating],
+    quantized_pred1: NDArray[np.floating],
+    labels: NDArray[np.integer] | None = None,
+    threshold: float = PRED1_THRESHOLD,
+) -> QuantizationReport:
+    """Summarize how far quantized scores move and which labels flip.
+
+    A score is labeled positive when `pred1 > threshold`, as in the release.
+    `labels` (1 = is_event) additionally reports accuracy of both models.
+    """
+    fp32_pred1 = np.asarray(fp32_pred1, dtype=np.float64)
+    quantized_pred1 = np.asarray(quantized_pred1, dtype=np.float64)
+    diff = np.abs(quantized_pred1 - fp32_pred1)
+    fp32_positive = fp32_pred1 > threshold
+    quantized_positive = quantized_pred1 > threshold
+
+    report = QuantizationReport(
+        n=len(fp32_pred1),
+        threshold=threshold,
+        max_abs_diff=float(diff.max()) if len(diff) else 0.0,
+        mean_abs_diff=float(diff.mean()) if len(diff) else 0.0,
+        n_flips=int((fp32_positive != quantized_positive).sum()),
+        flips_to_positive=int((~fp32_positive & quantized_positive).sum()),
+        flips_to_negative=int((fp32_positive & ~quantized_positive).sum()),
+    )
+    if labels is not None and len(labels):
+        labels = np.asarray(labels).astype(bool)
+        report.fp32_accuracy = float((fp32_positive == labels).mean())
+        report.quantized_accuracy = float((quantized_positive == labels).mean())
+    return report
+
+
+def main() -> None:
+    """CLI entry point for onsides-validate-quantization."""
+    # predict.py imports this module for its quantize option
+    from onsides.predict import TextSettings, TrainModelSettings, predict
+
+    parser = argparse.ArgumentParser(
+        description="Compare int8-quantized and fp32 predictions on the "
+        "held-out split of a reference set."
+    )
+    parser.add_argument("--ref", type=Path, required=True, help="Reference CSV")
+    parser.add_argument(
+        "--weights", type=Path, required=True, help="Trained bestepoch-*.pth"
+    )
+    parser.add_argument(
+        "--network",
+        type=Path,
+        default=Path("models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract"),
+        help="Pretrained base model directory",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=None,
+        help="Only score the first N held-out examples",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=PRED1_THRESHOLD,
+        help=f"pred1 cutoff (default: {PRED1_THRESHOLD}, as in threshold.sql)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help=f"Re-quantize instead of using the cache in {QUANTIZED_CACHE_DIR}",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+
+    settings = TrainModelSettings.from_filename(args.weights)
+    df = load_reference_data(args.ref, settings.refsource)
+    _, _, df_test = split_train_val_test(
+        df, settings.np_random_seed, settings.split_method
+    )
+    if args.limit is not None:
+        df_test = df_test.head(args.limit)
+    texts = df_test["string"].tolist()
+    labels = np.array([LABELS[c] for c in df_test["class"]])
+    logger.info(f"Scoring {len(texts)} held-out examples from {args.ref}")
+
+    text_settings = TextSettings(nwords=settings.refnwords, refset=settings.refset)
+    fp32 = predict(texts, args.network, args.weights, text_settings)
+    quantized = predict(
+        texts, args.network, args.weights, text_settings,
+        quantize=True,
+        quantized_cache_dir=None if args.no_cache else QUANTIZED_CACHE_DIR,
+    )
+
+    report = compare_pred1(fp32[:, 1], quantized[:, 1], labels, args.threshold)
+    logger.info(f"\n{report}")
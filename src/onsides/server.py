@@ -0,0 +1,453 @@
+"""
+server.py
+
+Resident scoring service: loads a model once and serves predictions over
+local HTTP, so ad-hoc jobs (annotator previews, threshold studies,
+single-label re-scores) skip the multi-second model load.
+
+Requests that arrive while the model is busy, or within `max_latency_ms` of
+each other, are coalesced into one `InferencePool.predict` call of up to
+`max_batch_texts` texts; each caller gets back its own rows. Endpoints:
+
+    POST /predict   {"texts": [...]} -> {"outputs": [[pred0, pred1], ...]}
+    GET  /health    the model being served (used by clients to check it)
+    GET  /metrics   request, batch, throughput and queue-depth counters
+
+`predict(..., use_server=True)` checks for a server at
+``$ONSIDES_MODEL_SERVER`` (default ``http://127.0.0.1:8765``) and sends its
+texts there when one is running with the same weights contents and inference
+variant; otherwise it loads the model itself.
+
+Usage:
+    onsides-serve \\
+        --weights models/bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth \\
+        --network models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from pydantic import BaseModel
+
+from onsides.backends import BACKENDS
+from onsides.vocab_cache import CACHE_DIR, content_key
+
+logger = logging.getLogger(__name__)
+
+SERVER_URL_ENV = "ONSIDES_MODEL_SERVER"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_LATENCY_MS = 10.0
+DEFAULT_MAX_BATCH_TEXTS = 512
+
+# Connection-refused is immediate; this only bounds a hung or foreign server
+_HEALTH_TIMEOUT = 0.5
+
+
+class ServedModel(BaseModel):
+    """What a server scores with; outputs only depend on these.
+
+    Weights and prefilter are identified by a key over their contents
+    (`content_key`) when the model is loaded, so a file retrained in place no longer matches.
+    """
+
+    network_path: str
+    weights_path: str
+    weights_key: str
+    quantize: bool = False
+    backend: str = "eager"
+    prefilter: str | None = None
+    prefilter_key: str | None = None
+
+    def scores_like(self, other: "ServedModel") -> bool:
+        """Whether `other` gives the same outputs, wherever its files are."""
+        paths = {"weights_path", "prefilter"}
+        return self.model_dump(exclude=paths) == other.model_dump(exclude=paths)
+
+
+class ServerMetrics(BaseModel):
+    uptime_seconds: float
+    n_requests: int
+    n_texts: int
+    n_batches: int
+    mean_batch_texts: float
+    queue_depth: int
+    busy_seconds: float
+    # Texts per second of model time, and over the whole uptime
+    texts_per_sec: float
+    texts_per_sec_uptime: float
+
+
+@dataclass
+class _PendingRequest:
+    texts: list[str]
+    done: threading.Event = field(default_factory=threading.Event)
+    outputs: NDArray[np.float32] | None = None
+    error: BaseException | None = None
+
+
+class ModelServer:
+    """
+    Micro-batching front end for one `InferencePool`.
+
+    `submit` is called from the HTTP handler threads and blocks until its
+    texts are scored. A single batcher thread owns the pool (so SQLite and
+    PyTorch state stay on one thread): it takes the first waiting request,
+    keeps collecting more until `max_latency_ms` have passed or
+    `max_batch_texts` texts are queued, and scores them together.
+    """
+
+    def __init__(
+        self,
+        model: ServedModel,
+        pool_kwargs: dict | None = None,
+        max_latency_ms: float = DEFAULT_MAX_LATENCY_MS,
+        max_batch_texts: int = DEFAULT_MAX_BATCH_TEXTS,
+    ):
+        self.model = model
+        self.max_latency = max_latency_ms / 1000
+        self.max_batch_texts = max_batch_texts
+        self._pool_kwargs = dict(pool_kwargs or {})
+        self._queue: queue.Queue[_PendingRequest | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.n_requests = 0
+        self.n_texts = 0
+        self.n_batches = 0
+        self.busy_seconds = 0.0
+
+        self._ready = threading.Event()
+        self._load_error: BaseException | None = None
+        self._thread = threading.Thread(
+            target=self._run, name="onsides-batcher", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+        if self._load_error is not None:
+            raise self._load_error
+
+    def submit(self, texts: list[str]) -> NDArray[np.float32]:
+        """Score `texts` in the next batch and wait for the outputs."""
+        request = _PendingRequest(list(texts))
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.outputs
+
+    def metrics(self) -> ServerMetrics:
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            return ServerMetrics(
+                uptime_seconds=uptime,
+                n_requests=self.n_requests,
+                n_texts=self.n_texts,
+                n_batches=self.n_batches,
+                mean_batch_texts=self.n_texts / max(self.n_batches, 1),
+                queue_depth=self._queue.qsize(),
+                busy_seconds=self.busy_seconds,
+                texts_per_sec=self.n_texts / self.busy_seconds
+                if self.busy_seconds > 0 else 0.0,
+                texts_per_sec_uptime=self.n_texts / uptime,
+            )
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        # predict.py imports this module for its server client
+        from onsides.predict import InferencePool
+
+        try:
+            pool = InferencePool(
+                Path(self.model.network_path),
+                Path(self.model.weights_path),
+                quantize=self.model.quantize,
+                backend=self.model.backend,
+                prefilter=None if self.model.prefilter is None
+                else Path(self.model.prefilter),
+                **self._pool_kwargs,
+            )
+        except BaseException as e:
+            self._load_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        with pool:
+            while (batch := self._next_batch()) is not None:
+                self._score(pool, batch)
+
+    def _next_batch(self) -> list[_PendingRequest] | None:
+        """Block for a request, then gather more within the latency window.
+
+        Returns None once `close` has been called and the queue is drained.
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        n_texts = len(first.texts)
+        deadline = time.monotonic() + self.max_latency
+        while n_texts < self.max_batch_texts:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop on the next `_next_batch`
+                self._queue.put(None)
+                break
+            batch.append(request)
+            n_texts += len(request.texts)
+        return batch
+
+    def _score(self, pool, batch: list[_PendingRequest]) -> None:
+        texts = [text for request in batch for text in request.texts]
+        start = time.perf_counter()
+        try:
+            outputs = pool.predict(texts)
+        except Exception as e:
+            logger.exception(f"Scoring a batch of {len(texts)} texts failed")
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.n_requests += len(batch)
+            self.n_texts += len(texts)
+            self.n_batches += 1
+            self.busy_seconds += elapsed
+        logger.debug(
+            f"Scored {len(batch)} requests ({len(texts)} texts) in {elapsed:.3f}s"
+        )
+        bounds = np.cumsum([0, *(len(request.texts) for request in batch)])
+        for request, lo, hi in zip(batch, bounds[:-1], bounds[1:]):
+            request.outputs = outputs[lo:hi]
+            request.done.set()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "ScoringHTTPServer"
+
+    def do_GET(self) -> None:
+        model_server = self.server.model_server
+        if self.path == "/health":
+            self._send_json(200, model_server.model.model_dump())
+        elif self.path == "/metrics":
+            self._send_json(200, model_server.metrics().model_dump())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            texts = json.loads(self.rfile.read(length))["texts"]
+            if not isinstance(texts, list) or not all(
+                isinstance(t, str) for t in texts
+            ):
+                raise ValueError("'texts' must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            outputs = self.server.model_server.submit(texts)
+        except Exception as e:
+            self._send_json(500, {"error": repr(e)})
+            return
+        self._send_json(200, {"outputs": outputs.tolist()})
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+class ScoringHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], model_server: ModelServer):
+        super().__init__(address, _Handler)
+        self.model_server = model_server
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def default_server_url() -> str:
+    return os.environ.get(SERVER_URL_ENV, f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+
+
+class ServerClient:
+    """Pure-Python client for a running `onsides-serve`."""
+
+    def __init__(self, url: str | None = None, timeout: float | None = None):
+        self.url = (url or default_server_url()).rstrip("/")
+        self.timeout = timeout
+
+    def health(self, timeout: float | None = _HEALTH_TIMEOUT) -> ServedModel:
+        return ServedModel.model_validate(self._request("/health", timeout=timeout))
+
+    def metrics(self) -> ServerMetrics:
+        return ServerMetrics.model_validate(self._request("/metrics"))
+
+    def predict(self, texts: list[str]) -> NDArray[np.float32]:
+        if len(texts) == 0:
+            return np.empty((0, 2), dtype=np.float32)
+        body = self._request("/predict", {"texts": list(texts)})
+        return np.array(body["outputs"], dtype=np.float32)
+
+    def serves(self, model: ServedModel) -> bool:
+        """Whether a server is up at `url` and scores exactly like `model`."""
+        try:
+            served = self.health()
+        except (OSError, ValueError, RuntimeError):
+            return False
+        return served.scores_like(model)
+
+    def _request(
+        self, path: str, payload: dict | None = None, timeout: float | None = None
+    ) -> dict:
+        data = None if payload is None else json.dumps(payload).encode()
+        request = urllib.request.Request(
+            self.url + path, data=data,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(
+                request, timeout=timeout or self.timeout
+            ) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            message = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise RuntimeError(f"Model server error {e.code}: {message}") from e
+
+
+def served_model(
+    network_path: Path,
+    weights_path: Path,
+    quantize: bool = False,
+    backend: str = "eager",
+    prefilter: Path | None = None,
+    digest_dir: Path = CACHE_DIR,
+) -> ServedModel:
+    """The `ServedModel` for these `predict()` arguments.
+
+    Paths are resolved and the weights (and prefilter) are keyed by content;
+    file digests are remembered in `digest_dir` (see `content_key`), so only
+    changed files are hashed again.
+    """
+    return ServedModel(
+        network_path=str(Path(network_path).resolve()),
+        weights_path=str(Path(weights_path).resolve()),
+        weights_key=content_key([weights_path], cache_dir=digest_dir),
+        quantize=quantize,
+        backend=backend,
+        prefilter=None if prefilter is None else str(Path(prefilter).resolve()),
+        prefilter_key=(
+            None if prefilter is None
+            else content_key([prefilter], cache_dir=digest_dir)
+        ),
+    )
+
+
+def main() -> None:
+    """CLI entry point for onsides-serve."""
+    # predict.py imports this module for its server client
+    from onsides.predict import TextSettings, TrainModelSettings
+
+    parser = argparse.ArgumentParser(
+        description="Keep a model loaded and score contexts over local HTTP."
+    )
+    parser.add_argument(
+        "--weights", type=Path, required=True, help="Trained bestepoch-*.pth"
+    )
+    parser.add_argument(
+        "--network",
+        type=Path,
+        default=Path("models/microsoft/BiomedNLP-PubMedBERT-base-uncased-abstract"),
+        help="Pretrained base model directory",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--max-latency-ms", type=float, default=DEFAULT_MAX_LATENCY_MS,
+        help="How long a request may wait for others to share its batch "
+        f"(default: {DEFAULT_MAX_LATENCY_MS})",
+    )
+    parser.add_argument(
+        "--max-batch-texts", type=int, default=DEFAULT_MAX_BATCH_TEXTS,
+        help="Stop collecting requests once a batch has this many texts "
+        f"(default: {DEFAULT_MAX_BATCH_TEXTS})",
+    )
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--prediction-cache", type=Path, default=None)
+    parser.add_argument("--prefilter", type=Path, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s: %(message)s",
+    )
+
+    settings = TrainModelSettings.from_filename(args.weights)
+    model_server = ModelServer(
+        served_model(
+            args.network, args.weights, args.quantize, args.backend,
+            args.prefilter,
+        ),
+        pool_kwargs={
+            "text_settings": TextSettings(
+                nwords=settings.refnwords, refset=settings.refset
+            ),
+            "batch_size": args.batch_size,
+            "dynamic_padding": True,
+            "n_workers": args.workers,
+            "threads_per_worker": args.threads_per_worker,
+            "prediction_cache": args.prediction_cache,
+        },
+        max_latency_ms=args.max_latency_ms,
+        max_batch_texts=args.max_batch_texts,
+    )
+    http_server = ScoringHTTPServer((args.host, args.port), model_server)
+    logger.info(f"Serving {args.weights.name} at {http_server.url}")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        model_server.close()
+        logger.info(f"Final metrics: {model_server.metrics()}")
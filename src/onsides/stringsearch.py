@@ -1,8 +1,44 @@
-from ahocorasick import Automaton
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass
+from itertools import batched
+from os import PathLike
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ahocorasick import STORE_INTS, Automaton
+from numpy.typing import NDArray
 from pydantic import BaseModel
 from rich.progress import track
 
+from onsides.parallel import imap_bounded, process_pool
+from onsides.token_windows import WindowEncoder
 from onsides.types import IndexedText
+from onsides.vocab_cache import CACHE_DIR, content_key, load_or_build
+from onsides.word_offsets import WordOffsets
+
+# Columns of the integer match array returned by `find_matches`. Positions are
+# character offsets into the text, and `end` is inclusive.
+MATCH_COLUMNS = ("text_index", "term_index", "start", "end")
+
+# Arrow schema of the string-match output table (the `MatchContext` fields).
+MATCH_SCHEMA = pa.schema(
+    [
+        ("match_id", pa.int64()),
+        ("text_id", pa.string()),
+        ("term_id", pa.string()),
+        ("term", pa.string()),
+        ("context", pa.string()),
+    ]
+)
+
+
+# With a `WindowEncoder`, each match also carries its BERT input ids.
+MATCH_TOKENS_SCHEMA = MATCH_SCHEMA.append(
+    pa.field("input_ids", pa.list_(pa.int32()))
+)
 
 
 class MatchContext(BaseModel):
@@ -18,41 +54,311 @@ class ContextSettings(BaseModel):
     prop_before: float = 0.125
 
 
+@dataclass
+class TermIndex:
+    """Aho-Corasick automaton whose payloads are integer positions in `terms`."""
+
+    automaton: Automaton
+    term_ids: list[str]
+    terms: list[str]
+    term_lengths: list[int]
+
+
 def parse_texts(
-    texts: list[IndexedText],
-    terms: list[IndexedText],
+    texts: Iterable[IndexedText],
+    terms: list[IndexedText] | TermIndex,
     context_settings: ContextSettings | None = None,
     progress: bool = False,
+    n_workers: int = 1,
 ) -> list[MatchContext]:
     """
     Find all term occurrences in a series of text strings, returning each match
     with the surrounding context for use with BERT.
     """
+    columns = match_columns(
+        texts, terms, context_settings, progress=progress, n_workers=n_workers
+    )
+    return [
+        MatchContext(
+            match_id=match_id,
+            text_id=text_id,
+            term_id=term_id,
+            term=term,
+            context=context,
+        )
+        for match_id, text_id, term_id, term, context in zip(
+            columns["match_id"],
+            columns["text_id"],
+            columns["term_id"],
+            columns["term"],
+            columns["context"],
+        )
+    ]
+
+
+def match_columns(
+    texts: Iterable[IndexedText],
+    terms: list[IndexedText] | TermIndex,
+    context_settings: ContextSettings | None = None,
+    progress: bool = False,
+    n_workers: int = 1,
+) -> dict[str, list]:
+    """
+    Same as `parse_texts`, but returns plain column lists (keyed by the
+    `MatchContext` field names) instead of one model per match.
+    """
+    columns: dict[str, list] = {name: [] for name in MATCH_SCHEMA.names}
+    for part in iter_match_columns(
+        texts, terms, context_settings, progress=progress, n_workers=n_workers
+    ):
+        for name, values in part.items():
+            columns[name].extend(values)
+    return columns
+
+
+def iter_match_columns(
+    texts: Iterable[IndexedText],
+    terms: list[IndexedText] | TermIndex,
+    context_settings: ContextSettings | None = None,
+    progress: bool = False,
+    n_workers: int = 1,
+    chunk_size: int = 1_000,
+    window_encoder: WindowEncoder | None = None,
+) -> Iterator[dict[str, list]]:
+    """
+    Streaming form of `match_columns`. Texts are consumed lazily, `chunk_size`
+    at a time, and one dict of column lists is yielded per chunk, with
+    `match_id` numbered consecutively across chunks. Only a few chunks are
+    held in memory at once, so this can be fed from a Parquet reader and
+    drained into `write_match_parquet` for arbitrarily large corpora.
+
+    `terms` may also be a prebuilt `TermIndex` (e.g. from `load_term_index`).
+
+    With `n_workers > 1`, the automaton is built once and shared with a pool
+    of worker processes that match chunks concurrently. Chunks are yielded in
+    input order, so the output (including every `match_id`) is identical to
+    the serial run.
+
+    With a `window_encoder`, each label is tokenized once and every match
+    also gets an `input_ids` column (see `onsides.token_windows`), so
+    inference can skip tokenizing the contexts.
+    """
     if context_settings is None:
         context_settings = ContextSettings()
+    if window_encoder is not None and (
+        window_encoder.nwords != context_settings.nwords
+        or window_encoder.prop_before != context_settings.prop_before
+    ):
+        raise ValueError(
+            "window_encoder and context_settings disagree on the window: "
+            f"({window_encoder.nwords}, {window_encoder.prop_before}) vs "
+            f"({context_settings.nwords}, {context_settings.prop_before})"
+        )
 
-    match_id = 0
-    term_tree = _build_search_tree(terms)
-    matches = list()
+    if isinstance(terms, TermIndex):
+        term_index = terms
+    else:
+        term_index = _build_search_tree(terms)
     texts_to_iter = track(texts) if progress else texts
-    for text_obj in texts_to_iter:
-        found_terms = _find_terms_in_text(text_obj.text, term_tree)
-        for found_term in found_terms:
-            match = MatchContext(
-                match_id=match_id,
-                text_id=text_obj.text_id,
-                term_id=found_term.term_id,
-                term=found_term.term,
-                context=_build_bert_string(
-                    text_obj.text,
-                    found_term,
-                    nwords=context_settings.nwords,
-                    prop_before=context_settings.prop_before,
-                ),
+    chunks = batched(texts_to_iter, chunk_size)
+    if n_workers > 1:
+        with process_pool(
+            n_workers,
+            _init_match_worker,
+            (term_index, context_settings, window_encoder),
+        ) as pool:
+            parts = imap_bounded(
+                pool, _match_shard_in_worker, chunks, max_pending=2 * n_workers
+            )
+            yield from _number_matches(parts)
+    else:
+        parts = (
+            _match_shard(chunk, term_index, context_settings, window_encoder)
+            for chunk in chunks
+        )
+        yield from _number_matches(parts)
+
+
+def load_term_index(
+    vocab_path: str | PathLike,
+    cache_dir: Path | None = CACHE_DIR,
+) -> TermIndex:
+    """
+    Build the `TermIndex` for a vocabulary Parquet (columns `text_id` and
+    `text`), reusing the compiled automaton from `cache_dir` when the file's
+    contents are unchanged.
+    """
+    vocab_path = Path(vocab_path)
+
+    def build() -> TermIndex:
+        table = pq.read_table(vocab_path, columns=["text_id", "text"])
+        terms = [
+            IndexedText(text_id=text_id, text=text)
+            for text_id, text in zip(
+                table.column("text_id").to_pylist(), table.column("text").to_pylist()
             )
-            matches.append(match)
-            match_id += 1
-    return matches
+        ]
+        return _build_search_tree(terms)
+
+    if cache_dir is None:
+        return build()
+    key = content_key([vocab_path], cache_dir)
+    return load_or_build("term_index", key, build, cache_dir)
+
+
+def write_match_parquet(
+    path: str | PathLike,
+    parts: Iterable[dict[str, list]],
+    batch_rows: int = 50_000,
+    schema: pa.Schema = MATCH_SCHEMA,
+) -> int:
+    """
+    Write column dicts (as yielded by `iter_match_columns`) to a Parquet file
+    as they arrive. Rows are regrouped into record batches of `batch_rows`,
+    each written as its own row group, so memory use is bounded by the batch
+    size rather than by the total number of matches. Returns the row count.
+    Pass `schema=MATCH_TOKENS_SCHEMA` for parts with `input_ids`.
+    """
+    n_rows = 0
+    pending: list[pa.RecordBatch] = []
+    pending_rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for part in parts:
+            batch = pa.RecordBatch.from_pydict(part, schema=schema)
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            n_rows += batch.num_rows
+            if pending_rows >= batch_rows:
+                table = pa.Table.from_batches(pending, schema=schema)
+                n_full = pending_rows - pending_rows % batch_rows
+                writer.write_table(table.slice(0, n_full), row_group_size=batch_rows)
+                pending = table.slice(n_full).to_batches()
+                pending_rows -= n_full
+        if pending_rows:
+            table = pa.Table.from_batches(pending, schema=schema)
+            writer.write_table(table, row_group_size=batch_rows)
+    return n_rows
+
+
+def iter_parquet_texts(
+    path: str | PathLike, batch_size: int = 1_000
+) -> Iterator[IndexedText]:
+    """
+    Lazily read `IndexedText` rows (columns `text_id` and `text`) from a
+    Parquet file, one record batch at a time.
+    """
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, columns=["text_id", "text"]
+    ):
+        for text_id, text in zip(
+            batch.column("text_id").to_pylist(), batch.column("text").to_pylist()
+        ):
+            yield IndexedText(text_id=text_id, text=text)
+
+
+def find_matches(
+    texts: Sequence[str],
+    term_index: TermIndex,
+    progress: bool = False,
+) -> NDArray[np.int64]:
+    """
+    Run the automaton over every text, returning an (n_matches, 4) integer
+    array with the columns in `MATCH_COLUMNS`. No Python objects are created
+    per match, so this is cheap to hold even for tens of millions of matches.
+    """
+    automaton = term_index.automaton
+    term_lengths = term_index.term_lengths
+    buffer = array("q")
+    texts_to_iter = track(texts) if progress else texts
+    for text_index, text in enumerate(texts_to_iter):
+        for end_index, term_idx in automaton.iter(text):
+            start_index = end_index - term_lengths[term_idx] + 1
+            buffer.extend((text_index, term_idx, start_index, end_index))
+    return np.frombuffer(buffer, dtype=np.int64).reshape(-1, len(MATCH_COLUMNS))
+
+
+# Output columns produced per shard; `match_id` is added once shards are ordered.
+_SHARD_COLUMNS = ("text_id", "term_id", "term", "context")
+
+_worker_state: dict = {}
+
+
+def _init_match_worker(
+    term_index: TermIndex,
+    context_settings: ContextSettings,
+    window_encoder: WindowEncoder | None = None,
+) -> None:
+    _worker_state["term_index"] = term_index
+    _worker_state["context_settings"] = context_settings
+    _worker_state["window_encoder"] = window_encoder
+
+
+def _match_shard_in_worker(texts: Sequence[IndexedText]) -> dict[str, list]:
+    return _match_shard(
+        texts,
+        _worker_state["term_index"],
+        _worker_state["context_settings"],
+        _worker_state["window_encoder"],
+    )
+
+
+def _match_shard(
+    texts: Sequence[IndexedText],
+    term_index: TermIndex,
+    context_settings: ContextSettings,
+    window_encoder: WindowEncoder | None = None,
+) -> dict[str, list]:
+    """
+    Match one shard of texts and build its output columns (without match ids,
+    which are only assigned once shards have been put back in order).
+    """
+    raw_texts = [text_obj.text for text_obj in texts]
+    matches = find_matches(raw_texts, term_index)
+
+    columns: dict[str, list] = {name: [] for name in _SHARD_COLUMNS}
+    if window_encoder is not None:
+        columns["input_ids"] = []
+    offsets = None
+    label_tokens = None
+    for text_index, term_idx, start, end in matches.tolist():
+        if offsets is None or offsets.text is not raw_texts[text_index]:
+            if window_encoder is not None:
+                label_tokens = window_encoder.encode_label(raw_texts[text_index])
+                offsets = label_tokens.offsets
+            else:
+                offsets = WordOffsets(raw_texts[text_index])
+        term = term_index.terms[term_idx]
+        if label_tokens is not None:
+            columns["input_ids"].append(
+                window_encoder.window_ids(label_tokens, term, start, end)
+            )
+        columns["text_id"].append(texts[text_index].text_id)
+        columns["term_id"].append(term_index.term_ids[term_idx])
+        columns["term"].append(term)
+        columns["context"].append(
+            _build_bert_string(
+                raw_texts[text_index],
+                term,
+                start,
+                end,
+                nwords=context_settings.nwords,
+                prop_before=context_settings.prop_before,
+                offsets=offsets,
+            )
+        )
+    return columns
+
+
+def _number_matches(
+    parts: Iterable[dict[str, list]],
+) -> Iterator[dict[str, list]]:
+    next_match_id = 0
+    for part in parts:
+        n_matches = len(part["text_id"])
+        match_ids = list(range(next_match_id, next_match_id + n_matches))
+        next_match_id += n_matches
+        yield {"match_id": match_ids, **part}
 
 
 class _FoundTerm(BaseModel):
@@ -62,57 +368,68 @@ class _FoundTerm(BaseModel):
     end: int
 
 
-def _build_search_tree(terms: list[IndexedText]) -> Automaton:
+def _build_search_tree(terms: list[IndexedText]) -> TermIndex:
     """
-    Builds an Aho-Corasick tree from a list of terms.
+    Builds an Aho-Corasick tree from a list of terms. The automaton stores each
+    term's position in the list rather than a serialized copy of the term.
     """
-    tree = Automaton(str, str)
-    for obj in terms:
-        tree.add_word(obj.text, obj.model_dump_json())
+    tree = Automaton(STORE_INTS)
+    for i, obj in enumerate(terms):
+        tree.add_word(obj.text, i)
     tree.make_automaton()
-    return tree
+    return TermIndex(
+        automaton=tree,
+        term_ids=[obj.text_id for obj in terms],
+        terms=[obj.text for obj in terms],
+        term_lengths=[len(obj.text) for obj in terms],
+    )
 
 
-def _find_terms_in_text(text: str, term_tree: Automaton) -> list[_FoundTerm]:
+def _find_terms_in_text(text: str, term_index: TermIndex) -> list[_FoundTerm]:
     """
     Finds all terms in a text using an Aho-Corasick tree.
     """
-    found_terms = list()
-    for end_index, obj_json in term_tree.iter(text):
-        obj = IndexedText.model_validate_json(obj_json)
-        start_index = end_index - len(obj.text) + 1
-        obj = _FoundTerm(
-            term_id=obj.text_id,
-            term=obj.text,
-            start=start_index,
-            end=end_index,
+    return [
+        _FoundTerm(
+            term_id=term_index.term_ids[term_idx],
+            term=term_index.terms[term_idx],
+            start=start,
+            end=end,
         )
-        found_terms.append(obj)
-    return found_terms
+        for _, term_idx, start, end in find_matches([text], term_index).tolist()
+    ]
 
 
 def _build_bert_string(
     text: str,
-    match: _FoundTerm,
+    term: str,
+    start: int,
+    end: int,
     nwords: int = 125,
     prop_before: float = 0.125,
+    offsets: WordOffsets | None = None,
 ) -> str:
     """
     Extract surrounding context around a text match for use with BERT.
 
     Args:
         text: text from which to extract context
-        match: match that is being extracted
+        term: matched term
+        start: index of the first character of the match
+        end: index of the last character of the match (inclusive)
         nwords: number of words in the output string
         prop_before: proportion of nwords that come before the match
+        offsets: word offsets of `text`, to reuse across matches in one text
     """
-    term_nwords = len(match.term.split())
+    if offsets is None:
+        offsets = WordOffsets(text)
+    term_nwords = len(term.split())
     n_words_before = prop_before * (nwords - 2 * term_nwords)
     n_words_after = (1 - prop_before) * (nwords - 2 * term_nwords)
     n_words_before = max(int(n_words_before), 1)
     n_words_after = max(int(n_words_after), 1)
-    before_words = text[: match.start].split()[-n_words_before:]
-    after_words = text[match.end + 1 :].split()[:n_words_after]
-    words_list = [match.term] + before_words + ["EVENT"] + after_words
+    before_words = offsets.words_before(start, n_words_before)
+    after_words = offsets.words_after(end + 1, n_words_after)
+    words_list = [term] + before_words + ["EVENT"] + after_words
     result = " ".join(words_list)
     return result
@@ -0,0 +1,80 @@
+"""Tests for onsides.backends module."""
+
+import os
+
+import numpy as np
+import pytest
+
+from onsides.backends import export_path, load_backend
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.conftest import CONTEXTS, TEXT_SETTINGS
+from onsides.predict import predict
+
+@pytest.fixture
+def weights_path(weights_path, tmp_path):
+    """A private copy of the shared weights; exports are written beside it."""
+    path = tmp_path / weights_path.name
+    path.write_bytes(weights_path.read_bytes())
+    return path
+
+
+def test_export_path(tmp_path):
+    weights = tmp_path / "bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.pth"
+    assert export_path(weights, "torchscript").name == (
+        "bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32.torchscript.pt"
+    )
+    assert export_path(weights, "onnxruntime").suffix == ".onnx"
+
+
+def test_unknown_backend_raises(network_path, weights_path):
+    model = ClinicalBertClassifier(network_path)
+    with pytest.raises(ValueError, match="Unknown backend"):
+        load_backend(model, weights_path, "tensorrt", 16)
+
+
+@pytest.mark.parametrize("dynamic_padding", [False, True])
+def test_torchscript_matches_eager(network_path, weights_path, dynamic_padding):
+    eager = predict(
+        CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+        dynamic_padding=dynamic_padding,
+    )
+    scripted = predict(
+        CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+        dynamic_padding=dynamic_padding, backend="torchscript",
+    )
+    assert export_path(weights_path, "torchscript").exists()
+    np.testing.assert_allclose(scripted, eager, atol=1e-5)
+
+
+@pytest.mark.parametrize("dynamic_padding", [False, True])
+def test_onnxruntime_matches_eager(network_path, weights_path, dynamic_padding):
+    pytest.importorskip("onnxruntime")
+    eager = predict(
+        CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+        dynamic_padding=dynamic_padding,
+    )
+    onnx = predict(
+        CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+        dynamic_padding=dynamic_padding, backend="onnxruntime",
+    )
+    assert export_path(weights_path, "onnxruntime").exists()
+    np.testing.assert_allclose(onnx, eager, atol=1e-4)
+
+
+def test_stale_export_is_regenerated(network_path, weights_path):
+    model = ClinicalBertClassifier(network_path)
+    path = export_path(weights_path, "torchscript")
+    path.write_bytes(b"stale")
+    stat = weights_path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+
+    load_backend(model, weights_path, "torchscript", 16)
+    assert path.read_bytes() != b"stale"
+
+
+def test_quantize_requires_eager(network_path, weights_path):
+    with pytest.raises(ValueError, match="eager"):
+        predict(
+            CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+            quantize=True, backend="torchscript",
+        )
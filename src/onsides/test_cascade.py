@@ -0,0 +1,96 @@
+"""Tests for onsides.cascade module."""
+
+import numpy as np
+import pytest
+
+from onsides import predict as predict_module
+from onsides.cascade import (
+    Prefilter,
+    calibration_row,
+    choose_cutoff,
+    train_prefilter,
+)
+from onsides.conftest import TEXT_SETTINGS
+from onsides.predict import predict
+
+POSITIVE = [
+    "rash exact EVENT reported in patients",
+    "headache exact EVENT common in patients",
+    "nausea exact EVENT were common",
+    "fever exact EVENT reported in patients with rash",
+]
+NEGATIVE = [
+    "rash exact interaction with the drug EVENT in rats",
+    "headache exact animal studies in rats EVENT",
+    "nausea exact rats EVENT interaction",
+    "fever exact interaction EVENT of the drug in rats",
+]
+
+
+@pytest.fixture(scope="module")
+def prefilter():
+    texts = POSITIVE * 5 + NEGATIVE * 5
+    labels = np.array([1] * 20 + [0] * 20)
+    return Prefilter(pipeline=train_prefilter(texts, labels), cutoff=0.5)
+
+
+class TestPrefilter:
+    def test_separates_training_classes(self, prefilter):
+        scores = prefilter.scores(POSITIVE + NEGATIVE)
+        assert scores[:4].min() > scores[4:].max()
+        assert prefilter.keep(POSITIVE).all()
+        assert not prefilter.keep(NEGATIVE).any()
+
+    def test_save_load(self, prefilter, tmp_path):
+        prefilter.save(tmp_path / "prefilter.pkl")
+        loaded = Prefilter.load(tmp_path / "prefilter.pkl")
+        assert loaded.cutoff == prefilter.cutoff
+        np.testing.assert_allclose(
+            loaded.scores(POSITIVE), prefilter.scores(POSITIVE)
+        )
+
+
+class TestCalibration:
+    def test_choose_cutoff_bounds_recall_loss(self):
+        scores = np.linspace(0, 1, 100)
+        bert_pred1 = np.where(np.arange(100) % 2 == 0, 5.0, 0.0)
+        cutoff = choose_cutoff(scores, bert_pred1, max_recall_loss=0.1)
+
+        row = calibration_row(scores, bert_pred1, cutoff)
+        assert row.bert_positive_recall == pytest.approx(0.9)
+        assert row.skip_fraction == pytest.approx(0.1)
+        assert choose_cutoff(scores, bert_pred1, max_recall_loss=0.0) == 0.0
+
+    def test_calibration_row(self):
+        scores = np.array([0.1, 0.2, 0.8, 0.9])
+        bert_pred1 = np.array([0.0, 4.0, 4.0, 0.0])
+        labels = np.array([0, 1, 1, 1])
+        row = calibration_row(scores, bert_pred1, 0.5, labels)
+        assert row.skip_fraction == 0.5
+        assert row.bert_positive_recall == 0.5
+        assert row.label_recall == pytest.approx(1 / 3)
+
+
+class TestPredictWithPrefilter:
+    def test_skipped_texts_get_zero_outputs(
+        self, prefilter, network_path, weights_path, tmp_path, monkeypatch
+    ):
+        prefilter.save(tmp_path / "prefilter.pkl")
+        texts = [POSITIVE[0], NEGATIVE[0], POSITIVE[1], NEGATIVE[1]]
+        expected = predict(texts, network_path, weights_path, TEXT_SETTINGS)
+
+        scored = list()
+        original_evaluate = predict_module.evaluate
+
+        def record_texts(model, network_path, texts, **kwargs):
+            scored.extend(texts)
+            return original_evaluate(model, network_path, texts, **kwargs)
+
+        monkeypatch.setattr(predict_module, "evaluate", record_texts)
+        outputs = predict(
+            texts, network_path, weights_path, TEXT_SETTINGS,
+            prefilter=tmp_path / "prefilter.pkl",
+        )
+        assert scored == [POSITIVE[0], POSITIVE[1]]
+        np.testing.assert_allclose(outputs[[0, 2]], expected[[0, 2]], atol=1e-5)
+        assert (outputs[[1, 3]] == 0).all()
@@ -0,0 +1,133 @@
+"""Tests for onsides.clinicalbert module."""
+
+import numpy as np
+import torch
+
+from onsides.clinicalbert import (
+    ClinicalBertClassifier,
+    Dataset,
+    LengthBucketBatchSampler,
+    ResumableBatchSampler,
+    evaluate,
+    make_dataloader,
+)
+
+TEXTS = [
+    "headache exact headache EVENT reported in patients",
+    "rash exact EVENT",
+    "nausea exact nausea and fever were common in patients with the event "
+    "of rash and headache reported",
+    "fever exact EVENT of the",
+    "the nausea",
+    "headache exact patients with EVENT and fever and rash and nausea",
+]
+
+
+class TestLengthBucketBatchSampler:
+    def test_inference_sorted_by_length(self):
+        lengths = [5, 2, 9, 2, 7]
+        batches = list(LengthBucketBatchSampler(lengths, batch_size=2))
+        assert batches == [[1, 3], [0, 4], [2]]
+
+    def test_shuffle_covers_every_index_once(self):
+        lengths = [i % 17 for i in range(103)]
+        sampler = LengthBucketBatchSampler(
+            lengths, batch_size=8, shuffle=True, bucket_batches=4,
+            generator=torch.Generator().manual_seed(0),
+        )
+        batches = list(sampler)
+        assert len(batches) == len(sampler)
+        assert sorted(i for batch in batches for i in batch) == list(range(103))
+
+    def test_shuffle_differs_between_epochs(self):
+        lengths = list(range(64))
+        sampler = LengthBucketBatchSampler(
+            lengths, batch_size=4, shuffle=True, bucket_batches=2,
+            generator=torch.Generator().manual_seed(0),
+        )
+        assert list(sampler) != list(sampler)
+
+    def test_batches_group_similar_lengths(self):
+        lengths = [i % 50 for i in range(400)]
+        sampler = LengthBucketBatchSampler(
+            lengths, batch_size=10, shuffle=True, bucket_batches=40,
+            generator=torch.Generator().manual_seed(0),
+        )
+        spread = [
+            max(lengths[i] for i in b) - min(lengths[i] for i in b)
+            for b in sampler
+        ]
+        assert np.mean(spread) < 5
+
+
+class TestResumableBatchSampler:
+    def _sampler(self, seed=0):
+        generator = torch.Generator()
+        sampler = LengthBucketBatchSampler(
+            list(range(40)), batch_size=4, shuffle=True, bucket_batches=2,
+            generator=generator,
+        )
+        return ResumableBatchSampler(sampler, generator, seed)
+
+    def test_epoch_order_is_seeded(self):
+        sampler = self._sampler()
+        sampler.set_epoch(3)
+        expected = list(sampler)
+
+        # Independent of the global RNG and of earlier epochs
+        torch.manual_seed(123)
+        other = self._sampler()
+        other.set_epoch(3)
+        assert list(other) == expected
+        other.set_epoch(4)
+        assert list(other) != expected
+        assert list(self._sampler(seed=1)) != list(self._sampler(seed=0))
+
+    def test_resume_from_batch(self):
+        sampler = self._sampler()
+        sampler.set_epoch(2)
+        full = list(sampler)
+        sampler.set_epoch(2, start=4)
+        assert len(sampler) == len(full) - 4
+        assert list(sampler) == full[4:]
+
+
+class TestDynamicPadding:
+    def test_batches_padded_to_longest_member(self, network_path):
+        dataset = Dataset(
+            TEXTS, network_path, max_length=32, labels=[0, 1, 0, 1, 0, 1],
+            dynamic_padding=True,
+        )
+        for inputs, labels in make_dataloader(dataset, batch_size=2):
+            mask = inputs["attention_mask"]
+            assert inputs["input_ids"].shape == mask.shape
+            assert mask.shape[1] == mask.sum(dim=1).max()
+            assert labels.shape == (len(mask),)
+
+    def test_truncates_to_max_length(self, network_path):
+        dataset = Dataset(TEXTS, network_path, max_length=8, dynamic_padding=True)
+        assert max(dataset.lengths) == 8
+
+    def test_evaluate_matches_fixed_padding(self, network_path):
+        model = ClinicalBertClassifier(network_path)
+        fixed = evaluate(model, network_path, TEXTS, max_length=32, batch_size=4)
+        dynamic = evaluate(
+            model, network_path, TEXTS, max_length=32, batch_size=4,
+            dynamic_padding=True,
+        )
+        assert dynamic.shape == (len(TEXTS), 2)
+        np.testing.assert_allclose(dynamic, fixed, atol=1e-5)
+
+
+class TestDatasetTokenCache:
+    def test_cached_dataset_matches_uncached(self, network_path, tmp_path):
+        uncached = Dataset(TEXTS, network_path, max_length=16)
+        Dataset(TEXTS, network_path, max_length=16, cache_dir=tmp_path)
+        cached = Dataset(TEXTS, network_path, max_length=16, cache_dir=tmp_path)
+
+        assert isinstance(cached.input_ids, np.memmap)
+        for i in range(len(TEXTS)):
+            a, _ = uncached[i]
+            b, _ = cached[i]
+            assert torch.equal(a["input_ids"], b["input_ids"])
+            assert torch.equal(a["attention_mask"], b["attention_mask"])
@@ -1,24 +1,32 @@
 """Tests for onsides.construct_training_data module."""
 
 import json
+import os
 import random
 import tempfile
 from pathlib import Path
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
 from ahocorasick import Automaton
 
+from onsides import construct_training_data
 from onsides.construct_training_data import (
     AnnotationRecord,
     FoundTerm,
     MedDRAVocab,
     MethodConfig,
+    RefSpec,
     _resolve_sections,
     construct_reference_set,
+    construct_reference_sets,
+    extract_meddra_hierarchy,
     find_terms_in_text,
     generate_example,
     get_method_config,
     load_annotations,
+    load_meddra_vocab,
     write_reference_csv,
 )
 
@@ -174,6 +182,116 @@ class TestFindTermsInText:
         assert text[found[0].start:found[0].start + found[0].length] == "nausea"
 
 
+# ---------------------------------------------------------------------------
+# load_meddra_vocab / extract_meddra_hierarchy
+# ---------------------------------------------------------------------------
+
+class TestMedDRAHierarchy:
+    def _write_inputs(self, tmp_path: Path) -> dict[str, Path]:
+        vocab = tmp_path / "meddra_english.parquet"
+        pq.write_table(
+            pa.table({
+                "text_id": ["10019211", "10019233"],
+                "text": ["Headache", "Head pain"],
+            }),
+            vocab,
+        )
+        concept = tmp_path / "CONCEPT.csv"
+        concept.write_text(
+            "concept_id\tconcept_name\tvocabulary_id\tconcept_class_id"
+            "\tconcept_code\tinvalid_reason\n"
+            "1\tHeadache\tMedDRA\tPT\tA10019211\t\n"
+            "2\tHead pain\tMedDRA\tLLT\tA10019233\t\n"
+            "3\tOld pain\tMedDRA\tLLT\tA10000001\tD\n"
+        )
+        relationship = tmp_path / "CONCEPT_RELATIONSHIP.csv"
+        relationship.write_text(
+            "concept_id_1\tconcept_id_2\trelationship_id\tinvalid_reason\n"
+            "2\t1\tIs a\t\n"
+            "3\t1\tIs a\t\n"
+            "1\t2\tSubsumes\t\n"
+        )
+        return {
+            "vocab_path": vocab,
+            "omop_concept_path": concept,
+            "omop_relationship_path": relationship,
+        }
+
+    def test_snapshot_matches_omop(self, tmp_path):
+        paths = self._write_inputs(tmp_path)
+        hierarchy = tmp_path / "meddra_hierarchy.parquet"
+        n_rows = extract_meddra_hierarchy(
+            paths["omop_concept_path"], paths["omop_relationship_path"], hierarchy
+        )
+        assert n_rows == 1
+
+        from_omop = load_meddra_vocab(**paths, cache_dir=None, hierarchy_path=None)
+        assert from_omop.llt_to_pt == {"A10019233": ("A10019211", "Headache")}
+
+        # The snapshot is used even once the OMOP files are gone
+        paths["omop_concept_path"].unlink()
+        paths["omop_relationship_path"].unlink()
+        from_snapshot = load_meddra_vocab(
+            **paths, cache_dir=None, hierarchy_path=hierarchy
+        )
+        assert from_snapshot.llt_to_pt == from_omop.llt_to_pt
+
+    def test_stale_snapshot_is_ignored(self, tmp_path):
+        paths = self._write_inputs(tmp_path)
+        hierarchy = tmp_path / "meddra_hierarchy.parquet"
+        extract_meddra_hierarchy(
+            paths["omop_concept_path"], paths["omop_relationship_path"], hierarchy
+        )
+        # A newer OMOP release drops the LLT→PT link
+        relationship = paths["omop_relationship_path"]
+        relationship.write_text(
+            "concept_id_1\tconcept_id_2\trelationship_id\tinvalid_reason\n"
+        )
+        snapshot_mtime = hierarchy.stat().st_mtime_ns
+        os.utime(relationship, ns=(snapshot_mtime, snapshot_mtime + 10**9))
+
+        vocab = load_meddra_vocab(**paths, cache_dir=None, hierarchy_path=hierarchy)
+        assert vocab.llt_to_pt == {}
+
+    def test_default_snapshot_yields_to_explicit_omop(self, tmp_path, monkeypatch):
+        paths = self._write_inputs(tmp_path)
+        hierarchy = tmp_path / "meddra_hierarchy.parquet"
+        extract_meddra_hierarchy(
+            paths["omop_concept_path"], paths["omop_relationship_path"], hierarchy
+        )
+        relationship = paths["omop_relationship_path"]
+        relationship.write_text(
+            "concept_id_1\tconcept_id_2\trelationship_id\tinvalid_reason\n"
+        )
+        snapshot_mtime = hierarchy.stat().st_mtime_ns
+        os.utime(relationship, ns=(snapshot_mtime, snapshot_mtime - 10**9))
+        monkeypatch.setattr(
+            construct_training_data, "MEDDRA_HIERARCHY_PATH", hierarchy
+        )
+
+        vocab = load_meddra_vocab(**paths, cache_dir=None, hierarchy_path=hierarchy)
+        assert vocab.llt_to_pt == {}
+
+    def test_missing_omop_raises(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            extract_meddra_hierarchy(
+                tmp_path / "CONCEPT.csv",
+                tmp_path / "CONCEPT_RELATIONSHIP.csv",
+                tmp_path / "out.parquet",
+            )
+
+    def test_vocab_cache_roundtrip(self, tmp_path):
+        paths = self._write_inputs(tmp_path)
+        cache_dir = tmp_path / "cache"
+        built = load_meddra_vocab(**paths, cache_dir=cache_dir, hierarchy_path=None)
+        assert len(list(cache_dir.glob("meddra_vocab-*.pkl"))) == 1
+        cached = load_meddra_vocab(**paths, cache_dir=cache_dir, hierarchy_path=None)
+        assert cached.code_to_term == built.code_to_term
+        assert cached.llt_to_pt == built.llt_to_pt
+        found = find_terms_in_text("severe head pain", cached)
+        assert [f.code for f in found] == ["10019233"]
+
+
 # ---------------------------------------------------------------------------
 # load_annotations
 # ---------------------------------------------------------------------------
@@ -297,6 +415,74 @@ class TestConstructReferenceSet:
         assert row_by_term["headache"][6] == "is_event"
         assert row_by_term["fever"][6] == "not_event"
 
+    def test_parallel_matches_serial(self):
+        vocab = _make_vocab({
+            "100": "headache",
+            "200": "fever",
+            "300": "rash",
+        })
+        records = [
+            AnnotationRecord(
+                drug=f"DRUG{i}",
+                section_code="AR",
+                text=f"headache {'and fever ' * i}reported with rash",
+                annotated_codes={"100"},
+                tac="train",
+            )
+            for i in range(12)
+        ]
+        serial = construct_reference_set(records, vocab, method=14, nwords=20)
+        parallel = construct_reference_set(
+            records, vocab, method=14, nwords=20, n_workers=3
+        )
+        assert parallel == serial
+
+
+class TestConstructReferenceSets:
+    def _inputs(self):
+        vocab = _make_vocab({
+            "100": "headache",
+            "200": "fever",
+            "300": "rash",
+        })
+        records = [
+            AnnotationRecord(
+                drug=f"DRUG{i}",
+                section_code=["AR", "BW", "WP"][i % 3],
+                text=f"headache {'and fever ' * i}reported with rash",
+                annotated_codes={"100"},
+                tac="train",
+            )
+            for i in range(9)
+        ]
+        return vocab, records
+
+    def test_matches_individual_runs(self):
+        vocab, records = self._inputs()
+        specs = [
+            RefSpec(14, 20, "ALL"),
+            RefSpec(14, 20, "AR"),
+            RefSpec(14, 60, "BW"),
+            RefSpec(8, 20, "ARBW"),
+            RefSpec(5, 10, "ALL"),
+            RefSpec(5, 10, "WP"),
+        ]
+        batched = construct_reference_sets(records, vocab, specs)
+
+        for spec in specs:
+            subset = [r for r in records if r.section_code in spec.sections]
+            expected = construct_reference_set(
+                subset, vocab, spec.method, spec.nwords
+            )
+            assert batched[spec] == expected, spec
+
+    def test_parallel_matches_serial(self):
+        vocab, records = self._inputs()
+        specs = [RefSpec(14, 20, "ALL"), RefSpec(0, 30, "AR")]
+        serial = construct_reference_sets(records, vocab, specs)
+        parallel = construct_reference_sets(records, vocab, specs, n_workers=3)
+        assert parallel == serial
+
 
 # ---------------------------------------------------------------------------
 # write_reference_csv
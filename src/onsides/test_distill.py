@@ -0,0 +1,93 @@
+"""Tests for onsides.distill module."""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import torch
+from transformers import BertConfig, BertModel, BertTokenizerFast
+
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.conftest import CONTEXTS, TEXT_SETTINGS
+from onsides.distill import distill, make_student, sample_contexts, save_student
+from onsides.predict import predict
+
+@pytest.fixture(scope="module")
+def teacher_network(network_path, tmp_path_factory):
+    """A 4-layer variant of the tiny test model."""
+    path = tmp_path_factory.mktemp("teacher")
+    BertTokenizerFast.from_pretrained(network_path).save_pretrained(path)
+    config = BertConfig.from_pretrained(network_path)
+    config.num_hidden_layers = 4
+    torch.manual_seed(0)
+    BertModel(config).save_pretrained(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def teacher_weights(teacher_network, tmp_path_factory):
+    path = tmp_path_factory.mktemp("models") / (
+        "bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_16_4.pth"
+    )
+    torch.manual_seed(1)
+    torch.save(ClinicalBertClassifier(teacher_network).state_dict(), path)
+    return path
+
+
+class TestMakeStudent:
+    def test_keeps_evenly_spaced_layers(self, teacher_network):
+        teacher = ClinicalBertClassifier(teacher_network)
+        student = make_student(teacher, 2)
+
+        assert len(student.bert.encoder.layer) == 2
+        assert student.bert.config.num_hidden_layers == 2
+        for student_layer, teacher_index in zip(student.bert.encoder.layer, [0, 3]):
+            torch.testing.assert_close(
+                student_layer.output.dense.weight,
+                teacher.bert.encoder.layer[teacher_index].output.dense.weight,
+            )
+        assert len(teacher.bert.encoder.layer) == 4
+
+    def test_rejects_too_many_layers(self, teacher_network):
+        with pytest.raises(ValueError):
+            make_student(ClinicalBertClassifier(teacher_network), 5)
+
+
+class TestDistill:
+    def test_student_is_drop_in_for_predict(
+        self, teacher_network, teacher_weights, tmp_path
+    ):
+        teacher = ClinicalBertClassifier(teacher_network)
+        teacher.load_state_dict(torch.load(teacher_weights, weights_only=True))
+        student = make_student(teacher, 2)
+        losses = distill(
+            teacher, student, teacher_network, CONTEXTS * 4, max_length=16,
+            epochs=4, learning_rate=1e-3, batch_size=4,
+            device=torch.device("cpu"),
+        )
+        assert losses[-1] < losses[0]
+
+        network_path, weights_path = save_student(
+            student.cpu(), teacher_network, teacher_weights, tmp_path / "student"
+        )
+        assert weights_path.name == (
+            "student-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_16_4.pth"
+        )
+        outputs = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        assert outputs.shape == (len(CONTEXTS), 2)
+
+
+class TestSampleContexts:
+    def test_uniform_sample_in_file_order(self, tmp_path):
+        contexts = [f"context {i}" for i in range(1000)]
+        pq.write_table(
+            pa.table({"context": contexts}), tmp_path / "m.parquet",
+            row_group_size=64,
+        )
+        sample = sample_contexts(tmp_path / "m.parquet", 100, seed=0)
+
+        assert len(set(sample)) == 100
+        indices = [int(s.split()[1]) for s in sample]
+        assert indices == sorted(indices)
+        assert sample_contexts(tmp_path / "m.parquet", 5000) == contexts
+        assert np.mean(indices) == pytest.approx(500, abs=100)
@@ -0,0 +1,179 @@
+"""Tests for onsides.features module."""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import torch
+from transformers import AutoTokenizer
+
+from onsides import features as features_module
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.conftest import CONTEXTS
+from onsides.features import (
+    FeatureStore,
+    HeadMeta,
+    build_feature_store,
+    head_meta_path,
+    load_encoder,
+    pooled_outputs,
+    save_head_model,
+    score_head,
+    threshold_sweep,
+    train_head,
+)
+
+
+class TestFeatureStore:
+    def test_round_trip(self, network_path, weights_path, tmp_path):
+        keys = pa.table({"match_id": list(range(len(CONTEXTS)))})
+        store = build_feature_store(
+            tmp_path / "store", iter(CONTEXTS), keys, network_path, weights_path,
+            max_length=16, batch_size=3, chunk_size=4, digest_dir=tmp_path,
+        )
+        reopened = FeatureStore.open(tmp_path / "store")
+
+        assert reopened.features.dtype == np.float16
+        assert isinstance(reopened.features, np.memmap)
+        assert reopened.features.shape == (len(CONTEXTS), 16)
+        assert reopened.keys["match_id"].tolist() == list(range(len(CONTEXTS)))
+        assert reopened.meta.weights_path == str(weights_path)
+        assert reopened.meta.encoder_key is not None
+        assert not (tmp_path / "store.tmp").exists()
+
+        model = load_encoder(network_path, weights_path)
+        expected = pooled_outputs(model, network_path, CONTEXTS, 16, batch_size=7)
+        np.testing.assert_allclose(store.features, expected, atol=1e-3)
+
+    def test_rejects_row_count_mismatch(self, network_path, tmp_path):
+        keys = pa.table({"match_id": [0, 1]})
+        with pytest.raises(ValueError):
+            build_feature_store(
+                tmp_path / "store", iter(CONTEXTS), keys, network_path,
+                max_length=16,
+            )
+
+
+class TestHead:
+    def test_score_head_matches_full_model(self, network_path, weights_path):
+        model = load_encoder(network_path, weights_path).eval()
+        features = pooled_outputs(model, network_path, CONTEXTS, 16, batch_size=4)
+
+        tokens = AutoTokenizer.from_pretrained(network_path)(
+            CONTEXTS, padding="max_length", max_length=16, truncation=True,
+            return_tensors="pt",
+        )
+        with torch.no_grad():
+            expected = model(tokens["input_ids"], tokens["attention_mask"]).numpy()
+        np.testing.assert_allclose(
+            score_head(model.linear, features), expected, atol=1e-5
+        )
+
+    def test_train_head_separates_classes(self):
+        rng = np.random.default_rng(0)
+        labels = rng.integers(0, 2, 400)
+        features = rng.normal(size=(400, 8)).astype(np.float16)
+        features[:, 0] += np.where(labels == 1, 2.0, -2.0)
+
+        linear = train_head(
+            features[:300], labels[:300], features[300:], labels[300:],
+            epochs=100, learning_rate=1e-2, batch_size=64,
+        )
+        outputs = score_head(linear, features[300:])
+        accuracy = (outputs.argmax(axis=1) == labels[300:]).mean()
+        assert accuracy > 0.9
+
+    def test_save_head_model_loads_as_classifier(
+        self, network_path, weights_path, tmp_path
+    ):
+        linear = torch.nn.Linear(16, 2)
+        path = save_head_model(linear, network_path, weights_path, tmp_path / "h.pth")
+
+        model = ClinicalBertClassifier(network_path)
+        model.load_state_dict(torch.load(path, weights_only=True))
+        torch.testing.assert_close(model.linear.weight, linear.weight)
+        original = torch.load(weights_path, weights_only=True)
+        key = "bert.encoder.layer.0.attention.self.query.weight"
+        torch.testing.assert_close(model.state_dict()[key], original[key])
+
+
+class TestThresholdSweep:
+    def test_metrics(self):
+        pred1 = np.array([0.0, 1.0, 2.0, 3.0])
+        labels = np.array([0, 0, 1, 1])
+        sweep = threshold_sweep(pred1, labels, thresholds=np.array([0.5, 1.5]))
+        expected = pd.DataFrame({
+            "threshold": [0.5, 1.5],
+            "n_positive": [3, 2],
+            "precision": [2 / 3, 1.0],
+            "recall": [1.0, 1.0],
+            "f1": [0.8, 1.0],
+            "accuracy": [0.75, 1.0],
+        })
+        pd.testing.assert_frame_equal(sweep, expected)
+
+    def test_default_thresholds_include_release_cutoff(self):
+        from onsides.quantize import PRED1_THRESHOLD
+
+        sweep = threshold_sweep(np.array([0.0, 5.0]), np.array([0, 1]))
+        assert PRED1_THRESHOLD in sweep["threshold"].tolist()
+
+
+class TestCommands:
+    def test_extract_then_train_head(
+        self, network_path, weights_path, tmp_path, monkeypatch
+    ):
+        # Weights digests go to ./_onsides/cache relative to the working dir
+        monkeypatch.chdir(tmp_path)
+        rng = np.random.default_rng(0)
+        ref = pd.DataFrame({
+            "class": rng.choice(["is_event", "not_event"], 60),
+            "string": rng.choice(CONTEXTS, 60),
+            "drug": [f"drug{i % 20}" for i in range(60)],
+        })
+        ref.to_csv(tmp_path / "ref.csv", index=False)
+
+        monkeypatch.setattr("sys.argv", [
+            "onsides-extract-features", "--ref", str(tmp_path / "ref.csv"),
+            "--network", str(network_path), "--weights", str(weights_path),
+            "--max-length", "16", "--output", str(tmp_path / "store"),
+        ])
+        features_module.extract_main()
+        assert FeatureStore.open(tmp_path / "store").keys.columns.tolist() == [
+            "class", "drug",
+        ]
+
+        monkeypatch.setattr("sys.argv", [
+            "onsides-train-head", "--features", str(tmp_path / "store"),
+            "--epochs", "5", "--output", str(tmp_path / "head.pth"),
+            "--sweep-output", str(tmp_path / "sweep.csv"),
+        ])
+        features_module.train_head_main()
+        assert (tmp_path / "head.pth").exists()
+        assert len(pd.read_csv(tmp_path / "sweep.csv")) > 0
+        head_meta = HeadMeta.model_validate_json(
+            head_meta_path(tmp_path / "head.pth").read_text()
+        )
+        assert head_meta.encoder_key == FeatureStore.open(
+            tmp_path / "store"
+        ).meta.encoder_key
+
+        keys = pa.table({"match_id": list(range(len(CONTEXTS)))})
+        for name, max_length in [("same", 16), ("other", 8)]:
+            build_feature_store(
+                tmp_path / name, iter(CONTEXTS), keys, network_path,
+                weights_path, max_length=max_length,
+            )
+        argv = [
+            "onsides-train-head", "--features", str(tmp_path / "store"),
+            "--epochs", "1", "--score-output", str(tmp_path / "scores.parquet"),
+        ]
+        monkeypatch.setattr("sys.argv", [*argv, "--score", str(tmp_path / "same")])
+        features_module.train_head_main()
+        assert pq.read_table(tmp_path / "scores.parquet").num_rows == len(CONTEXTS)
+
+        # Same weights, different max_length
+        monkeypatch.setattr("sys.argv", [*argv, "--score", str(tmp_path / "other")])
+        with pytest.raises(ValueError, match="max_length"):
+            features_module.train_head_main()
@@ -0,0 +1,294 @@
+"""Tests for onsides.predict module."""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import torch
+from transformers import BertTokenizerFast
+
+from onsides import predict as predict_module
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.conftest import CONTEXTS, TEXT_SETTINGS
+from onsides.predict import (
+    InferencePool,
+    TrainModelSettings,
+    autotune_workers,
+    iter_predictions,
+    predict,
+    predict_parquet,
+    unique_with_inverse,
+)
+
+
+def _write_matches(path):
+    pq.write_table(
+        pa.table({
+            "match_id": list(range(len(CONTEXTS))),
+            "context": CONTEXTS,
+        }),
+        path,
+    )
+
+
+class TestTrainModelSettings:
+    def test_from_filename(self, weights_path):
+        settings = TrainModelSettings.from_filename(weights_path)
+        assert settings.network == "PMB"
+        assert settings.max_length == 16
+        assert settings.batch_size == 4
+        assert settings.micro_batch_size is None
+
+    def test_micro_batch_suffix(self, tmp_path):
+        settings = TrainModelSettings.from_filename(
+            tmp_path / "bestepoch-bydrug-PMB_14-ALL-125-all_222_24_25_1e-06_256_32_mb8.pth"
+        )
+        assert settings.batch_size == 32
+        assert settings.micro_batch_size == 8
+
+
+class TestIterPredictions:
+    def test_chunks_match_predict(self, network_path, weights_path):
+        expected = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        chunks = list(iter_predictions(
+            iter(CONTEXTS), network_path, weights_path, TEXT_SETTINGS,
+            chunk_size=3,
+        ))
+        assert [len(c) for c in chunks] == [3, 3, 1]
+        np.testing.assert_allclose(np.vstack(chunks), expected, atol=1e-5)
+
+
+class TestInferencePool:
+    def test_workers_match_serial(self, network_path, weights_path):
+        expected = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        with InferencePool(
+            network_path, weights_path, TEXT_SETTINGS,
+            n_workers=2, threads_per_worker=1,
+        ) as pool:
+            outputs = pool.predict(CONTEXTS)
+            empty = pool.predict([])
+        np.testing.assert_allclose(outputs, expected, atol=1e-5)
+        assert empty.shape == (0, 2)
+
+    def test_autotune_sorted_fastest_first(self, network_path, weights_path):
+        results = autotune_workers(
+            CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+            candidates=[(1, 1), (1, 2)],
+        )
+        assert {(r.n_workers, r.threads_per_worker) for r in results} == {
+            (1, 1), (1, 2),
+        }
+        assert all(r.contexts_per_sec > 0 for r in results)
+        speeds = [r.contexts_per_sec for r in results]
+        assert speeds == sorted(speeds, reverse=True)
+
+
+class TestWorkerThreadSplits:
+    def test_splits_use_every_core(self):
+        assert predict_module.worker_thread_splits(8) == [
+            (1, 8), (2, 4), (4, 2), (8, 1),
+        ]
+        assert predict_module.worker_thread_splits(6) == [
+            (1, 6), (2, 3), (4, 1), (6, 1),
+        ]
+
+
+class TestDeduplication:
+    def test_unique_with_inverse(self):
+        texts = ["b", "a", "b", "c", "a"]
+        unique, inverse = unique_with_inverse(texts)
+        assert unique == ["b", "a", "c"]
+        assert [unique[i] for i in inverse] == texts
+
+    def test_duplicates_scored_once(
+        self, network_path, weights_path, monkeypatch
+    ):
+        expected = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        scored = list()
+        original_evaluate = predict_module.evaluate
+
+        def record_texts(model, network_path, texts, **kwargs):
+            scored.extend(texts)
+            return original_evaluate(model, network_path, texts, **kwargs)
+
+        monkeypatch.setattr(predict_module, "evaluate", record_texts)
+        order = [3, 0, 3, 1, 0, 3, 2, 6, 5, 4, 6]
+        outputs = predict(
+            [CONTEXTS[i] for i in order], network_path, weights_path,
+            TEXT_SETTINGS,
+        )
+        assert sorted(scored) == sorted(CONTEXTS)
+        np.testing.assert_allclose(outputs, expected[order], atol=1e-5)
+
+
+class TestPredictionCache:
+    def test_scores_only_new_texts(
+        self, network_path, weights_path, tmp_path, monkeypatch
+    ):
+        cache_path = tmp_path / "predictions.sqlite"
+        expected = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        predict(
+            CONTEXTS[:4], network_path, weights_path, TEXT_SETTINGS,
+            prediction_cache=cache_path,
+        )
+
+        scored = list()
+        original_evaluate = predict_module.evaluate
+
+        def record_texts(model, network_path, texts, **kwargs):
+            scored.extend(texts)
+            return original_evaluate(model, network_path, texts, **kwargs)
+
+        monkeypatch.setattr(predict_module, "evaluate", record_texts)
+        outputs = predict(
+            CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+            prediction_cache=cache_path,
+        )
+        assert scored == CONTEXTS[4:]
+        np.testing.assert_allclose(outputs, expected, atol=1e-5)
+        assert (tmp_path / "file_digests.json").exists()
+
+
+class TestPredictParquet:
+    def test_appends_predictions(self, network_path, weights_path, tmp_path):
+        _write_matches(tmp_path / "matches.parquet")
+        n_rows = predict_parquet(
+            tmp_path / "matches.parquet", tmp_path / "preds.parquet",
+            network_path, weights_path, text_settings=TEXT_SETTINGS,
+            chunk_size=3, digest_dir=tmp_path / "cache",
+        )
+        expected = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+
+        result = pq.read_table(tmp_path / "preds.parquet")
+        assert n_rows == len(CONTEXTS)
+        assert result.column_names == ["match_id", "context", "pred0", "pred1"]
+        assert result.column("context").to_pylist() == CONTEXTS
+        preds = np.column_stack([
+            result.column("pred0").to_numpy(), result.column("pred1").to_numpy()
+        ])
+        np.testing.assert_allclose(preds, expected, atol=1e-5)
+        assert not (tmp_path / "preds.parquet.parts").exists()
+        # Content digests stay in the cache, not next to the results
+        assert (tmp_path / "cache" / "file_digests.json").exists()
+        assert not (tmp_path / "file_digests.json").exists()
+
+    def test_resumes_after_crash(
+        self, network_path, weights_path, tmp_path, monkeypatch
+    ):
+        _write_matches(tmp_path / "matches.parquet")
+        evaluate = predict_module.evaluate
+        calls = []
+
+        def crash_on_third_chunk(model, network_path, texts, **kwargs):
+            calls.append(texts)
+            if len(calls) == 3:
+                raise RuntimeError("simulated crash")
+            return evaluate(model, network_path, texts, **kwargs)
+
+        monkeypatch.setattr(predict_module, "evaluate", crash_on_third_chunk)
+        args = (
+            tmp_path / "matches.parquet", tmp_path / "preds.parquet",
+            network_path, weights_path,
+        )
+        kwargs = {
+            "text_settings": TEXT_SETTINGS, "chunk_size": 2,
+            "digest_dir": tmp_path / "cache",
+        }
+        with pytest.raises(RuntimeError, match="simulated crash"):
+            predict_parquet(*args, **kwargs)
+        assert not (tmp_path / "preds.parquet").exists()
+
+        def record_chunks(model, network_path, texts, **kwargs):
+            calls.append(texts)
+            return evaluate(model, network_path, texts, **kwargs)
+
+        calls.clear()
+        monkeypatch.setattr(predict_module, "evaluate", record_chunks)
+        predict_parquet(*args, **kwargs)
+
+        # Only the chunks without a completed part are scored again
+        assert calls == [CONTEXTS[4:6], CONTEXTS[6:]]
+        result = pq.read_table(tmp_path / "preds.parquet")
+        assert result.column("context").to_pylist() == CONTEXTS
+
+    def test_changed_weights_restart(
+        self, network_path, weights_path, tmp_path, monkeypatch
+    ):
+        _write_matches(tmp_path / "matches.parquet")
+        evaluate = predict_module.evaluate
+        calls = []
+
+        def crash_on_third_chunk(model, network_path, texts, **kwargs):
+            calls.append(texts)
+            if len(calls) == 3:
+                raise RuntimeError("simulated crash")
+            return evaluate(model, network_path, texts, **kwargs)
+
+        monkeypatch.setattr(predict_module, "evaluate", crash_on_third_chunk)
+        # Retrained weights at the same path as the crashed run's
+        retrained = tmp_path / "models" / weights_path.name
+        retrained.parent.mkdir()
+        retrained.write_bytes(weights_path.read_bytes())
+        args = (tmp_path / "matches.parquet", tmp_path / "preds.parquet")
+        with pytest.raises(RuntimeError, match="simulated crash"):
+            predict_parquet(
+                *args, network_path, retrained,
+                text_settings=TEXT_SETTINGS, chunk_size=2,
+                digest_dir=tmp_path / "cache",
+            )
+        monkeypatch.undo()
+
+        torch.manual_seed(2)
+        torch.save(ClinicalBertClassifier(network_path).state_dict(), retrained)
+        predict_parquet(
+            *args, network_path, retrained,
+            text_settings=TEXT_SETTINGS, chunk_size=2,
+            digest_dir=tmp_path / "cache",
+        )
+        expected = predict(CONTEXTS, network_path, retrained, TEXT_SETTINGS)
+
+        result = pq.read_table(tmp_path / "preds.parquet")
+        preds = np.column_stack([
+            result.column("pred0").to_numpy(), result.column("pred1").to_numpy()
+        ])
+        np.testing.assert_allclose(preds, expected, atol=1e-5)
+
+    def test_token_ids_column(self, network_path, weights_path, tmp_path):
+        tokenizer = BertTokenizerFast.from_pretrained(network_path)
+        token_ids = tokenizer(CONTEXTS, truncation=True, max_length=16)["input_ids"]
+        pq.write_table(
+            pa.table({
+                "match_id": list(range(len(CONTEXTS))),
+                "context": CONTEXTS,
+                "input_ids": pa.array(token_ids, pa.list_(pa.int32())),
+            }),
+            tmp_path / "matches.parquet",
+        )
+        predict_parquet(
+            tmp_path / "matches.parquet", tmp_path / "preds.parquet",
+            network_path, weights_path, text_settings=TEXT_SETTINGS,
+            chunk_size=3, token_ids_column="input_ids",
+            digest_dir=tmp_path / "cache",
+        )
+        expected = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+
+        result = pq.read_table(tmp_path / "preds.parquet")
+        assert result.column_names == ["match_id", "context", "pred0", "pred1"]
+        preds = np.column_stack([
+            result.column("pred0").to_numpy(), result.column("pred1").to_numpy()
+        ])
+        np.testing.assert_allclose(preds, expected, atol=1e-5)
+
+    def test_changed_chunking_restarts(self, network_path, weights_path, tmp_path):
+        _write_matches(tmp_path / "matches.parquet")
+        parts_dir = tmp_path / "preds.parquet.parts"
+        parts_dir.mkdir()
+        (parts_dir / "chunking.json").write_text('{"num_rows": 7, "chunk_size": 5}')
+        (parts_dir / "part-000000.parquet").write_text("stale")
+
+        n_rows = predict_parquet(
+            tmp_path / "matches.parquet", tmp_path / "preds.parquet",
+            network_path, weights_path, text_settings=TEXT_SETTINGS,
+            chunk_size=3, digest_dir=tmp_path / "cache",
+        )
+        assert n_rows == len(CONTEXTS)
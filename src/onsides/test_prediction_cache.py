@@ -0,0 +1,49 @@
+"""Tests for onsides.prediction_cache module."""
+
+import numpy as np
+
+from onsides.prediction_cache import PredictionCache, model_cache_key
+
+
+class TestPredictionCache:
+    def test_round_trip(self, tmp_path):
+        texts = ["rash EVENT", "nausea EVENT", "rash EVENT"]
+        with PredictionCache(tmp_path / "preds.sqlite") as cache:
+            cache.put("model", texts[:2], np.array([[0.1, 0.9], [0.7, 0.3]]))
+            outputs, found = cache.get("model", texts + ["fever EVENT"])
+
+        assert found.tolist() == [True, True, True, False]
+        np.testing.assert_allclose(
+            outputs[:3], [[0.1, 0.9], [0.7, 0.3], [0.1, 0.9]], rtol=1e-6
+        )
+        assert np.isnan(outputs[3]).all()
+
+    def test_entries_scoped_to_model(self, tmp_path):
+        with PredictionCache(tmp_path / "preds.sqlite") as cache:
+            cache.put("a", ["rash EVENT"], np.array([[0.1, 0.9]]))
+            _, found = cache.get("b", ["rash EVENT"])
+        assert not found.any()
+
+    def test_persists_across_connections(self, tmp_path):
+        with PredictionCache(tmp_path / "preds.sqlite") as cache:
+            cache.put("model", ["rash EVENT"], np.array([[0.1, 0.9]]))
+        with PredictionCache(tmp_path / "preds.sqlite") as cache:
+            _, found = cache.get("model", ["rash EVENT"])
+        assert found.all()
+
+
+class TestModelCacheKey:
+    def test_depends_on_weights_and_settings(self, tmp_path):
+        weights = tmp_path / "model.pth"
+        weights.write_bytes(b"weights")
+        key = model_cache_key(weights, 256, digest_dir=tmp_path)
+
+        assert model_cache_key(weights, 256, digest_dir=tmp_path) == key
+        assert model_cache_key(weights, 128, digest_dir=tmp_path) != key
+        assert (
+            model_cache_key(weights, 256, quantize=True, digest_dir=tmp_path) != key
+        )
+        assert (tmp_path / "file_digests.json").exists()
+
+        weights.write_bytes(b"retrained")
+        assert model_cache_key(weights, 256, digest_dir=tmp_path) != key
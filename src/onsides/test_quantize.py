@@ -0,0 +1,69 @@
+"""Tests for onsides.quantize module."""
+
+import numpy as np
+import pytest
+import torch
+
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.conftest import CONTEXTS, TEXT_SETTINGS
+from onsides.predict import predict
+from onsides.quantize import compare_pred1, load_quantized_weights
+
+
+class TestComparePred1:
+    def test_counts_flips(self):
+        fp32 = np.array([3.0, 3.3, 5.0, 1.0])
+        quantized = np.array([3.26, 3.25, 5.1, 1.0])
+        report = compare_pred1(fp32, quantized, labels=np.array([1, 1, 1, 0]))
+
+        assert report.n == 4
+        assert report.n_flips == 2
+        assert report.flips_to_positive == 1
+        assert report.flips_to_negative == 1
+        assert report.max_abs_diff == pytest.approx(0.26)
+        assert report.fp32_accuracy == pytest.approx(0.75)
+        assert report.quantized_accuracy == pytest.approx(0.75)
+
+    def test_cutoff_is_exclusive(self):
+        # threshold.sql drops pred1 <= 3.258
+        report = compare_pred1(np.array([3.258]), np.array([3.2581]))
+        assert report.flips_to_positive == 1
+
+
+class TestLoadQuantizedWeights:
+    def test_linear_layers_quantized(self, network_path, weights_path):
+        model = load_quantized_weights(
+            ClinicalBertClassifier(network_path), weights_path, cache_dir=None
+        )
+        linears = [m for m in model.bert.modules() if "Linear" in type(m).__name__]
+        assert linears
+        assert not any(type(m) is torch.nn.Linear for m in linears)
+        assert isinstance(model.linear, torch.nn.Linear)
+
+    def test_cache_roundtrip(self, network_path, weights_path, tmp_path):
+        cache_dir = tmp_path / "quantized"
+        fresh = load_quantized_weights(
+            ClinicalBertClassifier(network_path), weights_path, cache_dir=cache_dir
+        )
+        assert len(list(cache_dir.glob("*.pt"))) == 1
+        # The digest memo stays next to the caller's cache, not in ./_onsides
+        assert (tmp_path / "file_digests.json").exists()
+        cached = load_quantized_weights(
+            ClinicalBertClassifier(network_path), weights_path, cache_dir=cache_dir
+        )
+        inputs = torch.tensor([[2, 5, 6, 3]])
+        mask = torch.ones_like(inputs)
+        fresh.eval()
+        cached.eval()
+        assert torch.equal(fresh(inputs, mask), cached(inputs, mask))
+
+
+class TestQuantizedPredict:
+    def test_close_to_fp32(self, network_path, weights_path, tmp_path):
+        fp32 = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        quantized = predict(
+            CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+            quantize=True, quantized_cache_dir=tmp_path,
+        )
+        assert quantized.shape == fp32.shape
+        np.testing.assert_allclose(quantized, fp32, atol=0.1)
@@ -0,0 +1,111 @@
+"""Tests for onsides.server module."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import torch
+
+from onsides.clinicalbert import ClinicalBertClassifier
+from onsides.conftest import CONTEXTS, TEXT_SETTINGS
+from onsides.predict import predict
+from onsides.server import (
+    ModelServer,
+    ScoringHTTPServer,
+    ServerClient,
+    served_model,
+)
+
+@pytest.fixture(scope="module")
+def server(network_path, weights_path, tmp_path_factory):
+    model_server = ModelServer(
+        served_model(
+            network_path, weights_path,
+            digest_dir=tmp_path_factory.mktemp("digests"),
+        ),
+        pool_kwargs={"text_settings": TEXT_SETTINGS},
+        max_latency_ms=200,
+    )
+    http_server = ScoringHTTPServer(("127.0.0.1", 0), model_server)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+    model_server.close()
+
+
+class TestModelServer:
+    def test_matches_local_predict(self, server, network_path, weights_path):
+        expected = predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        outputs = ServerClient(server.url).predict(CONTEXTS)
+        np.testing.assert_allclose(outputs, expected, rtol=1e-5, atol=1e-6)
+
+    def test_concurrent_requests_share_batches(self, server):
+        client = ServerClient(server.url)
+        before = client.metrics()
+        with ThreadPoolExecutor(len(CONTEXTS)) as executor:
+            outputs = list(executor.map(lambda t: client.predict([t]), CONTEXTS))
+        after = client.metrics()
+
+        expected = client.predict(CONTEXTS)
+        np.testing.assert_allclose(
+            np.vstack(outputs), expected, rtol=1e-5, atol=1e-6
+        )
+        assert after.n_requests - before.n_requests == len(CONTEXTS)
+        assert after.n_batches - before.n_batches < len(CONTEXTS)
+        assert after.queue_depth == 0
+
+    def test_predict_uses_matching_server(
+        self, server, network_path, weights_path, tmp_path
+    ):
+        client = ServerClient(server.url)
+        before = client.metrics().n_requests
+        predict(
+            CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+            use_server=True, server_url=server.url, digest_dir=tmp_path,
+        )
+        assert client.metrics().n_requests == before + 1
+        # Weights digests are memoized instead of hashed on every call
+        assert (tmp_path / "file_digests.json").exists()
+
+        # Opt-in only
+        predict(CONTEXTS, network_path, weights_path, TEXT_SETTINGS)
+        assert client.metrics().n_requests == before + 1
+
+        # A different variant is not what the server scores with
+        predict(
+            CONTEXTS, network_path, weights_path, TEXT_SETTINGS,
+            quantize=True, quantized_cache_dir=tmp_path,
+            use_server=True, server_url=server.url, digest_dir=tmp_path,
+        )
+        assert client.metrics().n_requests == before + 1
+
+    def test_matches_weights_contents(
+        self, server, network_path, weights_path, tmp_path
+    ):
+        client = ServerClient(server.url)
+        copied = tmp_path / weights_path.name
+        copied.write_bytes(weights_path.read_bytes())
+        assert client.serves(
+            served_model(network_path, copied, digest_dir=tmp_path)
+        )
+
+        # Retrained in place: same path as before, different weights
+        torch.manual_seed(2)
+        torch.save(ClinicalBertClassifier(network_path).state_dict(), copied)
+        assert not client.serves(
+            served_model(network_path, copied, digest_dir=tmp_path)
+        )
+
+    def test_no_server(self, tmp_path):
+        client = ServerClient("http://127.0.0.1:9")
+        assert not client.serves(
+            served_model("network", "weights.pth", digest_dir=tmp_path)
+        )
+
+    def test_bad_request(self, server):
+        client = ServerClient(server.url)
+        with pytest.raises(RuntimeError, match="400"):
+            client._request("/predict", {"texts": "not a list"})
@@ -1,3 +1,6 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
 
 from onsides.stringsearch import (
@@ -7,7 +10,13 @@ from onsides.stringsearch import (
     _build_search_tree,
     _find_terms_in_text,
     _FoundTerm,
+    find_matches,
+    iter_match_columns,
+    iter_parquet_texts,
+    load_term_index,
+    match_columns,
     parse_texts,
+    write_match_parquet,
 )
 from onsides.types import IndexedText
 
@@ -15,10 +24,10 @@ from onsides.types import IndexedText
 @pytest.fixture
 def search_terms():
     return [
-        IndexedText(text="foo", text_id=1),
-        IndexedText(text="bar", text_id=2),
-        IndexedText(text="baz", text_id=3),
-        IndexedText(text="zab", text_id=4),
+        IndexedText(text="foo", text_id="1"),
+        IndexedText(text="bar", text_id="2"),
+        IndexedText(text="baz", text_id="3"),
+        IndexedText(text="zab", text_id="4"),
     ]
 
 
@@ -30,43 +39,43 @@ def search_tree(search_terms):
 @pytest.mark.parametrize(
     "text,expected",
     [
-        ("baz", [_FoundTerm(term_id=3, term="baz", start=0, end=2)]),
+        ("baz", [_FoundTerm(term_id="3", term="baz", start=0, end=2)]),
         (
             "bar baz",
             [
-                _FoundTerm(term_id=2, term="bar", start=0, end=2),
-                _FoundTerm(term_id=3, term="baz", start=4, end=6),
+                _FoundTerm(term_id="2", term="bar", start=0, end=2),
+                _FoundTerm(term_id="3", term="baz", start=4, end=6),
             ],
         ),
         (
             "foo baz",
             [
-                _FoundTerm(term_id=1, term="foo", start=0, end=2),
-                _FoundTerm(term_id=3, term="baz", start=4, end=6),
+                _FoundTerm(term_id="1", term="foo", start=0, end=2),
+                _FoundTerm(term_id="3", term="baz", start=4, end=6),
             ],
         ),
         (
             "foo bar",
             [
-                _FoundTerm(term_id=1, term="foo", start=0, end=2),
-                _FoundTerm(term_id=2, term="bar", start=4, end=6),
+                _FoundTerm(term_id="1", term="foo", start=0, end=2),
+                _FoundTerm(term_id="2", term="bar", start=4, end=6),
             ],
         ),
         (
             "foo bar baz",
             [
-                _FoundTerm(term_id=1, term="foo", start=0, end=2),
-                _FoundTerm(term_id=2, term="bar", start=4, end=6),
-                _FoundTerm(term_id=3, term="baz", start=8, end=10),
+                _FoundTerm(term_id="1", term="foo", start=0, end=2),
+                _FoundTerm(term_id="2", term="bar", start=4, end=6),
+                _FoundTerm(term_id="3", term="baz", start=8, end=10),
             ],
         ),
         (
             # Terms overlap (share characters)
             "foobazab",
             [
-                _FoundTerm(term_id=1, term="foo", start=0, end=2),
-                _FoundTerm(term_id=3, term="baz", start=3, end=5),
-                _FoundTerm(term_id=4, term="zab", start=5, end=7),
+                _FoundTerm(term_id="1", term="foo", start=0, end=2),
+                _FoundTerm(term_id="3", term="baz", start=3, end=5),
+                _FoundTerm(term_id="4", term="zab", start=5, end=7),
             ],
         ),
     ],
@@ -75,13 +84,29 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
     assert _find_terms_in_text(text, search_tree) == expected
 
 
+def test_find_matches(search_tree):
+    result = find_matches(["foo bar", "", "foobazab"], search_tree)
+    assert result.dtype == np.int64
+    assert result.tolist() == [
+        [0, 0, 0, 2],
+        [0, 1, 4, 6],
+        [2, 0, 0, 2],
+        [2, 2, 3, 5],
+        [2, 3, 5, 7],
+    ]
+
+
+def test_find_matches_empty(search_tree):
+    assert find_matches(["qux"], search_tree).shape == (0, 4)
+
+
 @pytest.mark.parametrize(
     "text,match,n_words,prop_before,expected",
     [
         (
             # Basic example
             "foo bar baz",
-            _FoundTerm(term_id=1, term="bar", start=4, end=6),
+            ("bar", 4, 6),
             1,
             0.5,
             "bar foo EVENT baz",
@@ -89,7 +114,7 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
         (
             # Ignore prop_before if there are no words before the match
             "foo bar baz",
-            _FoundTerm(term_id=1, term="bar", start=4, end=6),
+            ("bar", 4, 6),
             1,
             0.15,
             "bar foo EVENT baz",
@@ -97,7 +122,7 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
         (
             # Behave correctly if match is at the end of the text
             "foo bar baz",
-            _FoundTerm(term_id=2, term="baz", start=8, end=10),
+            ("baz", 8, 10),
             1,
             0.5,
             "baz bar EVENT",
@@ -105,7 +130,7 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
         (
             # Correctly extract multiple words
             "a b bar c d",
-            _FoundTerm(term_id=2, term="bar", start=4, end=6),
+            ("bar", 4, 6),
             6,
             0.5,
             "bar a b EVENT c d",
@@ -113,7 +138,7 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
         (
             # Correctly limit the total number of words
             "a b c bar d e f",
-            _FoundTerm(term_id=2, term="bar", start=6, end=8),
+            ("bar", 6, 8),
             6,
             0.5,
             "bar b c EVENT d e",
@@ -121,7 +146,7 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
         (
             # Correctly limit the total number of words
             "a b c bar d e f",
-            _FoundTerm(term_id=2, term="bar", start=6, end=8),
+            ("bar", 6, 8),
             6,
             0.5,
             "bar b c EVENT d e",
@@ -129,7 +154,7 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
         (
             # Respect the prop_before parameter
             "a b c bar d e f",
-            _FoundTerm(term_id=2, term="bar", start=6, end=8),
+            ("bar", 6, 8),
             6,
             0.75,
             "bar a b c EVENT d",
@@ -137,9 +162,14 @@ def test_find_terms(search_tree, text: str, expected: list[int]):
     ],
 )
 def test_build_bert_string(
-    text: str, match: _FoundTerm, n_words: int, prop_before: float, expected: str
+    text: str,
+    match: tuple[str, int, int],
+    n_words: int,
+    prop_before: float,
+    expected: str,
 ):
-    result = _build_bert_string(text, match, n_words, prop_before)
+    term, start, end = match
+    result = _build_bert_string(text, term, start, end, n_words, prop_before)
     assert result == expected
 
 
@@ -147,42 +177,145 @@ def test_parse_texts(
     search_terms,
 ):
     texts = [
-        IndexedText(text_id=1, text="qux mux lux foo abc def ghi"),
-        IndexedText(text_id=2, text="qux mux lux foobarbaz abc def ghi"),
+        IndexedText(text_id="1", text="qux mux lux foo abc def ghi"),
+        IndexedText(text_id="2", text="qux mux lux foobarbaz abc def ghi"),
     ]
     settings = ContextSettings(nwords=1, prop_before=0.5)
     results = parse_texts(texts, search_terms, settings, progress=False)
     expected = [
         MatchContext(
             match_id=0,
-            text_id=1,
-            term_id=1,
+            text_id="1",
+            term_id="1",
             term="foo",
             context="foo lux EVENT abc",
         ),
         # Handle match inside a word (at the start)
         MatchContext(
             match_id=1,
-            text_id=2,
-            term_id=1,
+            text_id="2",
+            term_id="1",
             term="foo",
             context="foo lux EVENT barbaz",
         ),
         # Handle match inside a word (in the middle)
         MatchContext(
             match_id=2,
-            text_id=2,
-            term_id=2,
+            text_id="2",
+            term_id="2",
             term="bar",
             context="bar foo EVENT baz",
         ),
         # Handle match inside a word (at the end)
         MatchContext(
             match_id=3,
-            text_id=2,
-            term_id=3,
+            text_id="2",
+            term_id="3",
             term="baz",
             context="baz foobar EVENT abc",
         ),
     ]
     assert results == expected
+
+
+def test_match_columns_equals_parse_texts(search_terms):
+    texts = [
+        IndexedText(text_id="1", text="qux mux lux foo abc def ghi"),
+        IndexedText(text_id="2", text="qux mux lux foobarbaz abc def ghi"),
+    ]
+    settings = ContextSettings(nwords=1, prop_before=0.5)
+    columns = match_columns(texts, search_terms, settings)
+    models = parse_texts(texts, search_terms, settings)
+    assert [MatchContext(**row) for row in _rows(columns)] == models
+
+
+def _rows(columns: dict[str, list]) -> list[dict]:
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def test_match_columns_parallel_equals_serial(search_terms):
+    texts = [
+        IndexedText(text_id=str(i), text=f"qux foo{'bar' * i} baz abc {i}")
+        for i in range(25)
+    ]
+    settings = ContextSettings(nwords=4, prop_before=0.5)
+    serial = match_columns(texts, search_terms, settings)
+    parallel = match_columns(texts, search_terms, settings, n_workers=3)
+    assert parallel == serial
+
+
+def test_iter_match_columns_numbers_across_chunks(search_terms):
+    texts = [
+        IndexedText(text_id=str(i), text=f"qux foo{'bar' * i} baz abc {i}")
+        for i in range(25)
+    ]
+    settings = ContextSettings(nwords=4, prop_before=0.5)
+    serial = match_columns(texts, search_terms, settings)
+    for n_workers in [1, 3]:
+        parts = list(
+            iter_match_columns(
+                iter(texts), search_terms, settings, n_workers=n_workers, chunk_size=4
+            )
+        )
+        assert len(parts) == 7
+        assert _concat(parts) == serial
+
+
+def test_write_match_parquet_roundtrip(tmp_path, search_terms):
+    texts = [
+        IndexedText(text_id=str(i), text=f"qux foo{'bar' * i} baz abc {i}")
+        for i in range(25)
+    ]
+    labels_path = _write_texts(tmp_path / "labels.parquet", texts)
+    settings = ContextSettings(nwords=4, prop_before=0.5)
+    parts = iter_match_columns(
+        iter_parquet_texts(labels_path, batch_size=3),
+        search_terms,
+        settings,
+        chunk_size=4,
+    )
+    output_path = tmp_path / "matches.parquet"
+    n_rows = write_match_parquet(output_path, parts, batch_rows=10)
+
+    expected = match_columns(texts, search_terms, settings)
+    assert n_rows == len(expected["match_id"])
+    parquet_file = pq.ParquetFile(output_path)
+    assert parquet_file.metadata.row_group(0).num_rows == 10
+    assert parquet_file.read().to_pydict() == expected
+
+
+def test_write_match_parquet_empty(tmp_path):
+    output_path = tmp_path / "matches.parquet"
+    assert write_match_parquet(output_path, []) == 0
+    assert pq.read_table(output_path).num_rows == 0
+
+
+def _write_texts(path, texts: list[IndexedText]):
+    table = pa.table(
+        {
+            "text_id": [t.text_id for t in texts],
+            "text": [t.text for t in texts],
+        }
+    )
+    pq.write_table(table, path)
+    return path
+
+
+def _concat(parts: list[dict[str, list]]) -> dict[str, list]:
+    columns = {name: [] for name in parts[0]}
+    for part in parts:
+        for name, values in part.items():
+            columns[name].extend(values)
+    return columns
+
+
+def test_load_term_index_uses_cache(tmp_path, search_terms):
+    vocab_path = _write_texts(tmp_path / "vocab.parquet", search_terms)
+    cache_dir = tmp_path / "cache"
+    built = load_term_index(vocab_path, cache_dir)
+    assert len(list(cache_dir.glob("term_index-*.pkl"))) == 1
+    cached = load_term_index(vocab_path, cache_dir)
+    assert cached.term_ids == built.term_ids
+    assert _find_terms_in_text("foobazab", cached) == _find_terms_in_text(
+        "foobazab", built
+    )
@@ -0,0 +1,73 @@
+"""Tests for onsides.token_cache module."""
+
+import numpy as np
+from transformers import AutoTokenizer
+
+from onsides.token_cache import encode_texts, load_or_encode, token_cache_key
+
+TEXTS = [
+    "headache exact headache EVENT reported in patients",
+    "rash exact EVENT",
+    "nausea and fever were common in patients with the event of rash",
+    "",
+]
+
+
+class _CountingTokenizer:
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.tokenizer(*args, **kwargs)
+
+
+class TestEncodeTexts:
+    def test_matches_per_text_tokenization(self, network_path):
+        tokenizer = AutoTokenizer.from_pretrained(network_path)
+        input_ids, attention_mask = encode_texts(
+            tokenizer, TEXTS, max_length=8, batch_size=3
+        )
+        assert input_ids.dtype == np.int32
+        assert input_ids.shape == attention_mask.shape == (len(TEXTS), 8)
+        for i, text in enumerate(TEXTS):
+            expected = tokenizer(
+                text, padding="max_length", max_length=8, truncation=True
+            )
+            assert input_ids[i].tolist() == expected["input_ids"]
+            assert attention_mask[i].tolist() == expected["attention_mask"]
+
+    def test_empty(self, network_path):
+        tokenizer = AutoTokenizer.from_pretrained(network_path)
+        input_ids, attention_mask = encode_texts(tokenizer, [], max_length=8)
+        assert input_ids.shape == (0, 8)
+
+
+class TestLoadOrEncode:
+    def test_cache_hit_skips_tokenizer(self, network_path, tmp_path):
+        tokenizer = _CountingTokenizer(AutoTokenizer.from_pretrained(network_path))
+        first = load_or_encode(tokenizer, network_path, TEXTS, 16, cache_dir=tmp_path)
+        calls = tokenizer.calls
+        second = load_or_encode(tokenizer, network_path, TEXTS, 16, cache_dir=tmp_path)
+
+        assert tokenizer.calls == calls
+        assert isinstance(second[0], np.memmap)
+        for a, b in zip(first, second):
+            np.testing.assert_array_equal(a, b)
+
+    def test_no_cache_dir(self, network_path, tmp_path):
+        tokenizer = AutoTokenizer.from_pretrained(network_path)
+        load_or_encode(tokenizer, network_path, TEXTS, 16, cache_dir=None)
+        assert not list(tmp_path.iterdir())
+
+    def test_key_depends_on_inputs(self, network_path, tmp_path):
+        key = token_cache_key(network_path, TEXTS, 16)
+        assert key == token_cache_key(network_path, list(TEXTS), 16)
+        assert key != token_cache_key(network_path, TEXTS, 32)
+        assert key != token_cache_key(network_path, TEXTS[:-1], 16)
+        assert key != token_cache_key(tmp_path, TEXTS, 16)
+        # Text boundaries are part of the key
+        assert token_cache_key(network_path, ["ab", "c"], 16) != (
+            token_cache_key(network_path, ["a", "bc"], 16)
+        )
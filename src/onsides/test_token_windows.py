@@ -0,0 +1,150 @@
+"""Tests for onsides.token_windows module."""
+
+import random
+
+import pyarrow.parquet as pq
+import pytest
+from transformers import BertTokenizerFast
+
+from onsides.stringsearch import (
+    MATCH_TOKENS_SCHEMA,
+    ContextSettings,
+    _build_bert_string,
+    _build_search_tree,
+    find_matches,
+    iter_match_columns,
+    write_match_parquet,
+)
+from onsides.token_windows import WindowEncoder
+from onsides.types import IndexedText
+
+VOCAB = [
+    "[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]",
+    "headache", "nausea", "fever", "rash", "reported", "in", "patients",
+    "with", "and", "the", "event", "common", "head", "##ache", "##s", "##es",
+    "##ea", "##ing", ",", ".", "(", ")", "-",
+]
+
+WORDS = [
+    "headache", "headaches", "Nausea,", "fever.", "(rash)", "rashes",
+    "reported", "in", "patients", "with", "and", "the", "common", "café",
+    "x-ray", "\tin\n", "rash-like", "Événement", "foo",
+]
+
+TERMS = [
+    IndexedText(text_id=str(i), text=t)
+    for i, t in enumerate(["rash", "headache", "nausea", "ache", "fever", "in pat"])
+]
+
+
+@pytest.fixture(scope="module")
+def tokenizer_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("tokenizer")
+    (path / "vocab.txt").write_text("\n".join(VOCAB) + "\n")
+    BertTokenizerFast(str(path / "vocab.txt")).save_pretrained(path)
+    return path
+
+
+def _random_labels(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 60)))
+        for _ in range(n)
+    ]
+
+
+class TestWindowEncoder:
+    @pytest.mark.parametrize("max_length", [8, 32, 256])
+    @pytest.mark.parametrize("nwords", [5, 125])
+    def test_matches_tokenized_context(self, tokenizer_path, max_length, nwords):
+        tokenizer = BertTokenizerFast.from_pretrained(tokenizer_path)
+        encoder = WindowEncoder(tokenizer_path, max_length, nwords=nwords)
+        term_index = _build_search_tree(TERMS)
+        n_matches = 0
+        for text in _random_labels(20):
+            label = encoder.encode_label(text)
+            assert label.exact
+            for _, term_idx, start, end in find_matches([text], term_index).tolist():
+                term = term_index.terms[term_idx]
+                context = _build_bert_string(text, term, start, end, nwords)
+                expected = tokenizer(
+                    context, truncation=True, max_length=max_length
+                )["input_ids"]
+                assert encoder.window_ids(label, term, start, end) == expected
+                n_matches += 1
+        assert n_matches > 100
+
+    def test_falls_back_when_tokens_cross_words(self, tokenizer_path):
+        tokenizer = BertTokenizerFast.from_pretrained(tokenizer_path)
+        encoder = WindowEncoder(tokenizer_path, 32, nwords=10)
+        # str.split() splits on \x1c, but the tokenizer deletes it
+        text = "the rash\x1cheadache in patients"
+        label = encoder.encode_label(text)
+        assert not label.exact
+
+        context = _build_bert_string(text, "rash", 4, 7, 10)
+        expected = tokenizer(context, truncation=True, max_length=32)["input_ids"]
+        assert encoder.window_ids(label, "rash", 4, 7) == expected
+
+    def test_matches_tokenized_context_with_odd_whitespace(self, tokenizer_path):
+        # Differential check over separators that str.split() and the
+        # tokenizer disagree on, including words glued into "##" pieces
+        tokenizer = BertTokenizerFast.from_pretrained(tokenizer_path)
+        encoder = WindowEncoder(tokenizer_path, 32, nwords=10)
+        term_index = _build_search_tree(TERMS)
+        rng = random.Random(2)
+        separators = [" ", "\n", "\xa0", "\u2028", "\x1c", "\x1f", "\x85", "\x0b"]
+        words = WORDS + ["es", "ache", "ing"]
+        n_matches = 0
+        for _ in range(50):
+            text = "".join(
+                rng.choice(words) + rng.choice(separators)
+                for _ in range(rng.randint(1, 30))
+            )
+            label = encoder.encode_label(text)
+            for _, term_idx, start, end in find_matches([text], term_index).tolist():
+                term = term_index.terms[term_idx]
+                context = _build_bert_string(text, term, start, end, 10)
+                expected = tokenizer(
+                    context, truncation=True, max_length=32
+                )["input_ids"]
+                assert encoder.window_ids(label, term, start, end) == expected
+                n_matches += 1
+        assert n_matches > 100
+
+    def test_falls_back_when_word_continues_previous(self, tokenizer_path):
+        encoder = WindowEncoder(tokenizer_path, 32, nwords=10)
+        # The tokenizer reads "rash\x1ces" as "rash ##es"
+        assert not encoder.encode_label("the fever rash\x1ces in patients").exact
+        assert encoder.encode_label("the fever rashes in patients").exact
+
+
+class TestMatchTokens:
+    def test_iter_match_columns_adds_input_ids(self, tokenizer_path, tmp_path):
+        tokenizer = BertTokenizerFast.from_pretrained(tokenizer_path)
+        settings = ContextSettings(nwords=12)
+        encoder = WindowEncoder(tokenizer_path, 16, nwords=12)
+        texts = [
+            IndexedText(text_id=str(i), text=text)
+            for i, text in enumerate(_random_labels(10, seed=1))
+        ]
+        parts = iter_match_columns(
+            texts, TERMS, settings, n_workers=2, chunk_size=3,
+            window_encoder=encoder,
+        )
+        output_path = tmp_path / "matches.parquet"
+        write_match_parquet(output_path, parts, schema=MATCH_TOKENS_SCHEMA)
+
+        matches = pq.read_table(output_path).to_pydict()
+        assert len(matches["context"]) > 0
+        expected = tokenizer(
+            matches["context"], truncation=True, max_length=16
+        )["input_ids"]
+        assert matches["input_ids"] == expected
+
+    def test_rejects_mismatched_window(self, tokenizer_path):
+        encoder = WindowEncoder(tokenizer_path, 16, nwords=12)
+        with pytest.raises(ValueError):
+            list(iter_match_columns(
+                [], TERMS, ContextSettings(nwords=125), window_encoder=encoder
+            ))
@@ -2,6 +2,7 @@
 
 import csv
 import tempfile
+import time
 from pathlib import Path
 
 import numpy as np
@@ -10,17 +11,22 @@ import pytest
 import torch
 from torch.optim import Adam
 
+from onsides import train as train_module
+from onsides.clinicalbert import ClinicalBertClassifier
 from onsides.train import (
+    CheckpointWriter,
     EpochMetrics,
+    RuntimeSettings,
     TrainingConfig,
     batch_size_estimate,
+    bf16_supported,
     build_filename_params,
     load_checkpoint,
     load_reference_data,
     resolve_network,
-    save_checkpoint,
     save_epoch_results,
     split_train_val_test,
+    train,
 )
 
 
@@ -111,6 +117,30 @@ class TestBuildFilenameParams:
         assert "0-AR-60-exact" in result
         assert "TAC" in result
 
+    def test_micro_batch_suffix(self):
+        config = TrainingConfig(
+            ref_path="data/ref.txt",
+            network_path="models/PMB",
+            network_code="PMB",
+            refset=14,
+            refsection="ALL",
+            refnwords=125,
+            refsource="all",
+            np_random_seed=222,
+            split_method="24",
+            epochs=25,
+            learning_rate=1e-06,
+            max_length=256,
+            batch_size=32,
+            micro_batch_size=8,
+        )
+        result = build_filename_params(config)
+        assert result == "14-ALL-125-all_222_24_25_1e-06_256_32_mb8"
+        config.micro_batch_size = 32
+        assert build_filename_params(config) == (
+            "14-ALL-125-all_222_24_25_1e-06_256_32"
+        )
+
 
 class TestTrainingConfigRoundtrip:
     def test_serialize_deserialize(self):
@@ -357,6 +387,47 @@ class TestCheckpointRoundtrip:
             load_checkpoint(path)
 
 
+class TestCheckpointWriter:
+    def test_writes_snapshot(self, tmp_path):
+        model = torch.nn.Linear(4, 2)
+        expected = {k: v.clone() for k, v in model.state_dict().items()}
+        path = tmp_path / "best.pth"
+        with CheckpointWriter() as writer:
+            writer.save(model.state_dict(), path)
+            # Training goes on updating the weights in place
+            with torch.no_grad():
+                model.weight.add_(1.0)
+        loaded = torch.load(path, weights_only=True)
+        for name, value in expected.items():
+            assert torch.equal(loaded[name], value), name
+        torch.nn.Linear(4, 2).load_state_dict(loaded)
+
+    def test_flush_waits_for_writes(self, tmp_path, monkeypatch):
+        atomic_torch_save = train_module.atomic_torch_save
+
+        def slow_save(obj, path):
+            time.sleep(0.05)
+            atomic_torch_save(obj, path)
+
+        monkeypatch.setattr(train_module, "atomic_torch_save", slow_save)
+        writer = CheckpointWriter()
+        paths = [tmp_path / f"{i}.pt" for i in range(3)]
+        for i, path in enumerate(paths):
+            writer.save({"step": torch.tensor(i)}, path)
+        writer.flush()
+        assert all(path.exists() for path in paths)
+        writer.close()
+        writer.close()
+
+    def test_error_is_raised(self, tmp_path):
+        (tmp_path / "file").touch()
+        writer = CheckpointWriter()
+        writer.save({"x": torch.zeros(1)}, tmp_path / "file" / "x.pt")
+        with pytest.raises(FileExistsError):
+            writer.flush()
+        writer.close()
+
+
 class TestSaveEpochResults:
     def test_csv_format(self, tmp_path):
         metrics = [
@@ -399,3 +470,223 @@ class TestSaveEpochResults:
         path = tmp_path / "deep" / "nested" / "results.csv"
         save_epoch_results(path, [])
         assert path.exists()
+
+
+class TestTrain:
+    def _frames(self, n):
+        words = ["headache", "nausea", "rash", "reported", "in", "patients"]
+        rng = np.random.default_rng(0)
+        strings = [" ".join(rng.choice(words, size=8)) for _ in range(n)]
+        classes = ["is_event" if i % 2 else "not_event" for i in range(n)]
+        return pd.DataFrame({"string": strings, "class": classes})
+
+    def _config(self, network_path, dynamic_padding=False, **kwargs):
+        return TrainingConfig(
+            ref_path="data/ref.txt",
+            network_path=str(network_path),
+            network_code="PMB",
+            refset=14,
+            refsection="ALL",
+            refnwords=125,
+            refsource="all",
+            np_random_seed=222,
+            split_method="24",
+            epochs=2,
+            learning_rate=1e-3,
+            max_length=16,
+            batch_size=4,
+            dynamic_padding=dynamic_padding,
+            **kwargs,
+        )
+
+    @pytest.mark.parametrize(
+        "runtime",
+        [
+            RuntimeSettings(),
+            RuntimeSettings(num_workers=1, bf16=True),
+        ],
+    )
+    def test_cpu_runtime(self, network_path, tmp_path, runtime):
+        torch.manual_seed(0)
+        model = ClinicalBertClassifier(network_path)
+        metrics = train(
+            model,
+            self._frames(16),
+            self._frames(8),
+            self._config(network_path, dynamic_padding=runtime.num_workers > 0),
+            tmp_path / "best.pth",
+            tmp_path / "ckpt.pt",
+            token_cache_dir=None,
+            runtime=runtime,
+        )
+        assert len(metrics) == 2
+        assert all(m.samples_per_sec > 0 for m in metrics)
+        assert all(np.isfinite(m.train_loss) for m in metrics)
+        assert (tmp_path / "best.pth").exists()
+
+        checkpoint = load_checkpoint(tmp_path / "ckpt.pt")
+        restored = [EpochMetrics(**m) for m in checkpoint["metrics_history"]]
+        assert restored == metrics
+
+    def test_accumulation_matches_full_batches(self, network_path, tmp_path):
+        states = list()
+        for micro_batch_size in [None, 2]:
+            torch.manual_seed(0)
+            model = ClinicalBertClassifier(network_path)
+            # Dropout would draw different masks for different batch shapes
+            for module in model.modules():
+                if isinstance(module, torch.nn.Dropout):
+                    module.p = 0.0
+            torch.manual_seed(1)
+            out_dir = tmp_path / str(micro_batch_size)
+            metrics = train(
+                model,
+                self._frames(18),
+                self._frames(8),
+                self._config(network_path, micro_batch_size=micro_batch_size),
+                out_dir / "best.pth",
+                out_dir / "ckpt.pt",
+                token_cache_dir=None,
+            )
+            states.append((model.state_dict(), metrics))
+
+        (full, full_metrics), (accumulated, accumulated_metrics) = states
+        for name in full:
+            torch.testing.assert_close(
+                accumulated[name], full[name], rtol=1e-4, atol=1e-5
+            )
+        for a, b in zip(full_metrics, accumulated_metrics):
+            assert a.train_loss == pytest.approx(b.train_loss, rel=1e-4)
+            assert a.valid_loss == pytest.approx(b.valid_loss, rel=1e-4)
+
+    def test_step_validation(self, network_path, tmp_path):
+        torch.manual_seed(0)
+        model = ClinicalBertClassifier(network_path)
+        config = self._config(
+            network_path, eval_every_steps=2, eval_subset_size=4
+        )
+        results_path = tmp_path / "step-results.csv"
+        metrics = train(
+            model,
+            self._frames(18),
+            self._frames(8),
+            config,
+            tmp_path / "best.pth",
+            tmp_path / "ckpt.pt",
+            token_cache_dir=None,
+            step_results_path=results_path,
+        )
+        assert len(metrics) == 2
+        assert (tmp_path / "best.pth").exists()
+
+        # 5 steps per epoch (the last one short); each epoch also validates
+        # the steps after its last due validation
+        with open(results_path) as f:
+            rows = list(csv.DictReader(f))
+        assert [int(r["step"]) for r in rows] == [2, 4, 5, 6, 8, 10]
+        assert [int(r["epoch"]) for r in rows] == [1, 1, 1, 2, 2, 2]
+        assert rows[0]["step_saved"] == "True"
+
+        checkpoint = load_checkpoint(tmp_path / "ckpt.pt")
+        assert checkpoint["global_step"] == 10
+        assert len(checkpoint["step_validation"]["history"]) == 6
+
+    def test_step_patience(self, network_path, tmp_path):
+        torch.manual_seed(0)
+        model = ClinicalBertClassifier(network_path)
+        # Nothing is learned, so no validation after the first improves
+        config = self._config(
+            network_path, eval_every_steps=2, step_patience=2
+        )
+        config.learning_rate = 0.0
+        results_path = tmp_path / "step-results.csv"
+        metrics = train(
+            model,
+            self._frames(18),
+            self._frames(8),
+            config,
+            tmp_path / "best.pth",
+            tmp_path / "ckpt.pt",
+            token_cache_dir=None,
+            step_results_path=results_path,
+        )
+        assert len(metrics) == 1
+        with open(results_path) as f:
+            rows = list(csv.DictReader(f))
+        assert [r["step_saved"] for r in rows] == ["True", "False", "False"]
+
+    @pytest.mark.parametrize("dynamic_padding", [False, True])
+    def test_mid_epoch_resume_is_exact(
+        self, network_path, tmp_path, monkeypatch, dynamic_padding
+    ):
+        config = self._config(
+            network_path, dynamic_padding=dynamic_padding, micro_batch_size=2,
+            eval_every_steps=3,
+        )
+        runtime = RuntimeSettings(checkpoint_every_steps=2)
+
+        def run(out_dir, resume_from=None):
+            torch.manual_seed(0)
+            model = ClinicalBertClassifier(network_path)
+            if resume_from is not None:
+                model.load_state_dict(resume_from["model_state_dict"])
+            torch.manual_seed(1)
+            with CheckpointWriter() as writer:
+                metrics = train(
+                    model, self._frames(18), self._frames(8), config,
+                    out_dir / "best.pth", out_dir / "ckpt.pt",
+                    resume_from=resume_from, token_cache_dir=None,
+                    runtime=runtime, step_results_path=out_dir / "steps.csv",
+                    checkpoint_writer=writer,
+                )
+            return model, metrics
+
+        expected_model, expected_metrics = run(tmp_path / "full")
+
+        # Preempt the run right after its third mid-epoch checkpoint (epoch 2)
+        original_save_checkpoint = train_module.save_checkpoint
+        n_mid_epoch = 0
+
+        def preempted_save(*args, **kwargs):
+            nonlocal n_mid_epoch
+            original_save_checkpoint(*args, **kwargs)
+            if kwargs.get("epoch_progress") is not None:
+                n_mid_epoch += 1
+                if n_mid_epoch == 3:
+                    raise KeyboardInterrupt
+
+        out_dir = tmp_path / "resumed"
+        monkeypatch.setattr(train_module, "save_checkpoint", preempted_save)
+        with pytest.raises(KeyboardInterrupt):
+            run(out_dir)
+        monkeypatch.undo()
+
+        checkpoint = load_checkpoint(out_dir / "ckpt.pt")
+        assert checkpoint["epoch"] == 0
+        assert checkpoint["epoch_progress"]["epoch"] == 1
+        model, metrics = run(out_dir, resume_from=checkpoint)
+
+        for name, param in expected_model.state_dict().items():
+            assert torch.equal(model.state_dict()[name], param), name
+        for a, b in zip(expected_metrics, metrics):
+            assert a.model_dump(exclude={"epoch_time", "samples_per_sec"}) == (
+                b.model_dump(exclude={"epoch_time", "samples_per_sec"})
+            )
+        assert (out_dir / "steps.csv").read_text().count("\n") == (
+            (tmp_path / "full" / "steps.csv").read_text().count("\n")
+        )
+
+    def test_metrics_from_older_checkpoints(self):
+        metrics = EpochMetrics(
+            epoch=1,
+            train_loss=0.5,
+            train_accuracy=0.7,
+            valid_loss=0.4,
+            valid_accuracy=0.75,
+            epoch_time=120.0,
+            epoch_saved=True,
+        )
+        assert metrics.samples_per_sec is None
+
+    def test_bf16_supported_on_cpu_is_bool(self):
+        assert isinstance(bf16_supported(torch.device("cpu")), bool)
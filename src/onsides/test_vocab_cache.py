@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from onsides.vocab_cache import atomic_write, content_key, load_or_build
+
+
+def test_content_key_tracks_contents(tmp_path):
+    cache_dir = tmp_path / "cache"
+    path = tmp_path / "vocab.parquet"
+    path.write_bytes(b"one")
+    key1 = content_key([path], cache_dir)
+    assert content_key([path], cache_dir) == key1
+
+    path.write_bytes(b"two")
+    os.utime(path, ns=(1, 1))
+    assert content_key([path], cache_dir) != key1
+
+
+def test_content_key_distinguishes_missing_files(tmp_path):
+    cache_dir = tmp_path / "cache"
+    path = tmp_path / "vocab.parquet"
+    path.write_bytes(b"one")
+    with_optional = content_key([path, tmp_path / "CONCEPT.csv"], cache_dir)
+    assert with_optional != content_key([path], cache_dir)
+    assert with_optional == content_key([path, None], cache_dir)
+
+
+def test_load_or_build_builds_once(tmp_path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"a": (1, 2)}
+
+    first = load_or_build("thing", "abc123", build, tmp_path)
+    second = load_or_build("thing", "abc123", build, tmp_path)
+    assert first == second == {"a": (1, 2)}
+    assert len(calls) == 1
+
+    load_or_build("thing", "def456", build, tmp_path)
+    assert len(calls) == 2
+
+
+def test_load_or_build_recovers_from_corrupt_file(tmp_path):
+    load_or_build("thing", "abc123", lambda: 1, tmp_path)
+    (cache_file,) = tmp_path.glob("thing-*.pkl")
+    cache_file.write_bytes(b"not a pickle")
+    assert load_or_build("thing", "abc123", lambda: 2, tmp_path) == 2
+
+
+def test_load_or_build_without_cache_dir(tmp_path):
+    assert load_or_build("thing", "abc123", lambda: 3, None) == 3
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    path = tmp_path / "nested" / "data.bin"
+    atomic_write(path, lambda f: f.write(b"old"))
+
+    def fail(f):
+        f.write(b"partial")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        atomic_write(path, fail)
+    assert path.read_bytes() == b"old"
+    assert list(path.parent.iterdir()) == [path]
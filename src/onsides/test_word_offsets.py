@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from onsides.word_offsets import WordOffsets
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "   ",
+        "foo",
+        "foo bar baz",
+        "  leading and trailing  ",
+        "tabs\tand\nnewlines\r\nmixed",
+        "no break em space　ideographic",
+    ],
+)
+def test_matches_str_split_everywhere(text: str):
+    offsets = WordOffsets(text)
+    assert len(offsets) == len(text.split())
+    for pos in range(len(text) + 2):
+        for n in [1, 2, 5]:
+            assert offsets.words_before(pos, n) == text[:pos].split()[-n:]
+        for n in [0, 1, 2, 5]:
+            assert offsets.words_after(pos, n) == text[pos:].split()[:n]
+
+
+def test_matches_str_split_random():
+    rng = random.Random(0)
+    alphabet = "ab \t\n "
+    for _ in range(200):
+        text = "".join(rng.choices(alphabet, k=rng.randint(0, 40)))
+        offsets = WordOffsets(text)
+        pos = rng.randint(0, len(text))
+        n = rng.randint(1, 6)
+        assert offsets.words_before(pos, n) == text[:pos].split()[-n:]
+        assert offsets.words_after(pos, n) == text[pos:].split()[:n]
@@ -0,0 +1,119 @@
+"""
+token_cache.py
+
+Batched tokenization of BERT inputs into contiguous int32 arrays, with an
+on-disk cache of memory-mapped ``.npy`` files keyed by tokenizer path,
+max_length and a hash of the texts. Repeat training runs and evaluations over
+the same reference file load the arrays instead of re-tokenizing.
+"""
+
+import hashlib
+import logging
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from onsides.vocab_cache import CACHE_DIR, CACHE_VERSION, atomic_write
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_DIR = CACHE_DIR / "tokens"
+
+ENCODE_BATCH_SIZE = 10_000
+
+
+def encode_texts(
+    tokenizer,
+    texts: Sequence[str],
+    max_length: int,
+    batch_size: int = ENCODE_BATCH_SIZE,
+) -> tuple[NDArray[np.int32], NDArray[np.int32]]:
+    """Tokenize `texts` in batches, padded and truncated to `max_length`.
+
+    Returns (input_ids, attention_mask), each an int32 array of shape
+    (len(texts), max_length).
+    """
+    input_ids = np.zeros((len(texts), max_length), dtype=np.int32)
+    attention_mask = np.zeros((len(texts), max_length), dtype=np.int32)
+    for start in range(0, len(texts), batch_size):
+        stop = min(start + batch_size, len(texts))
+        encoded = tokenizer(
+            list(texts[start:stop]),
+            padding="max_length",
+            max_length=max_length,
+            truncation=True,
+            return_tensors="np",
+        )
+        input_ids[start:stop] = encoded["input_ids"]
+        attention_mask[start:stop] = encoded["attention_mask"]
+        logger.debug(f"Tokenized {stop}/{len(texts)} texts")
+    return input_ids, attention_mask
+
+
+def pad_token_ids(
+    token_ids: Sequence[Sequence[int]],
+    max_length: int,
+    pad_token_id: int = 0,
+) -> tuple[NDArray[np.int32], NDArray[np.int32]]:
+    """Pack already-tokenized inputs into the arrays `encode_texts` returns.
+
+    Sequences longer than `max_length` are cut, as with truncation.
+    """
+    input_ids = np.full((len(token_ids), max_length), pad_token_id, dtype=np.int32)
+    attention_mask = np.zeros((len(token_ids), max_length), dtype=np.int32)
+    for i, ids in enumerate(token_ids):
+        n = min(len(ids), max_length)
+        input_ids[i, :n] = ids[:n]
+        attention_mask[i, :n] = 1
+    return input_ids, attention_mask
+
+
+def load_or_encode(
+    tokenizer,
+    tokenizer_path: Path,
+    texts: Sequence[str],
+    max_length: int,
+    cache_dir: Path | None = TOKEN_CACHE_DIR,
+) -> tuple[NDArray[np.int32], NDArray[np.int32]]:
+    """`encode_texts`, cached in `cache_dir` (None to always tokenize).
+
+    Cached arrays are returned memory-mapped read-only, so they cost no
+    resident memory until the rows are touched.
+    """
+    if cache_dir is None:
+        return encode_texts(tokenizer, texts, max_length)
+
+    key = token_cache_key(tokenizer_path, texts, max_length)
+    paths = {
+        name: cache_dir / f"{key[:20]}.{name}.npy"
+        for name in ("input_ids", "attention_mask")
+    }
+    if all(path.exists() for path in paths.values()):
+        try:
+            arrays = tuple(np.load(path, mmap_mode="r") for path in paths.values())
+            if all(a.shape == (len(texts), max_length) for a in arrays):
+                logger.info(f"Loaded {len(texts)} tokenized texts from {cache_dir}")
+                return arrays
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable token cache {paths}: {e}")
+
+    input_ids, attention_mask = encode_texts(tokenizer, texts, max_length)
+    atomic_write(paths["input_ids"], lambda f: np.save(f, input_ids))
+    atomic_write(paths["attention_mask"], lambda f: np.save(f, attention_mask))
+    logger.info(f"Cached {len(texts)} tokenized texts in {cache_dir}")
+    return input_ids, attention_mask
+
+
+def token_cache_key(
+    tokenizer_path: Path, texts: Sequence[str], max_length: int
+) -> str:
+    """SHA-256 over the tokenizer path, max_length and every text, in order."""
+    key = hashlib.sha256(
+        f"v{CACHE_VERSION}\0{Path(tokenizer_path).resolve()}\0{max_length}\0".encode()
+    )
+    for text in texts:
+        key.update(text.encode())
+        key.update(b"\0")
+    return key.hexdigest()
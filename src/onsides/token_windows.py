@@ -0,0 +1,220 @@
+"""
+token_windows.py
+
+Builds BERT inputs for string matches straight from token ids.
+
+The standard pipeline writes a ~125-word context string per match
+(`stringsearch._build_bert_string`) and tokenizes every one of them again at
+inference time, so a label with many matches has the same words WordPiece-
+tokenized once per overlapping window. `WindowEncoder` instead tokenizes each
+label once, with offsets, and maps every whitespace-delimited word to its
+span of tokens. A match's input ids are then assembled by concatenating
+cached token ids as ``[CLS] term ... EVENT ... [SEP]``, which is exactly what
+the tokenizer produces for the context string, truncated to `max_length`.
+
+BERT's pre-tokenizer never merges text across whitespace, so the tokens of
+the joined context string are the tokens of its words in order. Partial
+words (a match starting or ending inside a word) are tokenized on their own.
+Labels for which that assumption fails (characters that `str.split` treats
+as whitespace but the tokenizer deletes, such as \\x1c-\\x1f and \\x85) fall
+back to tokenizing the context string.
+"""
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from onsides.word_offsets import WordOffsets
+
+# Bounds the memo of term / partial-word token ids on very large corpora
+_MAX_CACHED_PIECES = 200_000
+
+
+@dataclass
+class LabelTokens:
+    """One label's token ids and the token span of each word."""
+
+    offsets: WordOffsets
+    ids: list[int]
+    # Tokens of word i are ids[word_token_starts[i] : word_token_ends[i]]
+    word_token_starts: NDArray[np.intp]
+    word_token_ends: NDArray[np.intp]
+    # False if some token crosses a word boundary; windows are then
+    # tokenized from their strings instead
+    exact: bool
+
+
+class WindowEncoder:
+    """
+    Token-id equivalent of `_build_bert_string` + tokenizer, per label.
+
+    Args:
+        tokenizer_path: Pretrained tokenizer (must be a fast tokenizer, for
+            offset mappings).
+        max_length: Length the inputs are truncated to, as in `Dataset`.
+        nwords: Words per context window (`ContextSettings.nwords`).
+        prop_before: Share of the window before the match.
+    """
+
+    def __init__(
+        self,
+        tokenizer_path: Path,
+        max_length: int,
+        nwords: int = 125,
+        prop_before: float = 0.125,
+    ):
+        # Imported here so that stringsearch does not pull in transformers
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        if not self.tokenizer.is_fast:
+            raise ValueError(f"{tokenizer_path} has no fast tokenizer")
+        self.max_length = max_length
+        self.nwords = nwords
+        self.prop_before = prop_before
+        self._piece_ids: dict[str, list[int]] = dict()
+        # Whitespace characters -> whether the tokenizer also splits on them
+        self._splits_words: dict[str, bool] = dict()
+        self._event_ids = self.tokenizer("EVENT", add_special_tokens=False)[
+            "input_ids"
+        ]
+
+    def encode_label(self, text: str) -> LabelTokens:
+        """Tokenize a whole label once."""
+        offsets = WordOffsets(text)
+        encoding = self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False,
+        )
+        token_spans = np.array(encoding["offset_mapping"], dtype=np.intp)
+        token_spans = token_spans.reshape(-1, 2)
+        word_starts = np.array(offsets.starts, dtype=np.intp)
+        word_ends = np.array(offsets.ends, dtype=np.intp)
+
+        word_token_starts = np.searchsorted(token_spans[:, 0], word_starts)
+        word_token_ends = np.searchsorted(token_spans[:, 0], word_ends)
+        token_words = np.searchsorted(word_starts, token_spans[:, 0], "right") - 1
+        # A word's first token must start a tokenizer word too, or the
+        # tokenizer glued it to the previous word (e.g. "rash\x1ces" is
+        # "rash ##es" but splits into "rash" "es")
+        tokenizer_words = np.array(encoding.word_ids(), dtype=np.intp)
+        first_tokens = word_token_starts[
+            (word_token_starts < word_token_ends) & (word_token_starts > 0)
+        ]
+        exact = bool(
+            (token_words >= 0).all()
+            and (token_spans[:, 1] <= word_ends[token_words]).all()
+            and (
+                tokenizer_words[first_tokens] != tokenizer_words[first_tokens - 1]
+            ).all()
+            and not self._has_foreign_whitespace(text)
+        )
+        return LabelTokens(
+            offsets=offsets,
+            ids=encoding["input_ids"],
+            word_token_starts=word_token_starts,
+            word_token_ends=word_token_ends,
+            exact=exact,
+        )
+
+    def _has_foreign_whitespace(self, text: str) -> bool:
+        """Whether `text` has whitespace the tokenizer does not split on.
+
+        `str.split` splits on e.g. \\x1c-\\x1f and \\x85; the tokenizer deletes them.
+        """
+        for char in set(text):
+            if not char.isspace():
+                continue
+            splits = self._splits_words.get(char)
+            if splits is None:
+                word_ids = self.tokenizer(
+                    f"a{char}a", add_special_tokens=False
+                ).word_ids()
+                splits = len(set(word_ids)) == 2
+                self._splits_words[char] = splits
+            if not splits:
+                return True
+        return False
+
+    def window_ids(
+        self, label: LabelTokens, term: str, start: int, end: int
+    ) -> list[int]:
+        """Input ids for the match of `term` at `start`..`end` (inclusive).
+
+        Equal to tokenizing `_build_bert_string(...)` with truncation to
+        `max_length`, without special-token padding.
+        """
+        text = label.offsets.text
+        term_nwords = len(term.split())
+        n_words_before = self.prop_before * (self.nwords - 2 * term_nwords)
+        n_words_after = (1 - self.prop_before) * (self.nwords - 2 * term_nwords)
+        n_words_before = max(int(n_words_before), 1)
+        n_words_after = max(int(n_words_after), 1)
+
+        if not label.exact:
+            # stringsearch imports this module for its token-id output
+            from onsides.stringsearch import _build_bert_string
+
+            context = _build_bert_string(
+                text, term, start, end, self.nwords, self.prop_before,
+                offsets=label.offsets,
+            )
+            return self.tokenizer(
+                context, truncation=True, max_length=self.max_length
+            )["input_ids"]
+
+        budget = self.max_length - 2
+        ids = list(self._tokenize(term))
+
+        # Words before the match; the last may be cut by the match start
+        offsets = label.offsets
+        stop = bisect_left(offsets.starts, start)
+        first = max(stop - n_words_before, 0)
+        partial_last = stop > first and offsets.ends[stop - 1] > start
+        full_stop = stop - 1 if partial_last else stop
+        if full_stop > first:
+            ids.extend(self._word_span(label, first, full_stop))
+        if partial_last:
+            ids.extend(self._tokenize(text[offsets.starts[stop - 1] : start]))
+        ids.extend(self._event_ids)
+
+        # Words after the match; the first may be cut by the match end. Only
+        # as many tokens as still fit are copied.
+        pos = end + 1
+        after_first = bisect_right(offsets.ends, pos)
+        after_stop = min(after_first + n_words_after, len(offsets))
+        if after_first < after_stop and offsets.starts[after_first] < pos:
+            ids.extend(self._tokenize(text[pos : offsets.ends[after_first]]))
+            after_first += 1
+        if len(ids) < budget and after_first < after_stop:
+            ids.extend(
+                self._word_span(label, after_first, after_stop, budget - len(ids))
+            )
+
+        ids = ids[:budget]
+        return [self.tokenizer.cls_token_id, *ids, self.tokenizer.sep_token_id]
+
+    def _word_span(
+        self, label: LabelTokens, first: int, stop: int, limit: int | None = None
+    ) -> list[int]:
+        """Token ids of words `first`..`stop` (exclusive), at most `limit`."""
+        token_start = int(label.word_token_starts[first])
+        token_stop = int(label.word_token_ends[stop - 1])
+        if limit is not None:
+            token_stop = min(token_stop, token_start + limit)
+        return label.ids[token_start:token_stop]
+
+    def _tokenize(self, piece: str) -> list[int]:
+        """Token ids of a term or partial word, memoized."""
+        ids = self._piece_ids.get(piece)
+        if ids is None:
+            if len(self._piece_ids) >= _MAX_CACHED_PIECES:
+                self._piece_ids.clear()
+            ids = self.tokenizer(piece, add_special_tokens=False)["input_ids"]
+            self._piece_ids[piece] = ids
+        return ids
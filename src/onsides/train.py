@@ -10,13 +10,16 @@ Usage:
 """
 
 import argparse
+import atexit
 import csv
 import logging
-import os
+import queue
 import random
 import sys
-import tempfile
+import threading
 import time
+from collections.abc import Callable
+from contextlib import nullcontext
 from pathlib import Path
 
 import numpy as np
@@ -27,7 +30,9 @@ from torch import nn
 from torch.optim import Adam
 from tqdm import tqdm
 
-from onsides.clinicalbert import ClinicalBertClassifier, Dataset
+from onsides.clinicalbert import ClinicalBertClassifier, Dataset, make_dataloader
+from onsides.token_cache import TOKEN_CACHE_DIR
+from onsides.vocab_cache import atomic_write
 
 logger = logging.getLogger(__name__)
 
@@ -80,9 +85,18 @@ class TrainingConfig(BaseModel):
     epochs: int
     learning_rate: float
     max_length: int
+    # Effective batch size: samples per optimizer step
     batch_size: int
+    # Samples per forward/backward; gradients are accumulated over
+    # batch_size / micro_batch_size of them. None means batch_size.
+    micro_batch_size: int | None = None
     pretrained_state: str | None = None
     flag_label: str = ""
+    dynamic_padding: bool = False
+    # Step-level validation (see `StepValidator`); None validates per epoch
+    eval_every_steps: int | None = None
+    eval_subset_size: int | None = None
+    step_patience: int | None = None
 
 
 class EpochMetrics(BaseModel):
@@ -95,6 +109,66 @@ class EpochMetrics(BaseModel):
     valid_accuracy: float
     epoch_time: float
     epoch_saved: bool
+    # Training examples per second of the training pass (not validation);
+    # None for checkpoints written before it was recorded
+    samples_per_sec: float | None = None
+
+
+class RuntimeSettings(BaseModel):
+    """Machine-specific training options.
+
+    These change speed, not the model's identity, so they are not part of
+    `TrainingConfig` or the model filename and can differ on resume.
+    """
+
+    num_workers: int = 0
+    intra_op_threads: int | None = None
+    inter_op_threads: int | None = None
+    bf16: bool = False
+    # Mid-epoch checkpoints, by optimizer steps and/or wall-clock time
+    checkpoint_every_steps: int | None = None
+    checkpoint_every_minutes: float | None = None
+
+    def checkpoint_due(self, step: int, last_checkpoint: float) -> bool:
+        """Whether to checkpoint after `step`; `last_checkpoint` is monotonic."""
+        if self.checkpoint_every_steps and step % self.checkpoint_every_steps == 0:
+            return True
+        minutes = self.checkpoint_every_minutes
+        return bool(minutes) and time.monotonic() - last_checkpoint >= minutes * 60
+
+
+class EpochProgress(BaseModel):
+    """Running totals of an unfinished epoch, kept in mid-epoch checkpoints.
+
+    Mid-epoch checkpoints are only written right after an optimizer step, so
+    no accumulated gradients are pending.
+    """
+
+    epoch: int
+    # Micro-batches of this epoch already trained on
+    batches_done: int = 0
+    total_loss_train: float = 0.0
+    total_acc_train: int = 0
+    n_trained: int = 0
+    # Per-step mean losses since the last step-level validation
+    interval_loss: float = 0.0
+    interval_steps: int = 0
+    saved_model: bool = False
+    train_seconds: float = 0.0
+
+
+class StepMetrics(BaseModel):
+    """Metrics for one step-level validation."""
+
+    epoch: int
+    step: int
+    # Mean per-step training loss since the previous validation
+    train_loss: float
+    # Mean per-example loss on the validation subset
+    valid_loss: float
+    valid_accuracy: float
+    elapsed_time: float
+    step_saved: bool
 
 
 def batch_size_estimate(max_length: int) -> int:
@@ -197,28 +271,158 @@ def split_train_val_test(
 def build_filename_params(config: TrainingConfig) -> str:
     """Build the parameter portion of model filename for compatibility."""
     flag_part = f"{config.flag_label}_" if config.flag_label else ""
+    micro_part = ""
+    if config.micro_batch_size not in (None, config.batch_size):
+        micro_part = f"_mb{config.micro_batch_size}"
     return (
         f"{config.refset}-{config.refsection}-{config.refnwords}-{config.refsource}_"
         f"{flag_part}"
         f"{config.np_random_seed}_{config.split_method}_{config.epochs}_"
         f"{config.learning_rate}_{config.max_length}_{config.batch_size}"
+        f"{micro_part}"
     )
 
 
-def _atomic_torch_save(obj: object, path: Path) -> None:
-    """Write a torch save file atomically via temp file + rename."""
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp_fd, tmp_path_str = tempfile.mkstemp(
-        dir=path.parent, suffix=".tmp", prefix=path.stem
+def configure_threads(settings: RuntimeSettings) -> None:
+    """Pin PyTorch's intra-op and inter-op thread pools.
+
+    Call before any model work: the inter-op pool can only be sized once.
+    """
+    if settings.intra_op_threads is not None:
+        torch.set_num_threads(settings.intra_op_threads)
+    if settings.inter_op_threads is not None:
+        try:
+            torch.set_num_interop_threads(settings.inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set inter-op threads: {e}")
+    logger.info(
+        f"Torch threads: intra-op={torch.get_num_threads()}, "
+        f"inter-op={torch.get_num_interop_threads()}"
+    )
+
+
+def bf16_supported(device: torch.device) -> bool:
+    """Whether `device` has native bfloat16 matmuls."""
+    if device.type == "cuda":
+        return torch.cuda.is_bf16_supported()
+    # AVX512-BF16 / AMX on x86, or the ARM equivalent, via oneDNN
+    is_supported = getattr(torch.ops.mkldnn, "_is_mkldnn_bf16_supported", None)
+    return bool(
+        torch.backends.mkldnn.is_available()
+        and is_supported is not None
+        and is_supported()
     )
-    os.close(tmp_fd)
-    tmp_path = Path(tmp_path_str)
-    try:
-        torch.save(obj, tmp_path)
-        tmp_path.replace(path)
-    except BaseException:
-        tmp_path.unlink(missing_ok=True)
-        raise
+
+
+def _apply_accumulated(
+    model: nn.Module, optimizer: Adam, n_samples: int
+) -> None:
+    """Average the summed micro-batch gradients over the step and apply."""
+    for param in model.parameters():
+        if param.grad is not None:
+            param.grad.div_(n_samples)
+    optimizer.step()
+    model.zero_grad()
+
+
+def atomic_torch_save(obj: object, path: Path) -> None:
+    """Write a torch save file atomically via temp file + rename."""
+    atomic_write(path, lambda f: torch.save(obj, f))
+
+
+def _to_cpu(obj: object) -> object:
+    """Copy of `obj` with every tensor (in nested dicts/lists) cloned to CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        copied = type(obj)((key, _to_cpu(value)) for key, value in obj.items())
+        # State dicts carry per-module versions for `load_state_dict`
+        if hasattr(obj, "_metadata"):
+            copied._metadata = obj._metadata
+        return copied
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+class CheckpointWriter:
+    """
+    Writes torch save files atomically on a background thread.
+
+    `save` snapshots the object's tensors to CPU memory, so training can go
+    on updating the originals, and queues the write. At most one write waits
+    behind the one in progress; a further `save` blocks until it is taken.
+    `flush` waits for all queued writes. `close` (also run on leaving a
+    `with` block, and at interpreter exit if it was not called) flushes and
+    stops the thread. A failed write is re-raised by the next `save`,
+    `flush` or `close`.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue[tuple[object, Path] | None] = queue.Queue(
+            maxsize=1
+        )
+        self._error: BaseException | None = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="onsides-checkpoint-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def save(self, obj: object, path: Path) -> None:
+        self._raise_error()
+        self._queue.put((_to_cpu(obj), path))
+
+    def flush(self) -> None:
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not None:
+            obj, path = item
+            try:
+                start = time.perf_counter()
+                atomic_torch_save(obj, path)
+                logger.info(
+                    f"Wrote {path} in the background "
+                    f"({time.perf_counter() - start:.1f}s)"
+                )
+            except BaseException as e:
+                logger.exception(f"Writing {path} failed")
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._queue.task_done()
+        self._queue.task_done()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def __enter__(self) -> "CheckpointWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _save(obj: object, path: Path, writer: CheckpointWriter | None) -> None:
+    """Write through `writer` if given, else synchronously."""
+    if writer is None:
+        atomic_torch_save(obj, path)
+    else:
+        writer.save(obj, path)
 
 
 def save_checkpoint(
@@ -230,8 +434,19 @@ def save_checkpoint(
     epochs_since_best: int,
     metrics_history: list[EpochMetrics],
     config: TrainingConfig,
+    global_step: int = 0,
+    step_validation: dict | None = None,
+    epoch_progress: dict | None = None,
+    writer: CheckpointWriter | None = None,
 ) -> None:
-    """Save a training checkpoint that can be used to resume."""
+    """Save a training checkpoint that can be used to resume.
+
+    `epoch` is the last completed epoch; `epoch_progress` (an
+    `EpochProgress`) marks a checkpoint taken partway through the next one.
+    The RNG states are saved too, so a resumed run draws the same dropout
+    masks as an uninterrupted one. With a `writer`, the file is written in
+    the background.
+    """
     checkpoint = {
         "model_state_dict": model.state_dict(),
         "optimizer_state_dict": optimizer.state_dict(),
@@ -240,9 +455,30 @@ def save_checkpoint(
         "epochs_since_best": epochs_since_best,
         "metrics_history": [m.model_dump() for m in metrics_history],
         "training_config": config.model_dump(),
+        "global_step": global_step,
+        "step_validation": step_validation,
+        "epoch_progress": epoch_progress,
+        "rng_state": _rng_state(),
+    }
+    _save(checkpoint, path, writer)
+    logger.info(f"Checkpoint {'queued for' if writer else 'saved to'} {path}")
+
+
+def _rng_state() -> dict:
+    return {
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        "numpy": np.random.get_state(),
+        "python": random.getstate(),
     }
-    _atomic_torch_save(checkpoint, path)
-    logger.info(f"Checkpoint saved to {path}")
+
+
+def _set_rng_state(state: dict) -> None:
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
 
 
 def load_checkpoint(path: Path) -> dict:
@@ -291,6 +527,154 @@ def save_epoch_results(path: Path, metrics: list[EpochMetrics]) -> None:
             ])
 
 
+def save_step_results(path: Path, metrics: list[StepMetrics]) -> None:
+    """Write step-level validation metrics to CSV."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    columns = list(StepMetrics.model_fields)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for m in metrics:
+            writer.writerow([getattr(m, c) for c in columns])
+
+
+def _validate(
+    model: nn.Module,
+    loader: torch.utils.data.DataLoader,
+    criterion: nn.Module,
+    device: torch.device,
+    autocast: Callable,
+) -> tuple[float, int]:
+    """Summed `criterion` values and number of correct predictions."""
+    model.eval()
+    total_loss = 0.0
+    total_correct = 0
+    with torch.no_grad():
+        for inputs, labels in loader:
+            labels = labels.to(device)
+            mask = inputs["attention_mask"].squeeze(1).to(device)
+            input_id = inputs["input_ids"].squeeze(1).to(device)
+
+            with autocast():
+                output = model(input_id, mask)
+                batch_loss = criterion(output, labels)
+            total_loss += batch_loss.item()
+            total_correct += (output.argmax(dim=1) == labels).sum().item()
+    return total_loss, total_correct
+
+
+class StepValidator:
+    """
+    Validation every `config.eval_every_steps` optimizer steps.
+
+    Runs on a fixed validation subset: `config.eval_subset_size` examples
+    drawn once with the run's seed (all of them if None), tokenized through
+    the token cache. Each validation that improves on the best mean loss so
+    far saves the model to `bestepoch_path`; after `config.step_patience`
+    validations in a row without improvement, `should_stop` is True.
+    """
+
+    def __init__(
+        self,
+        val_texts: list[str],
+        val_labels: list[int],
+        config: TrainingConfig,
+        bestepoch_path: Path,
+        results_path: Path | None = None,
+        token_cache_dir: Path | None = TOKEN_CACHE_DIR,
+        num_workers: int = 0,
+        writer: CheckpointWriter | None = None,
+    ):
+        self.config = config
+        self.bestepoch_path = bestepoch_path
+        self.writer = writer
+        self.results_path = results_path
+        self.best_loss: float | None = None
+        self.evals_since_best = 0
+        self.history: list[StepMetrics] = []
+
+        n_subset = config.eval_subset_size
+        if n_subset is not None and n_subset < len(val_texts):
+            rng = np.random.default_rng(config.np_random_seed)
+            rows = np.sort(rng.choice(len(val_texts), n_subset, replace=False))
+            val_texts = [val_texts[i] for i in rows]
+            val_labels = [val_labels[i] for i in rows]
+        dataset = Dataset(
+            val_texts, Path(config.network_path), config.max_length, val_labels,
+            dynamic_padding=config.dynamic_padding,
+            cache_dir=token_cache_dir,
+        )
+        self.n_examples = len(dataset)
+        self.loader = make_dataloader(
+            dataset, config.batch_size, num_workers=num_workers
+        )
+        logger.info(
+            f"Validating every {config.eval_every_steps} steps on "
+            f"{self.n_examples} examples"
+        )
+
+    def is_due(self, step: int) -> bool:
+        return step % self.config.eval_every_steps == 0
+
+    @property
+    def should_stop(self) -> bool:
+        patience = self.config.step_patience
+        return patience is not None and self.evals_since_best >= patience
+
+    def validate(
+        self,
+        model: nn.Module,
+        run_validation: Callable[[torch.utils.data.DataLoader], tuple[float, int]],
+        epoch: int,
+        step: int,
+        train_loss: float,
+        elapsed_time: float,
+    ) -> StepMetrics:
+        """Score the subset, save the model if it is the best so far."""
+        total_loss, total_correct = run_validation(self.loader)
+        model.train()
+        valid_loss = total_loss / self.n_examples
+        saved = self.best_loss is None or valid_loss < self.best_loss
+        if saved:
+            self.best_loss = valid_loss
+            self.evals_since_best = 0
+            _save(model.state_dict(), self.bestepoch_path, self.writer)
+        else:
+            self.evals_since_best += 1
+
+        metrics = StepMetrics(
+            epoch=epoch,
+            step=step,
+            train_loss=train_loss,
+            valid_loss=valid_loss,
+            valid_accuracy=total_correct / self.n_examples,
+            elapsed_time=elapsed_time,
+            step_saved=saved,
+        )
+        self.history.append(metrics)
+        if self.results_path is not None:
+            save_step_results(self.results_path, self.history)
+        logger.info(
+            f"Step {step} | Train Loss: {train_loss:.4f} | "
+            f"Val Loss: {valid_loss:.4f} | "
+            f"Val Acc: {metrics.valid_accuracy:.4f}"
+            + (" | Saved best" if saved else "")
+        )
+        return metrics
+
+    def state_dict(self) -> dict:
+        return {
+            "best_loss": self.best_loss,
+            "evals_since_best": self.evals_since_best,
+            "history": [m.model_dump() for m in self.history],
+        }
+
+    def load_state_dict(self, state: dict) -> None:
+        self.best_loss = state["best_loss"]
+        self.evals_since_best = state["evals_since_best"]
+        self.history = [StepMetrics(**m) for m in state["history"]]
+
+
 def train(
     model: ClinicalBertClassifier,
     train_df: pd.DataFrame,
@@ -299,11 +683,35 @@ def train(
     bestepoch_path: Path,
     checkpoint_path: Path,
     resume_from: dict | None = None,
+    token_cache_dir: Path | None = TOKEN_CACHE_DIR,
+    runtime: RuntimeSettings | None = None,
+    step_results_path: Path | None = None,
+    checkpoint_writer: CheckpointWriter | None = None,
 ) -> list[EpochMetrics]:
     """Train the model with early stopping and per-epoch checkpointing.
 
-    If resume_from is provided, training continues from the checkpoint state.
+    If resume_from is provided, training continues from the checkpoint state;
+    for a mid-epoch checkpoint, from the next batch of that epoch, with the
+    same batch order and RNG state as an uninterrupted run.
+    Tokenized train/val texts are cached in token_cache_dir (None to disable).
+    With `config.micro_batch_size`, each optimizer step accumulates the
+    gradients of batch_size / micro_batch_size micro-batches; the last
+    step of an epoch takes whatever is left, so every checkpoint is written
+    with no gradients pending.
+    `runtime` sets the data loader workers, bf16 autocast and the mid-epoch
+    checkpoint interval; threads are configured separately by
+    `configure_threads`. With a `checkpoint_writer`, best-model and
+    checkpoint files are written in the background; the caller must close
+    it (or leave its `with` block) before reading them.
+
+    With `config.eval_every_steps`, a `StepValidator` also validates during
+    epochs, writing its metrics to `step_results_path`. It then decides
+    which model is saved as best and can stop training mid-epoch; the
+    epoch-level validation is still run and reported.
     """
+    if runtime is None:
+        runtime = RuntimeSettings()
+
     # Prepare datasets
     train_texts = train_df["string"].tolist()
     train_labels = [LABELS[c] for c in train_df["class"]]
@@ -312,17 +720,30 @@ def train(
 
     tokenizer_path = Path(config.network_path)
     train_dataset = Dataset(
-        train_texts, tokenizer_path, config.max_length, train_labels
+        train_texts, tokenizer_path, config.max_length, train_labels,
+        dynamic_padding=config.dynamic_padding,
+        cache_dir=token_cache_dir,
     )
     val_dataset = Dataset(
-        val_texts, tokenizer_path, config.max_length, val_labels
+        val_texts, tokenizer_path, config.max_length, val_labels,
+        dynamic_padding=config.dynamic_padding,
+        cache_dir=token_cache_dir,
     )
 
-    train_loader = torch.utils.data.DataLoader(
-        train_dataset, batch_size=config.batch_size, shuffle=True
+    micro_batch_size = config.micro_batch_size or config.batch_size
+    accumulation_steps = config.batch_size // micro_batch_size
+    if accumulation_steps > 1:
+        logger.info(
+            f"Accumulating {accumulation_steps} micro-batches of "
+            f"{micro_batch_size} per step (effective batch {config.batch_size})"
+        )
+    # Seeded per epoch, so a mid-epoch checkpoint can replay the batch order
+    train_loader = make_dataloader(
+        train_dataset, micro_batch_size, shuffle=True,
+        num_workers=runtime.num_workers, seed=config.np_random_seed,
     )
-    val_loader = torch.utils.data.DataLoader(
-        val_dataset, batch_size=config.batch_size
+    val_loader = make_dataloader(
+        val_dataset, config.batch_size, num_workers=runtime.num_workers
     )
 
     # Device setup
@@ -330,19 +751,47 @@ def train(
     device = torch.device("cuda" if use_cuda else "cpu")
     logger.info(f"Using device: {device}")
 
+    use_bf16 = runtime.bf16 and bf16_supported(device)
+    if runtime.bf16 and not use_bf16:
+        logger.warning(f"bfloat16 is not supported on {device}; training in fp32")
+    elif use_bf16:
+        logger.info("Running forward/backward under bfloat16 autocast")
+
+    def autocast():
+        if not use_bf16:
+            return nullcontext()
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
     criterion = nn.CrossEntropyLoss()
+    # Summed over micro-batches, then averaged by `_apply_accumulated`
+    train_criterion = nn.CrossEntropyLoss(reduction="sum")
     optimizer = Adam(model.parameters(), lr=config.learning_rate)
 
     if use_cuda:
         model = model.cuda()
         criterion = criterion.cuda()
+        train_criterion = train_criterion.cuda()
+
+    step_validator = None
+    if config.eval_every_steps is not None:
+        step_validator = StepValidator(
+            val_texts, val_labels, config, bestepoch_path, step_results_path,
+            token_cache_dir=token_cache_dir, num_workers=runtime.num_workers,
+            writer=checkpoint_writer,
+        )
+
+    def run_step_validation(loader):
+        # Per-example losses, unlike the legacy per-batch epoch loss
+        return _validate(model, loader, train_criterion, device, autocast)
 
     # Resume state or start fresh
     start_epoch = 0
     best_val_loss: float | None = None
     epochs_since_best = 0
     metrics_history: list[EpochMetrics] = []
+    global_step = 0
 
+    progress: EpochProgress | None = None
     if resume_from is not None:
         optimizer.load_state_dict(resume_from["optimizer_state_dict"])
         start_epoch = resume_from["epoch"] + 1
@@ -351,74 +800,163 @@ def train(
         metrics_history = [
             EpochMetrics(**m) for m in resume_from["metrics_history"]
         ]
+        # Absent from checkpoints written before step-level validation and
+        # mid-epoch checkpoints
+        global_step = resume_from.get("global_step", 0)
+        if step_validator is not None and resume_from.get("step_validation"):
+            step_validator.load_state_dict(resume_from["step_validation"])
+        if resume_from.get("epoch_progress") is not None:
+            progress = EpochProgress(**resume_from["epoch_progress"])
+            start_epoch = progress.epoch
+        if resume_from.get("rng_state") is not None:
+            _set_rng_state(resume_from["rng_state"])
         logger.info(
-            f"Resuming from epoch {start_epoch + 1} "
-            f"(best_val_loss={best_val_loss:.6f})"
+            f"Resuming from epoch {start_epoch + 1}"
+            + (f", batch {progress.batches_done + 1}" if progress else "")
+            + f" (best_val_loss={best_val_loss})"
+        )
+
+    def save(epoch_progress: EpochProgress | None = None) -> None:
+        completed_epoch = epoch_num if epoch_progress is None else epoch_num - 1
+        save_checkpoint(
+            checkpoint_path,
+            model,
+            optimizer,
+            completed_epoch,
+            best_val_loss,
+            epochs_since_best,
+            metrics_history,
+            config,
+            global_step=global_step,
+            step_validation=None if step_validator is None
+            else step_validator.state_dict(),
+            epoch_progress=None if epoch_progress is None
+            else epoch_progress.model_dump(),
+            writer=checkpoint_writer,
         )
 
     # Training loop
     skip_training = config.epochs == 0
     effective_epochs = max(config.epochs, 1)
+    run_start = time.time()
+    last_checkpoint = time.monotonic()
+    stop_early = False
 
     for epoch_num in range(start_epoch, effective_epochs):
-        epoch_start = time.time()
-        total_loss_train = 0.0
-        total_acc_train = 0
-        epochs_since_best += 1
-        saved_model = False
+        if progress is None or progress.epoch != epoch_num:
+            progress = EpochProgress(epoch=epoch_num)
+            epochs_since_best += 1
+        # Resumed epochs continue the clocks of the interrupted run
+        epoch_start = time.time() - progress.train_seconds
+        train_start = time.time() - progress.train_seconds
+        train_loader.batch_sampler.set_epoch(epoch_num, progress.batches_done)
 
         # Training pass
         model.train()
-        for train_input, train_label in tqdm(
-            train_loader, desc=f"Epoch {epoch_num + 1}/{effective_epochs}"
+        model.zero_grad()
+        # Samples (and their summed loss) accumulated since the last step
+        step_samples = 0
+        step_loss = 0.0
+        for i, (train_input, train_label) in enumerate(
+            tqdm(train_loader, desc=f"Epoch {epoch_num + 1}/{effective_epochs}"),
+            start=progress.batches_done,
         ):
             if skip_training:
                 break
 
             train_label = train_label.to(device)
-            mask = train_input["attention_mask"].to(device)
+            mask = train_input["attention_mask"].squeeze(1).to(device)
             input_id = train_input["input_ids"].squeeze(1).to(device)
 
-            output = model(input_id, mask)
-            batch_loss = criterion(output, train_label)
-            total_loss_train += batch_loss.item()
-            total_acc_train += (output.argmax(dim=1) == train_label).sum().item()
-
-            model.zero_grad()
+            with autocast():
+                output = model(input_id, mask)
+                batch_loss = train_criterion(output, train_label)
             batch_loss.backward()
-            optimizer.step()
-
-        # Validation pass
-        model.eval()
-        total_loss_val = 0.0
-        total_acc_val = 0
-        with torch.no_grad():
-            for val_input, val_label in val_loader:
-                val_label = val_label.to(device)
-                mask = val_input["attention_mask"].to(device)
-                input_id = val_input["input_ids"].squeeze(1).to(device)
+            step_loss += batch_loss.item()
+            step_samples += len(train_label)
+            progress.n_trained += len(train_label)
+            progress.total_acc_train += (
+                (output.argmax(dim=1) == train_label).sum().item()
+            )
 
-                output = model(input_id, mask)
-                batch_loss = criterion(output, val_label)
-                total_loss_val += batch_loss.item()
-                total_acc_val += (output.argmax(dim=1) == val_label).sum().item()
+            if (i + 1) % accumulation_steps == 0:
+                # Mean loss per step, as when each step was one batch
+                progress.total_loss_train += step_loss / step_samples
+                progress.interval_loss += step_loss / step_samples
+                progress.interval_steps += 1
+                _apply_accumulated(model, optimizer, step_samples)
+                step_samples = 0
+                step_loss = 0.0
+                global_step += 1
+                progress.batches_done = i + 1
+
+                if step_validator is not None and step_validator.is_due(
+                    global_step
+                ):
+                    step_metrics = step_validator.validate(
+                        model, run_step_validation, epoch_num + 1, global_step,
+                        progress.interval_loss / progress.interval_steps,
+                        time.time() - run_start,
+                    )
+                    progress.saved_model |= step_metrics.step_saved
+                    progress.interval_loss = 0.0
+                    progress.interval_steps = 0
+                    if step_validator.should_stop:
+                        stop_early = True
+                        break
+
+                if runtime.checkpoint_due(global_step, last_checkpoint):
+                    progress.train_seconds = time.time() - train_start
+                    save(progress)
+                    last_checkpoint = time.monotonic()
+        if step_samples > 0:
+            progress.total_loss_train += step_loss / step_samples
+            progress.interval_loss += step_loss / step_samples
+            progress.interval_steps += 1
+            _apply_accumulated(model, optimizer, step_samples)
+            global_step += 1
+        if step_validator is not None and progress.interval_steps > 0:
+            # Also validate the steps since the last step-level validation
+            step_metrics = step_validator.validate(
+                model, run_step_validation, epoch_num + 1, global_step,
+                progress.interval_loss / progress.interval_steps,
+                time.time() - run_start,
+            )
+            progress.saved_model |= step_metrics.step_saved
+            stop_early |= step_validator.should_stop
+        train_time = time.time() - train_start
+        saved_model = progress.saved_model
+        total_loss_train = progress.total_loss_train
+        total_acc_train = progress.total_acc_train
+        n_trained = progress.n_trained
 
-        # Check for best epoch
+        # Validation pass
+        total_loss_val, total_acc_val = _validate(
+            model, val_loader, criterion, device, autocast
+        )
         val_loss_norm = total_loss_val / len(val_df)
-        if best_val_loss is None or val_loss_norm < best_val_loss:
+
+        # Check for best epoch; step-level validation already picked it
+        if step_validator is not None:
+            best_val_loss = step_validator.best_loss
+        elif best_val_loss is None or val_loss_norm < best_val_loss:
             best_val_loss = val_loss_norm
-            _atomic_torch_save(model.state_dict(), bestepoch_path)
+            _save(model.state_dict(), bestepoch_path, checkpoint_writer)
             saved_model = True
+        if saved_model:
             epochs_since_best = 0
 
+        # A run stopped mid-epoch reports over the examples it trained on
+        n_trained = n_trained or len(train_df)
         epoch_metrics = EpochMetrics(
             epoch=epoch_num + 1,
-            train_loss=total_loss_train / len(train_df),
-            train_accuracy=total_acc_train / len(train_df),
+            train_loss=total_loss_train / n_trained,
+            train_accuracy=total_acc_train / n_trained,
             valid_loss=val_loss_norm,
             valid_accuracy=total_acc_val / len(val_df),
             epoch_time=time.time() - epoch_start,
             epoch_saved=saved_model,
+            samples_per_sec=None if skip_training else n_trained / train_time,
         )
         metrics_history.append(epoch_metrics)
 
@@ -428,22 +966,24 @@ def train(
             f"Train Acc: {epoch_metrics.train_accuracy:.4f} | "
             f"Val Loss: {epoch_metrics.valid_loss:.4f} | "
             f"Val Acc: {epoch_metrics.valid_accuracy:.4f}"
+            + (
+                f" | {epoch_metrics.samples_per_sec:.1f} samples/s"
+                if epoch_metrics.samples_per_sec is not None else ""
+            )
             + (" | Saved best" if saved_model else "")
         )
 
         # Save checkpoint after every completed epoch
-        save_checkpoint(
-            checkpoint_path,
-            model,
-            optimizer,
-            epoch_num,
-            best_val_loss,
-            epochs_since_best,
-            metrics_history,
-            config,
-        )
+        save()
+        last_checkpoint = time.monotonic()
 
         # Early stopping
+        if stop_early:
+            logger.info(
+                f"Early stopping at step {global_step} "
+                f"({config.step_patience} validations without improvement)"
+            )
+            break
         logger.info(
             f"Epochs since best: {epochs_since_best} "
             f"(stopping at {EARLY_STOPPING_PATIENCE})"
@@ -499,6 +1039,14 @@ def main() -> None:
         default=-1,
         help="Batch size (default: auto-estimated)",
     )
+    parser.add_argument(
+        "--micro-batch-size",
+        type=int,
+        default=None,
+        help="Samples per forward/backward pass; gradients are accumulated "
+        "until --batch-size samples make one optimizer step (default: "
+        "--batch-size, no accumulation).",
+    )
     parser.add_argument(
         "--epochs",
         type=int,
@@ -549,6 +1097,79 @@ def main() -> None:
         default="",
         help="Label for annotation flag filtering (included in model filename).",
     )
+    parser.add_argument(
+        "--dynamic-padding",
+        action="store_true",
+        help="Batch examples of similar token length and pad each batch only "
+        "to its longest member instead of to --max-length.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Re-tokenize instead of using the token cache in {TOKEN_CACHE_DIR}.",
+    )
+    parser.add_argument(
+        "--eval-every-steps",
+        type=int,
+        default=None,
+        help="Also validate every N optimizer steps; the best model and "
+        "early stopping then follow these validations (default: per epoch "
+        "only).",
+    )
+    parser.add_argument(
+        "--eval-subset",
+        type=int,
+        default=None,
+        help="Validate every --eval-every-steps on this many validation "
+        "examples, drawn once with the run's seed (default: all).",
+    )
+    parser.add_argument(
+        "--step-patience",
+        type=int,
+        default=None,
+        help="Stop after this many step-level validations without "
+        "improvement (default: only epoch-level early stopping).",
+    )
+    parser.add_argument(
+        "--checkpoint-every-steps",
+        type=int,
+        default=None,
+        help="Also checkpoint every N optimizer steps within an epoch "
+        "(default: only at the end of each epoch).",
+    )
+    parser.add_argument(
+        "--checkpoint-every-minutes",
+        type=float,
+        default=None,
+        help="Also checkpoint within an epoch once this many minutes have "
+        "passed since the last checkpoint.",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=0,
+        help="Data loader worker processes (default: 0, load in the main "
+        "process).",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="PyTorch intra-op threads (default: PyTorch's choice). On a "
+        "CPU-only box, leave a core per loader worker.",
+    )
+    parser.add_argument(
+        "--interop-threads",
+        type=int,
+        default=None,
+        help="PyTorch inter-op threads (default: PyTorch's choice).",
+    )
+    parser.add_argument(
+        "--bf16",
+        action="store_true",
+        help="Run forward/backward under bfloat16 autocast where the "
+        "hardware supports it (falls back to fp32 otherwise).",
+    )
 
     args = parser.parse_args()
     logging.basicConfig(
@@ -556,6 +1177,7 @@ def main() -> None:
         format="%(asctime)s %(name)s %(levelname)s: %(message)s",
     )
 
+    configure_threads(_runtime_settings(args))
     if args.resume:
         _run_resume(args)
     else:
@@ -564,8 +1186,28 @@ def main() -> None:
         _run_fresh(args)
 
 
+def _runtime_settings(args: argparse.Namespace) -> RuntimeSettings:
+    return RuntimeSettings(
+        num_workers=args.num_workers,
+        intra_op_threads=args.threads,
+        inter_op_threads=args.interop_threads,
+        bf16=args.bf16,
+        checkpoint_every_steps=args.checkpoint_every_steps,
+        checkpoint_every_minutes=args.checkpoint_every_minutes,
+    )
+
+
+def _step_results_path(
+    base_dir: Path, config: TrainingConfig, filename_params: str
+) -> Path:
+    return (
+        base_dir / "results" / f"step-results-{config.network_code}_{filename_params}.csv"
+    )
+
+
 def _run_resume(args: argparse.Namespace) -> None:
     """Resume training from a checkpoint."""
+    token_cache_dir = None if args.no_cache else TOKEN_CACHE_DIR
     logger.info(f"Loading checkpoint from {args.resume}")
     checkpoint = load_checkpoint(args.resume)
     config = TrainingConfig(**checkpoint["training_config"])
@@ -603,18 +1245,28 @@ def _run_resume(args: argparse.Namespace) -> None:
     )
 
     # Train
-    metrics = train(
-        model, df_train, df_val, config,
-        bestepoch_path, checkpoint_path,
-        resume_from=checkpoint,
-    )
+    # Leaving the block waits for pending writes, so bestepoch is on disk
+    with CheckpointWriter() as writer:
+        metrics = train(
+            model, df_train, df_val, config,
+            bestepoch_path, checkpoint_path,
+            resume_from=checkpoint,
+            token_cache_dir=token_cache_dir,
+            runtime=_runtime_settings(args),
+            step_results_path=_step_results_path(base_dir, config, filename_params),
+            checkpoint_writer=writer,
+        )
 
     # Save final model and results
-    _save_final(model, config, metrics, base_dir, filename_params, df_test, network_path)
+    _save_final(
+        model, config, metrics, base_dir, filename_params, df_test, network_path,
+        token_cache_dir=token_cache_dir,
+    )
 
 
 def _run_fresh(args: argparse.Namespace) -> None:
     """Start a fresh training run."""
+    token_cache_dir = None if args.no_cache else TOKEN_CACHE_DIR
     # Parse reference file metadata
     refset, refsection, refnwords = _parse_ref_metadata(args.ref)
     logger.info(
@@ -645,11 +1297,25 @@ def _run_fresh(args: argparse.Namespace) -> None:
         logger.info(f"Auto batch_size={batch_size} from max_length={max_length}")
     else:
         batch_size = args.batch_size
+
+    # Only micro-batches are held in memory at once
+    micro_batch_size = args.micro_batch_size
+    if micro_batch_size == batch_size:
+        micro_batch_size = None
+    if micro_batch_size is not None and (
+        micro_batch_size <= 0 or batch_size % micro_batch_size != 0
+    ):
+        raise ValueError(
+            f"--micro-batch-size ({micro_batch_size}) must divide "
+            f"--batch-size ({batch_size})"
+        )
+    if args.batch_size != -1 or micro_batch_size is not None:
+        forward_size = micro_batch_size or batch_size
         est = batch_size_estimate(max_length)
-        if batch_size > est:
+        if forward_size > est:
             logger.warning(
-                f"Batch size ({batch_size}) > estimated safe size ({est}): "
-                "may run into memory issues"
+                f"Batch size ({forward_size}) > estimated safe size ({est}): "
+                "may run into memory issues; see --micro-batch-size"
             )
 
     # Build config
@@ -667,8 +1333,13 @@ def _run_fresh(args: argparse.Namespace) -> None:
         learning_rate=args.learning_rate,
         max_length=max_length,
         batch_size=batch_size,
+        micro_batch_size=micro_batch_size,
         pretrained_state=str(pretrained_state) if pretrained_state else None,
         flag_label=args.flag_label,
+        dynamic_padding=args.dynamic_padding,
+        eval_every_steps=args.eval_every_steps,
+        eval_subset_size=args.eval_subset,
+        step_patience=args.step_patience,
     )
 
     # Build file paths
@@ -736,13 +1407,22 @@ def _run_fresh(args: argparse.Namespace) -> None:
     torch.manual_seed(DEFAULT_RANDOM_SEED)
 
     # Train
-    metrics = train(
-        model, df_train, df_val, config,
-        bestepoch_path, checkpoint_path,
-    )
+    # Leaving the block waits for pending writes, so bestepoch is on disk
+    with CheckpointWriter() as writer:
+        metrics = train(
+            model, df_train, df_val, config,
+            bestepoch_path, checkpoint_path,
+            token_cache_dir=token_cache_dir,
+            runtime=_runtime_settings(args),
+            step_results_path=_step_results_path(base_dir, config, filename_params),
+            checkpoint_writer=writer,
+        )
 
     # Save final model and results
-    _save_final(model, config, metrics, base_dir, filename_params, df_test, network_path)
+    _save_final(
+        model, config, metrics, base_dir, filename_params, df_test, network_path,
+        token_cache_dir=token_cache_dir,
+    )
 
 
 def _save_final(
@@ -753,13 +1433,14 @@ def _save_final(
     filename_params: str,
     df_test: pd.DataFrame,
     network_path: Path,
+    token_cache_dir: Path | None = TOKEN_CACHE_DIR,
 ) -> None:
     """Save the final model, epoch results, and run test evaluation."""
     # Save final model
     final_model_path = (
         base_dir / "models" / f"final-bydrug-{config.network_code}_{filename_params}.pth"
     )
-    torch.save(model.state_dict(), final_model_path)
+    atomic_torch_save(model.state_dict(), final_model_path)
     logger.info(f"Final model saved to {final_model_path}")
 
     # Save epoch results CSV
@@ -788,6 +1469,8 @@ def _save_final(
             test_texts,
             max_length=config.max_length,
             batch_size=config.batch_size * 2,
+            dynamic_padding=config.dynamic_padding,
+            cache_dir=token_cache_dir,
         )
 
     logger.info("Training complete.")
@@ -0,0 +1,134 @@
+"""
+vocab_cache.py
+
+Persistent on-disk cache for compiled vocabulary structures (Aho-Corasick
+automata and their lookup maps), keyed by a content hash of the files they
+were built from. A cache hit is a single unpickle, so repeated experiment
+runs, Snakemake jobs and annotator restarts skip the automaton build.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import BinaryIO, TypeVar
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path("_onsides/cache")
+
+# Bump when the layout of any cached object changes, to orphan old entries.
+CACHE_VERSION = 1
+
+_DIGESTS_FILE = "file_digests.json"
+
+T = TypeVar("T")
+
+
+def content_key(paths: Iterable[Path | None], cache_dir: Path = CACHE_DIR) -> str:
+    """SHA-256 over the contents of each file, in order.
+
+    Missing files (or None) contribute a fixed marker, so adding or removing
+    an optional input changes the key. Per-file digests are remembered in
+    ``cache_dir`` against (size, mtime), so multi-gigabyte inputs such as the
+    OMOP tables are only read in full when they actually change.
+    """
+    key = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for path in paths:
+        if path is None or not Path(path).exists():
+            key.update(b"<missing>")
+        else:
+            key.update(_file_digest(Path(path), cache_dir).encode())
+    return key.hexdigest()
+
+
+def load_or_build(
+    name: str,
+    key: str,
+    build: Callable[[], T],
+    cache_dir: Path | None = CACHE_DIR,
+) -> T:
+    """Return the object cached under (name, key), building it on a miss.
+
+    Args:
+        name: Short label for the cached object, used in the filename.
+        key: Content key from ``content_key``.
+        build: Zero-argument function that builds the object on a miss.
+        cache_dir: Cache directory, or None to always build.
+    """
+    if cache_dir is None:
+        return build()
+
+    path = cache_dir / f"{name}-{key[:20]}.pkl"
+    if path.exists():
+        try:
+            with open(path, "rb") as f:
+                obj = pickle.load(f)
+            logger.info(f"Loaded {name} from cache {path}")
+            return obj
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache file {path}: {e}")
+
+    obj = build()
+    atomic_write(
+        path, lambda f: pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    )
+    logger.info(f"Cached {name} at {path}")
+    return obj
+
+
+def _file_digest(path: Path, cache_dir: Path) -> str:
+    stat = path.stat()
+    resolved = str(path.resolve())
+    digests_path = cache_dir / _DIGESTS_FILE
+
+    digests: dict[str, dict] = {}
+    if digests_path.exists():
+        try:
+            digests = json.loads(digests_path.read_text())
+        except ValueError:
+            digests = {}
+
+    entry = digests.get(resolved)
+    if (
+        entry is not None
+        and entry["size"] == stat.st_size
+        and entry["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return entry["sha256"]
+
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+    digests[resolved] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+    }
+    data = json.dumps(digests, indent=2).encode()
+    atomic_write(digests_path, lambda f: f.write(data))
+    return digest
+
+
+def atomic_write(path: Path, write: Callable[[BinaryIO], object]) -> None:
+    """Create or replace `path` atomically via temp file + rename.
+
+    `write` is called with the temp file opened for binary writing; readers
+    see either the old file or the complete new one. Parent directories are
+    created as needed.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fd, tmp_path_str = tempfile.mkstemp(
+        dir=path.parent, suffix=".tmp", prefix=path.stem
+    )
+    tmp_path = Path(tmp_path_str)
+    try:
+        with os.fdopen(tmp_fd, "wb") as f:
+            write(f)
+        tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
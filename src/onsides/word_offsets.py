@@ -0,0 +1,46 @@
+import re
+from bisect import bisect_left, bisect_right
+
+# Same definition of a word as `str.split()`: a maximal run of characters for
+# which `str.isspace()` is false (`\s` matches exactly those characters).
+_WORD_PATTERN = re.compile(r"\S+")
+
+
+class WordOffsets:
+    """
+    Word boundaries of a text, computed once so that context windows around
+    many matches can be sliced out without re-tokenizing the text each time.
+
+    `words_before(pos, n)` returns exactly `text[:pos].split()[-n:]` and
+    `words_after(pos, n)` returns exactly `text[pos:].split()[:n]`, including
+    the partial word produced when `pos` falls inside a word. Each call costs
+    a binary search plus O(n), instead of a split of the whole prefix/suffix.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.words = text.split()
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        for word in _WORD_PATTERN.finditer(text):
+            self.starts.append(word.start())
+            self.ends.append(word.end())
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def words_before(self, pos: int, n: int) -> list[str]:
+        """The last `n` (n >= 1) words of `text[:pos]`."""
+        stop = bisect_left(self.starts, pos)
+        words = self.words[max(stop - n, 0) : stop]
+        if words and self.ends[stop - 1] > pos:
+            words[-1] = self.text[self.starts[stop - 1] : pos]
+        return words
+
+    def words_after(self, pos: int, n: int) -> list[str]:
+        """The first `n` (n >= 0) words of `text[pos:]`."""
+        first = bisect_right(self.ends, pos)
+        words = self.words[first : first + n]
+        if words and self.starts[first] < pos:
+            words[0] = self.text[pos : self.ends[first]]
+        return words